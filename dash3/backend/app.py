@@ -1,9 +1,30 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, g
 from flask_cors import CORS
 from datetime import datetime, timedelta
-import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
-from config import DB_CONFIG
+from db import get_connection, release_connection, get_pool_stats, table_exists_cached
+from rollups import oee_stats_query, rollup_lag
+from downsample import parse_bucket, lttb_indices
+from state_intervals import (PRIMARY_STATE_SQL, STATUS_SUMMARY_SQL, TIMELINE_SQL,
+                             FLEET_STATUS_SUMMARY_SQL, INTERVALS_TABLE)
+from latest import LATEST_TABLE, LatestCache, latest_table_exists
+from stream import Broadcaster, LatestPoller
+from notify import ChangeListener
+from response_cache import ResponseCache
+from singleflight import SingleFlight, CoalesceTimeout
+from columnar import to_columnar, dumps as columnar_dumps
+from export import EXPORT_FORMATS, export_available, export_chunks, check_compression
+from archive import first_archived_time, machine_data_source
+from config import (LATEST_CACHE_CONFIG, STREAM_CONFIG, RESPONSE_CACHE_CONFIG, COALESCE_CONFIG,
+                    RAW_STREAM_CONFIG, PAGINATION_CONFIG, EXPORT_CONFIG)
+import numpy as np
+import base64
+import binascii
+import functools
+import json
+import math
+import time
 import traceback
 
 app = Flask(__name__)
@@ -13,33 +34,248 @@ CORS(app)
 # DATABASE CONNECTION
 # ============================================================
 def get_db_connection():
-    """Get database connection"""
+    """Check out a pooled database connection for the current request"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        conn = get_connection()
     except Exception as e:
         print(f"Database connection error: {e}")
         raise
+    g.setdefault('db_connections', []).append(conn)
+    return conn
+
+def release_db_connection(conn):
+    """Return a connection obtained with get_db_connection() to the pool"""
+    connections = g.get('db_connections', [])
+    if conn in connections:
+        connections.remove(conn)
+        release_connection(conn)
+
+@app.teardown_appcontext
+def release_leaked_connections(exc):
+    """Return connections left checked out by a failed request"""
+    for conn in g.pop('db_connections', []):
+        release_connection(conn)
 
 # ============================================================
 # UTILITY FUNCTIONS
 # ============================================================
+RANGE_DURATIONS = {
+    '1h': timedelta(hours=1),
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '1y': timedelta(days=365)
+}
+
+def normalize_range(time_range):
+    """Known range name, unknown values fall back to 24h"""
+    return time_range if time_range in RANGE_DURATIONS else '24h'
+
+def window_end(time_range):
+    """Now, snapped down to the range's alignment so concurrent requests share a window"""
+    align = RESPONSE_CACHE_CONFIG['ranges'][normalize_range(time_range)]['align']
+    return datetime.fromtimestamp(math.floor(time.time() / align) * align)
+
 def parse_time_range(time_range):
     """Convert time range string to datetime"""
-    now = datetime.now()
-    
-    if time_range == '1h':
-        return now - timedelta(hours=1)
-    elif time_range == '24h':
-        return now - timedelta(hours=24)
-    elif time_range == '7d':
-        return now - timedelta(days=7)
-    elif time_range == '30d':
-        return now - timedelta(days=30)
-    elif time_range == '1y':
-        return now - timedelta(days=365)
-    else:
-        return now - timedelta(hours=24)
+    time_range = normalize_range(time_range)
+    return window_end(time_range) - RANGE_DURATIONS[time_range]
+
+# ============================================================
+# KEYSET PAGINATION AND DELTA POLLING
+# ============================================================
+# Per-client arguments: responses depending on them are not cached
+DELTA_ARGS = ('since', 'cursor')
+
+def encode_cursor(machine_id, last_time):
+    """Opaque page cursor for the rows of ``machine_id`` after ``last_time``"""
+    raw = json.dumps([machine_id, last_time.isoformat()], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, machine_id):
+    """Time encoded in a cursor from encode_cursor(); ValueError if invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_machine, cursor_time = json.loads(raw)
+        cursor_time = datetime.fromisoformat(cursor_time)
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+    if cursor_machine != machine_id:
+        raise ValueError('Cursor belongs to another machine')
+    return cursor_time
+
+def keyset_args(machine_id):
+    """(after, limit) from ?since=, ?cursor= and ?limit=; ValueError if invalid.
+
+    ``since`` is an ISO 8601 watermark from a previous response, ``cursor``
+    the next_cursor of a previous page (it wins over since, being later).
+    Both mean "rows with time > after"; None when neither is given.
+    """
+    after = None
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            after = datetime.fromisoformat(since)
+        except ValueError as e:
+            raise ValueError(f"Invalid since '{since}', expected an ISO 8601 timestamp") from e
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        after = decode_cursor(cursor, machine_id)
+
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError as e:
+            raise ValueError('limit must be an integer') from e
+        if not 1 <= limit <= PAGINATION_CONFIG['max_limit']:
+            raise ValueError(f"limit must be between 1 and {PAGINATION_CONFIG['max_limit']}")
+    return after, limit
+
+def _scan_start(start_time, after):
+    """Lower bound of ``time >= start_time AND time > after``, for machine_data_source()"""
+    if after is None:
+        return start_time
+    # Naive values are local time, as from parse_time_range()
+    return max(start_time.astimezone(), after.astimezone())
+
+def fetch_keyset_page(cur, columns, machine_id, start_time, after=None, limit=None):
+    """Rows of one machine from ``start_time`` on (and after ``after``), oldest first.
+
+    Served by idx_machine_time. Returns (column names, tuple rows, has_more);
+    ``columns`` must include ``time`` (or be ['*']). Timestamps are not
+    unique per machine, so a full page is extended with every row sharing
+    its last timestamp; resuming with ``time > last`` then skips nothing.
+    Pages can therefore run slightly over ``limit``. Archived days in the
+    window are read back through machine_data_source().
+    """
+    source = machine_data_source(cur, _scan_start(start_time, after),
+                                 None if columns == ['*'] else columns)
+    query = f"""
+    SELECT {', '.join(columns)}
+    FROM {source}
+    WHERE machine_id = %s
+    AND time >= %s
+    """
+    params = [machine_id, start_time]
+    if after is not None:
+        query += "AND time > %s\n"
+        params.append(after)
+    query += "ORDER BY time ASC"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    cur.execute(query + ";", params)
+    names = [column.name for column in cur.description]
+    rows = cur.fetchall()
+
+    if limit is None or len(rows) < limit:
+        return names, rows, False
+    time_index = names.index('time')
+    last_time = rows[-1][time_index]
+    cur.execute(f"""
+    SELECT {', '.join(columns)}
+    FROM {source}
+    WHERE machine_id = %s
+    AND time = %s;
+    """, (machine_id, last_time))
+    rows = [row for row in rows if row[time_index] != last_time] + cur.fetchall()
+    return names, rows, True
+
+def rows_response(payload, names, rows, fmt=None):
+    """``payload`` plus ``rows`` as a JSON response.
+
+    By default the rows are sent as one object per row. ``fmt='columnar'``
+    sends one array per column instead, with categorical columns
+    dictionary-encoded (see columnar.to_columnar) and ISO 8601 timestamps.
+    """
+    if fmt == 'columnar':
+        payload.update(to_columnar(names, rows), format='columnar')
+        return Response(columnar_dumps(payload), mimetype='application/json')
+    payload['data'] = [dict(zip(names, row)) for row in rows]
+    return jsonify(payload)
+
+def keyset_fields(machine_id, names, rows, has_more, after):
+    """next_cursor and watermark for a paged or delta response"""
+    last_time = rows[-1][names.index('time')] if rows else after
+    return {
+        'next_cursor': encode_cursor(machine_id, last_time) if has_more else None,
+        'watermark': last_time.isoformat() if last_time else None
+    }
+
+# ============================================================
+# RESPONSE CACHE AND COALESCING
+# ============================================================
+response_cache = ResponseCache(RESPONSE_CACHE_CONFIG['ranges'],
+                               max_entries=RESPONSE_CACHE_CONFIG['max_entries'])
+inflight = SingleFlight()
+
+def _request_key(endpoint, machine_id):
+    """(endpoint, machine_id, range, window end, query args, body) of the current request"""
+    time_range = normalize_range(request.args.get('range', '24h'))
+    return (endpoint, machine_id, time_range, window_end(time_range),
+            tuple(sorted(request.args.items())), request.get_data())
+
+def cached_response(endpoint):
+    """Serve a per-machine analytics view from response_cache.
+
+    The key is (endpoint, machine_id, range, window end, query args, body),
+    so requests inside the same aligned window share one result; fleet-wide
+    views are stored with machine_id None. Only
+    successful responses are stored; X-Cache tells HIT from MISS. Delta and
+    page requests (DELTA_ARGS) are specific to one client and bypass it.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            if any(arg in request.args for arg in DELTA_ARGS):
+                return view(**view_args)
+            key = _request_key(endpoint, view_args.get('machine_id'))
+            body = response_cache.get(key)
+            if body is not None:
+                return Response(body, mimetype='application/json', headers={'X-Cache': 'HIT'})
+            response = app.make_response(view(**view_args))
+            if response.status_code == 200:
+                response_cache.put(key, response.get_data())
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+def coalesced(endpoint):
+    """Let concurrent identical requests share one execution of the view.
+
+    Uses the same key as cached_response() but keeps nothing afterwards.
+    Followers get the leader's body and status (errors included) and a 504
+    if it takes longer than COALESCE_CONFIG['timeout'].
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            def execute():
+                response = app.make_response(view(**view_args))
+                return response.get_data(), response.status_code, response.mimetype
+
+            try:
+                body, status, mimetype = inflight.do(
+                    _request_key(endpoint, view_args.get('machine_id')), execute,
+                    COALESCE_CONFIG['timeout']
+                )
+            except CoalesceTimeout as e:
+                return jsonify({'success': False, 'error': str(e)}), 504
+            return Response(body, status=status, mimetype=mimetype)
+        return wrapper
+    return decorator
+
+@app.route('/api/metrics/cache', methods=['GET'])
+def cache_metrics():
+    """Response cache counters (hits, misses, evictions) and request coalescing"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.stats(),
+        'coalescing': inflight.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
 
 # ============================================================
 # HEALTH CHECK
@@ -51,13 +287,17 @@ def health_check():
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("SELECT 1")
+        lag = rollup_lag(cur)
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
-            'database': 'connected'
+            'database': 'connected',
+            'pool': get_pool_stats(),
+            # Seconds the OEE rollups trail now; grows while refreshes fail
+            'rollup_lag_seconds': None if lag is None else round(lag, 1)
         })
     except Exception as e:
         return jsonify({
@@ -66,58 +306,61 @@ def health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/metrics/pool', methods=['GET'])
+def pool_metrics():
+    """Connection pool counters: checkouts, wait time, saturation"""
+    return jsonify({
+        'success': True,
+        'pool': get_pool_stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 # ============================================================
 # MACHINES ENDPOINTS
 # ============================================================
-@app.route('/api/machines', methods=['GET'])
-def get_machines():
-    """Get list of all machines with latest data"""
+LATEST_COLUMNS = """
+    machine_id, time, state, program_state, current, drilling, cutting_speed,
+    override_flag, homing, homed, technology_name, technology_index,
+    technology_dataset, material, thickness, gas_type, arc, arc_ignite,
+    drilling_depth, scrap_cut, din_file_name, arc_error, error_code,
+    error_text, error_parameter, error_level
+"""
+
+def _load_latest_rows():
+    """Latest row per machine from machine_latest, or machine_data without it"""
+    conn = get_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-        SELECT DISTINCT ON (machine_id) 
-            machine_id,
-            time,
-            state,
-            program_state,
-            current,
-            drilling,
-            cutting_speed,
-            override_flag,
-            homing,
-            homed,
-            technology_name,
-            technology_index,
-            technology_dataset,
-            material,
-            thickness,
-            gas_type,
-            arc,
-            arc_ignite,
-            drilling_depth,
-            scrap_cut,
-            din_file_name,
-            arc_error,
-            error_code,
-            error_text,
-            error_parameter,
-            error_level
-        FROM machine_data
-        ORDER BY machine_id, time DESC;
-        """
-        
-        cur.execute(query)
-        machines = cur.fetchall()
-        
+        if latest_table_exists(cur):
+            cur.execute(f"SELECT {LATEST_COLUMNS} FROM {LATEST_TABLE} ORDER BY machine_id;")
+        else:
+            cur.execute(f"""
+                SELECT DISTINCT ON (machine_id) {LATEST_COLUMNS}
+                FROM machine_data
+                ORDER BY machine_id, time DESC;
+            """)
+        rows = cur.fetchall()
         cur.close()
-        conn.close()
+        return rows
+    finally:
+        release_connection(conn)
+
+latest_cache = LatestCache(_load_latest_rows, **LATEST_CACHE_CONFIG)
+
+@app.route('/api/machines', methods=['GET'])
+def get_machines():
+    """Get list of all machines with latest data.
+
+    Served from the latest-row snapshot; ``cache_age`` is how old it is.
+    """
+    try:
+        machines = latest_cache.all()
         
         return jsonify({
             'success': True,
             'machines': machines,
             'count': len(machines),
+            'cache_age': latest_cache.age(),
             'timestamp': datetime.now().isoformat()
         })
         
@@ -134,27 +377,13 @@ def get_machines():
 def get_realtime_data(machine_id):
     """Get latest realtime data for a specific machine"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-        SELECT *
-        FROM machine_data
-        WHERE machine_id = %s
-        ORDER BY time DESC
-        LIMIT 1;
-        """
-        
-        cur.execute(query, (machine_id,))
-        data = cur.fetchone()
-        
-        cur.close()
-        conn.close()
+        data = latest_cache.get(machine_id)
         
         if data:
             return jsonify({
                 'success': True,
                 'data': data,
+                'cache_age': latest_cache.age(),
                 'timestamp': datetime.now().isoformat()
             })
         else:
@@ -171,38 +400,243 @@ def get_realtime_data(machine_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/metrics/latest', methods=['GET'])
+def latest_metrics():
+    """Latest-row snapshot counters: hits, reloads, age and data lag"""
+    return jsonify({
+        'success': True,
+        'latest': latest_cache.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+# ============================================================
+# LIVE STREAM (Server-Sent Events)
+# ============================================================
+def _sse_message(event_type, payload):
+    """One SSE frame; payloads are serialized like jsonify responses"""
+    return f"event: {event_type}\ndata: {app.json.dumps(payload)}\n\n"
+
+broadcaster = Broadcaster(_sse_message, max_queue=STREAM_CONFIG['max_queue'])
+latest_poller = LatestPoller(latest_cache, broadcaster, interval=STREAM_CONFIG['poll_interval'])
+
+def _event_stream(machine_id=None):
+    """Stream a snapshot, then sample/state events until the client leaves"""
+    if machine_id is None:
+        snapshot = latest_cache.all()
+    else:
+        row = latest_cache.get(machine_id)
+        snapshot = [row] if row else []
+    subscription = broadcaster.subscribe(machine_id)
+    latest_poller.ensure_started()
+
+    def generate():
+        try:
+            yield _sse_message('snapshot', snapshot)
+            while True:
+                message = subscription.get(timeout=STREAM_CONFIG['heartbeat'])
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield message
+                if subscription.dropped and subscription.events.empty():
+                    return
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# One LISTEN connection per API process feeds every in-process consumer
+change_listener = ChangeListener()
+
+def _refresh_live_views(changes=None):
+    """New rows (or a listener reconnect) outdate the latest-row snapshot"""
+    latest_cache.invalidate()
+    latest_poller.wake()
+
+change_listener.subscribe(_refresh_live_views, _refresh_live_views)
+
+def _invalidate_responses(changes):
+    response_cache.invalidate_machines(machine_id for machine_id, _, _ in changes)
+
+# Missed notifications need no reset: cached responses expire by TTL
+change_listener.subscribe(_invalidate_responses)
+
+@app.before_request
+def start_change_listener():
+    change_listener.ensure_started()
+
+@app.route('/api/stream', methods=['GET'])
+def stream_fleet():
+    """Push new samples and state changes of every machine"""
+    try:
+        return _event_stream()
+    except Exception as e:
+        print(f"Error in stream_fleet: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/machines/<machine_id>/stream', methods=['GET'])
+def stream_machine(machine_id):
+    """Push new samples and state changes of one machine"""
+    try:
+        return _event_stream(machine_id)
+    except Exception as e:
+        print(f"Error in stream_machine: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/metrics/stream', methods=['GET'])
+def stream_metrics():
+    """Push stream counters: subscribers, queued events, slow consumers"""
+    return jsonify({
+        'success': True,
+        'stream': {**broadcaster.stats(), 'upstream_errors': latest_poller.errors},
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/api/metrics/notify', methods=['GET'])
+def notify_metrics():
+    """Change listener counters: connection state, notifications, consumers"""
+    return jsonify({
+        'success': True,
+        'listener': change_listener.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
+
+RAW_STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json-stream': 'application/json'
+}
+
+def _stream_raw_data(machine_id, start_time, after, fmt, meta):
+    """Stream raw rows through a named (server-side) cursor.
+
+    The cursor is declared before the response starts so query errors still
+    become a 500; rows are then fetched ``itersize`` at a time and written as
+    they arrive, so memory stays flat whatever the range. ``ndjson`` writes
+    one row per line (plus an error line if the stream fails midway);
+    ``json-stream`` writes the same envelope as the buffered response, with
+    ``count`` and ``success`` (and ``watermark`` with since=) at the end.
+    The connection bypasses
+    get_db_connection() because the request context is gone by the time
+    the body is generated; it is returned when the response is closed.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as plain:
+            source = machine_data_source(plain, _scan_start(start_time, after))
+        query = f"""
+        SELECT *
+        FROM {source}
+        WHERE machine_id = %s
+        AND time >= %s
+        """
+        params = [machine_id, start_time]
+        if after is not None:
+            query += "AND time > %s\n"
+            params.append(after)
+        query += "ORDER BY time ASC;"
+        cur = conn.cursor(name='raw_data_stream', cursor_factory=RealDictCursor)
+        cur.itersize = RAW_STREAM_CONFIG['itersize']
+        cur.execute(query, params)
+    except Exception:
+        release_connection(conn)
+        raise
+
+    dumps = app.json.dumps
+
+    def generate():
+        count = 0
+        last_time = after
+        if fmt == 'json-stream':
+            yield '{' + ''.join(f'{dumps(key)}: {dumps(value)}, ' for key, value in meta.items()) + '"data": ['
+        try:
+            while True:
+                rows = cur.fetchmany(cur.itersize)
+                if not rows:
+                    break
+                if fmt == 'ndjson':
+                    yield ''.join(dumps(row) + '\n' for row in rows)
+                else:
+                    yield (', ' if count else '') + ', '.join(dumps(row) for row in rows)
+                count += len(rows)
+                last_time = rows[-1]['time']
+            outcome = {'count': count, 'success': True}
+        except Exception as e:
+            print(f"Error streaming raw data: {e}")
+            outcome = {'count': count, 'success': False, 'error': str(e)}
+        if fmt == 'json-stream':
+            if after is not None:
+                outcome['watermark'] = last_time.isoformat()
+            yield '], ' + dumps(outcome)[1:]
+        elif not outcome['success']:
+            yield dumps(outcome) + '\n'
+
+    def close():
+        try:
+            cur.close()
+        except Exception:
+            pass
+        release_connection(conn)
+
+    response = Response(generate(), mimetype=RAW_STREAM_FORMATS[fmt])
+    response.call_on_close(close)
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['X-Time-Range'] = meta['time_range']
+    response.headers['X-Start-Time'] = meta['start_time']
+    return response
+
 @app.route('/api/machines/<machine_id>/raw-data', methods=['GET'])
 def get_raw_data(machine_id):
-    """Get raw OPCUA data for a machine within time range"""
+    """Get raw OPCUA data for a machine within time range
+
+    ?format=ndjson or ?format=json-stream streams the rows instead of
+    building the whole response in memory; use them for long ranges.
+    ?format=columnar returns one array per column (see rows_response).
+    ?limit=N pages through the window (follow next_cursor with ?cursor=),
+    ?since=<watermark> returns only rows newer than a previous response.
+    """
     try:
         time_range = request.args.get('range', '24h')
         start_time = parse_time_range(time_range)
+        fmt = request.args.get('format')
+        after, limit = keyset_args(machine_id)
+
+        if fmt in RAW_STREAM_FORMATS:
+            if limit is not None or 'cursor' in request.args:
+                raise ValueError('Streaming formats return the whole window, drop limit and cursor')
+            return _stream_raw_data(machine_id, start_time, after, fmt, {
+                'time_range': time_range,
+                'start_time': start_time.isoformat()
+            })
+        if fmt not in (None, 'columnar'):
+            raise ValueError(f"Unknown format '{fmt}', expected one of "
+                             f"{', '.join([*RAW_STREAM_FORMATS, 'columnar'])}")
         
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-        SELECT *
-        FROM machine_data
-        WHERE machine_id = %s
-        AND time >= %s
-        ORDER BY time ASC;
-        """
+        cur = conn.cursor()
         
-        cur.execute(query, (machine_id, start_time))
-        data = cur.fetchall()
+        names, rows, has_more = fetch_keyset_page(cur, ['*'], machine_id, start_time, after, limit)
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
-        return jsonify({
+        response = {
             'success': True,
-            'data': data,
-            'count': len(data),
+            'count': len(rows),
             'time_range': time_range,
             'start_time': start_time.isoformat()
-        })
+        }
+        if after is not None or limit is not None:
+            response.update(keyset_fields(machine_id, names, rows, has_more, after))
+        return rows_response(response, names, rows, fmt)
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"Error in get_raw_data: {e}")
         return jsonify({
@@ -210,6 +644,61 @@ def get_raw_data(machine_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/machines/<machine_id>/export', methods=['GET'])
+def export_machine_data(machine_id):
+    """Download raw rows as a typed Arrow IPC stream or Parquet file.
+
+    ?format=parquet (default) or arrow, ?compression= (codec), and either
+    ?range= or ?start=/?end= (ISO 8601). Rows are streamed out of parallel
+    COPYs in record batches (see export.py), so memory stays bounded for
+    any window.
+    Needs pyarrow; without it the endpoint answers 501.
+    """
+    if not export_available():
+        return jsonify({
+            'success': False,
+            'error': 'Export needs pyarrow, which is not installed on this server'
+        }), 501
+    try:
+        fmt = request.args.get('format', 'parquet')
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}")
+        compression = request.args.get('compression')
+        check_compression(fmt, compression)
+        end = request.args.get('end')
+        end = datetime.fromisoformat(end) if end else datetime.now().astimezone()
+        start = request.args.get('start')
+        if start:
+            start = datetime.fromisoformat(start)
+        else:
+            start = parse_time_range(request.args.get('range', '24h')).astimezone()
+        if start.tzinfo is None or end.tzinfo is None:
+            raise ValueError('start and end need a UTC offset')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    def generate():
+        try:
+            yield from export_chunks(machine_id, start, end, fmt, compression,
+                                     workers=EXPORT_CONFIG['http_workers'])
+        except Exception as e:
+            # Headers are sent already; the client sees a truncated file
+            print(f"Error streaming export of {machine_id}: {e}")
+
+    body = generate()
+
+    extension = 'arrows' if fmt == 'arrow' else 'parquet'
+    filename = f"{machine_id}_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.{extension}"
+    response = Response(body, mimetype=EXPORT_FORMATS[fmt])
+    # Stops the export workers if the client goes away
+    response.call_on_close(body.close)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # ============================================================
 # OEE ENDPOINTS
 # ============================================================
@@ -223,18 +712,10 @@ def get_oee_metrics():
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = """
-        WITH machine_stats AS (
-            SELECT 
-                machine_id,
-                COUNT(*) as total_records,
-                SUM(CASE WHEN state = 'Running' THEN 1 ELSE 0 END) as running_count,
-                AVG(cutting_speed) as avg_speed,
-                SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END) as error_count
-            FROM machine_data
-            WHERE time >= %s
-            GROUP BY machine_id
-        )
+        # Closed buckets come from the OEE rollups, only the tail from raw rows
+        stats_query, stats_params = oee_stats_query(cur, start_time)
+        query = sql.SQL("""
+        WITH machine_stats AS ({stats})
         SELECT 
             machine_id,
             CAST(ROUND(CAST((running_count::numeric / NULLIF(total_records, 0) * 100) AS numeric), 2) AS float) as availability,
@@ -249,13 +730,13 @@ def get_oee_metrics():
                 (1 - (error_count::numeric / NULLIF(total_records, 0))) * 100
              AS numeric), 2) AS float) as oee
         FROM machine_stats;
-        """
+        """).format(stats=stats_query)
         
-        cur.execute(query, (start_time,))
+        cur.execute(query, stats_params)
         metrics = cur.fetchall()
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         return jsonify({
             'success': True,
@@ -271,7 +752,24 @@ def get_oee_metrics():
             'error': str(e)
         }), 500
 
+# OEE of one machine from its counters; no data reads as 0% (quality 100%)
+MACHINE_OEE_COLUMNS = """
+    COALESCE(CAST(ROUND(CAST((running_count::numeric / NULLIF(total_records, 0) * 100) AS numeric), 2) AS float), 0) as availability,
+    COALESCE(CAST(ROUND(CAST(CASE 
+        WHEN avg_speed > 0 THEN (avg_speed / 500.0 * 100)
+        ELSE 0 
+    END AS numeric), 2) AS float), 0) as performance,
+    COALESCE(CAST(ROUND(CAST((1 - (error_count::numeric / NULLIF(total_records, 0))) * 100 AS numeric), 2) AS float), 100) as quality,
+    COALESCE(CAST(ROUND(CAST(
+        (running_count::numeric / NULLIF(total_records, 0)) * 
+        (CASE WHEN avg_speed > 0 THEN (avg_speed / 500.0) ELSE 0 END) * 
+        (1 - (error_count::numeric / NULLIF(total_records, 0))) * 100
+     AS numeric), 2) AS float), 0) as oee
+"""
+
 @app.route('/api/machines/<machine_id>/oee', methods=['GET'])
+@cached_response('oee')
+@coalesced('oee')
 def get_machine_oee(machine_id):
     """Get OEE metrics for specific machine"""
     try:
@@ -281,37 +779,18 @@ def get_machine_oee(machine_id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = """
-        WITH machine_stats AS (
-            SELECT 
-                COUNT(*) as total_records,
-                SUM(CASE WHEN state = 'Running' THEN 1 ELSE 0 END) as running_count,
-                AVG(cutting_speed) as avg_speed,
-                SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END) as error_count
-            FROM machine_data
-            WHERE machine_id = %s
-            AND time >= %s
-        )
-        SELECT 
-            COALESCE(CAST(ROUND(CAST((running_count::numeric / NULLIF(total_records, 0) * 100) AS numeric), 2) AS float), 0) as availability,
-            COALESCE(CAST(ROUND(CAST(CASE 
-                WHEN avg_speed > 0 THEN (avg_speed / 500.0 * 100)
-                ELSE 0 
-            END AS numeric), 2) AS float), 0) as performance,
-            COALESCE(CAST(ROUND(CAST((1 - (error_count::numeric / NULLIF(total_records, 0))) * 100 AS numeric), 2) AS float), 100) as quality,
-            COALESCE(CAST(ROUND(CAST(
-                (running_count::numeric / NULLIF(total_records, 0)) * 
-                (CASE WHEN avg_speed > 0 THEN (avg_speed / 500.0) ELSE 0 END) * 
-                (1 - (error_count::numeric / NULLIF(total_records, 0))) * 100
-             AS numeric), 2) AS float), 0) as oee
+        stats_query, stats_params = oee_stats_query(cur, start_time, machine_id)
+        query = sql.SQL("""
+        WITH machine_stats AS ({stats})
+        SELECT {columns}
         FROM machine_stats;
-        """
+        """).format(stats=stats_query, columns=sql.SQL(MACHINE_OEE_COLUMNS))
         
-        cur.execute(query, (machine_id, start_time))
+        cur.execute(query, stats_params)
         result = cur.fetchone()
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         if result:
             return jsonify({
@@ -342,92 +821,173 @@ def get_machine_oee(machine_id):
 # ============================================================
 # TIMELINE ENDPOINTS
 # ============================================================
+TIMELINE_STATES = ['Running', 'Drilling', 'Marking', 'Idle', 'Error', 'Stopped']
+
+# Columns PRIMARY_STATE_SQL and the raw state queries read
+STATE_COLUMNS = ['state', 'drilling', 'current']
+
+# Gaps-and-islands: consecutive samples with the same primary state collapse
+# into one interval. Each sample lasts until the next one (2s for the last).
+# Fallback for databases without machine_state_intervals.
+TIMELINE_INTERVALS_SQL = f"""
+WITH samples AS (
+    SELECT 
+        time,
+        {PRIMARY_STATE_SQL} AS primary_state,
+        COALESCE(NULLIF(EXTRACT(EPOCH FROM (LEAD(time) OVER (ORDER BY time) - time)), 0), 2) AS duration_seconds
+    FROM {{source}}
+    WHERE machine_id = %s
+    AND time >= %s
+),
+marked AS (
+    SELECT *,
+        CASE WHEN primary_state IS DISTINCT FROM LAG(primary_state) OVER (ORDER BY time)
+             THEN 1 ELSE 0 END AS is_start
+    FROM samples
+),
+islands AS (
+    SELECT *, SUM(is_start) OVER (ORDER BY time ROWS UNBOUNDED PRECEDING) AS island
+    FROM marked
+)
+SELECT 
+    primary_state AS status,
+    MIN(time) AS start_time,
+    SUM(duration_seconds) AS duration_seconds,
+    COUNT(*) AS samples
+FROM islands
+GROUP BY island, primary_state
+ORDER BY start_time ASC;
+"""
+
+def _merge_short_intervals(intervals, min_width):
+    """Merge intervals shorter than ``min_width`` seconds.
+
+    A run of consecutive short intervals becomes one interval labelled with
+    its dominant state (by duration); a run too short to stand on its own is
+    folded into the preceding interval. Adjacent equal states are joined.
+    """
+    merged = []
+
+    def emit(interval):
+        if merged and merged[-1]['status'] == interval['status']:
+            merged[-1]['duration'] += interval['duration']
+            merged[-1]['samples'] += interval['samples']
+        else:
+            merged.append(interval)
+
+    def flush(run):
+        if not run:
+            return
+        duration = sum(i['duration'] for i in run)
+        samples = sum(i['samples'] for i in run)
+        if merged and duration < min_width:
+            merged[-1]['duration'] += duration
+            merged[-1]['samples'] += samples
+            return
+        per_state = {}
+        for i in run:
+            per_state[i['status']] = per_state.get(i['status'], 0) + i['duration']
+        emit({
+            'status': max(per_state, key=per_state.get),
+            'start': run[0]['start'],
+            'duration': duration,
+            'samples': samples
+        })
+
+    run = []
+    for interval in intervals:
+        if interval['duration'] < min_width:
+            run.append(interval)
+        else:
+            flush(run)
+            run = []
+            emit(dict(interval))
+    flush(run)
+    return merged
+
+def _build_timeline(intervals):
+    timeline = {'overview': [], **{state: [] for state in TIMELINE_STATES}}
+    for interval in intervals:
+        entry = {
+            'status': interval['status'],
+            'duration': float(interval['duration']),
+            'timestamp': interval['start'].isoformat(),
+            'end': (interval['start'] + timedelta(seconds=float(interval['duration']))).isoformat(),
+            'samples': interval['samples']
+        }
+        timeline['overview'].append(entry)
+        if entry['status'] in timeline:
+            timeline[entry['status']].append(entry)
+    return timeline
+
 @app.route('/api/machines/<machine_id>/timeline', methods=['GET'])
+@cached_response('timeline')
+@coalesced('timeline')
 def get_machine_timeline(machine_id):
-    """Get machine state timeline with mutually exclusive states"""
+    """Get machine state timeline with mutually exclusive states.
+
+    Consecutive samples with the same primary state are returned as one
+    interval (start, end, duration). ``min_width=<seconds>`` folds shorter
+    intervals into the preceding one. Reads machine_state_intervals when it
+    exists, otherwise computes the intervals from the raw samples.
+
+    ``since=<watermark>`` returns only the intervals from the watermark on;
+    the watermark is the start of the last (still growing) interval, so the
+    first interval returned replaces the client's last one.
+    """
     try:
         time_range = request.args.get('range', '24h')
         start_time = parse_time_range(time_range)
+        min_width = request.args.get('min_width', 0, type=float)
+        after, limit = keyset_args(machine_id)
+        if limit is not None or 'cursor' in request.args:
+            return jsonify({
+                'success': False,
+                'error': 'The timeline is not paginated, use since to poll for changes'
+            }), 400
+        if after is not None and after.timestamp() > start_time.timestamp():
+            start_time = after
         
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = """
-        SELECT 
-            time,
-            state,
-            drilling,
-            current,
-            cutting_speed,
-            EXTRACT(EPOCH FROM (LEAD(time) OVER (ORDER BY time) - time)) as duration_seconds
-        FROM machine_data
-        WHERE machine_id = %s
-        AND time >= %s
-        ORDER BY time ASC;
-        """
-        
-        cur.execute(query, (machine_id, start_time))
-        raw_data = cur.fetchall()
+        if table_exists_cached(cur, INTERVALS_TABLE):
+            cur.execute(TIMELINE_SQL, {'machine_id': machine_id, 'start': start_time})
+        else:
+            source = machine_data_source(cur, start_time, STATE_COLUMNS)
+            cur.execute(TIMELINE_INTERVALS_SQL.format(source=source), (machine_id, start_time))
+        rows = cur.fetchall()
         
         cur.close()
-        conn.close()
-        
-        timeline = {
-            'overview': [],
-            'Running': [],
-            'Drilling': [],
-            'Marking': [],
-            'Idle': [],
-            'Error': [],
-            'Stopped': []
-        }
+        release_db_connection(conn)
         
-        for record in raw_data:
-            duration = record['duration_seconds'] or 2
-            timestamp = record['time'].isoformat() if record['time'] else datetime.now().isoformat()
-            
-            state = record['state'] or 'Unknown'
-            drilling_active = record['drilling'] and float(record['drilling']) > 0
-            marking_active = record['current'] and float(record['current']) > 0
-            
-            # ✅ PRIORITY LOGIC: Most specific state wins
-            if state == 'Running':
-                if drilling_active:
-                    primary_state = 'Drilling'
-                elif marking_active:
-                    primary_state = 'Marking'
-                else:
-                    primary_state = 'Running'
-            elif state == 'Error':
-                primary_state = 'Error'
-            elif state == 'Stopped':
-                primary_state = 'Stopped'
-            elif state == 'Idle':
-                primary_state = 'Idle'
-            else:
-                primary_state = state
-            
-            # Overview shows primary state
-            timeline['overview'].append({
-                'status': primary_state,
-                'duration': float(duration),
-                'timestamp': timestamp
-            })
-            
-            # ONLY add to matching timeline
-            if primary_state in timeline:
-                timeline[primary_state].append({
-                    'status': primary_state,
-                    'duration': float(duration),
-                    'timestamp': timestamp
-                })
+        intervals = [
+            {
+                'status': row['status'],
+                'start': row['start_time'],
+                'duration': float(row['duration_seconds']),
+                'samples': row['samples']
+            }
+            for row in rows
+        ]
+        if min_width > 0:
+            intervals = _merge_short_intervals(intervals, min_width)
         
-        return jsonify({
+        response = {
             'success': True,
-            'timeline': timeline,
+            'timeline': _build_timeline(intervals),
             'time_range': time_range
-        })
+        }
+        if after is not None:
+            last_start = intervals[-1]['start'] if intervals else after
+            response['watermark'] = last_start.isoformat()
+        return jsonify(response)
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"Error in get_machine_timeline: {e}")
         traceback.print_exc()
@@ -449,6 +1009,8 @@ def get_machine_timeline(machine_id):
 # STATUS SUMMARY ENDPOINTS
 # ============================================================
 @app.route('/api/machines/<machine_id>/status-summary', methods=['GET'])
+@cached_response('status-summary')
+@coalesced('status-summary')
 def get_status_summary(machine_id):
     """Get status duration summary"""
     try:
@@ -458,30 +1020,33 @@ def get_status_summary(machine_id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Fixed: Removed GROUP BY from window function query
-        query = """
-        WITH durations AS (
+        if table_exists_cached(cur, INTERVALS_TABLE):
+            cur.execute(STATUS_SUMMARY_SQL, {'machine_id': machine_id, 'start': start_time})
+        else:
+            # Fixed: Removed GROUP BY from window function query
+            source = machine_data_source(cur, start_time, STATE_COLUMNS)
+            query = f"""
+            WITH durations AS (
+                SELECT 
+                    state,
+                    EXTRACT(EPOCH FROM (LEAD(time) OVER (ORDER BY time) - time)) as duration_seconds
+                FROM {source}
+                WHERE machine_id = %s
+                AND time >= %s
+            )
             SELECT 
                 state,
-                EXTRACT(EPOCH FROM (LEAD(time) OVER (ORDER BY time) - time)) as duration_seconds
-            FROM machine_data
-            WHERE machine_id = %s
-            AND time >= %s
-        )
-        SELECT 
-            state,
-            COUNT(*) as count,
-            COALESCE(SUM(duration_seconds), 0) as total_duration
-        FROM durations
-        WHERE state IS NOT NULL
-        GROUP BY state;
-        """
-        
-        cur.execute(query, (machine_id, start_time))
+                COUNT(*) as count,
+                COALESCE(SUM(duration_seconds), 0) as total_duration
+            FROM durations
+            WHERE state IS NOT NULL
+            GROUP BY state;
+            """
+            cur.execute(query, (machine_id, start_time))
         results = cur.fetchall()
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         summary = {}
         for row in results:
@@ -505,6 +1070,8 @@ def get_status_summary(machine_id):
 # ERROR ANALYSIS ENDPOINTS
 # ============================================================
 @app.route('/api/machines/<machine_id>/errors', methods=['GET'])
+@cached_response('errors')
+@coalesced('errors')
 def get_error_analysis(machine_id):
     """Get error analysis for machine"""
     try:
@@ -515,13 +1082,15 @@ def get_error_analysis(machine_id):
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # Get error statistics
-        query = """
+        source = machine_data_source(cur, start_time,
+                                     ['error_code', 'error_text', 'error_level', 'arc_error'])
+        query = f"""
         WITH error_stats AS (
             SELECT 
                 COUNT(*) as total_records,
                 SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END) as total_errors,
                 SUM(CASE WHEN arc_error = TRUE THEN 1 ELSE 0 END) as arc_errors
-            FROM machine_data
+            FROM {source}
             WHERE machine_id = %s
             AND time >= %s
         ),
@@ -532,7 +1101,7 @@ def get_error_analysis(machine_id):
                 error_level,
                 COUNT(*) as count,
                 MAX(time) as last_occurrence
-            FROM machine_data
+            FROM {source}
             WHERE machine_id = %s
             AND time >= %s
             AND error_code IS NOT NULL
@@ -559,7 +1128,7 @@ def get_error_analysis(machine_id):
         result = cur.fetchone()
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         if result and result['total_records']:
             error_rate = (result['total_errors'] / result['total_records']) * 100
@@ -590,50 +1159,172 @@ def get_error_analysis(machine_id):
 # ============================================================
 # HISTORICAL DATA ENDPOINTS
 # ============================================================
+HISTORICAL_COLUMNS = [
+    'time', 'cutting_speed', 'current', 'drilling', 'drilling_depth', 'thickness',
+    'state', 'material', 'gas_type', 'override_flag', 'scrap_cut', 'technology_name'
+]
+HISTORICAL_NUMERIC = ['cutting_speed', 'current', 'drilling', 'drilling_depth', 'thickness']
+HISTORICAL_CATEGORICAL = ['state', 'material', 'gas_type', 'technology_name']
+
+def _historical_bucketed(cur, machine_id, start_time, bucket_seconds):
+    """One row per time bucket: avg/min/max per numeric field, dominant categories"""
+    numeric = ",\n".join(
+        f"AVG({c}) AS {c}, MIN({c}) AS {c}_min, MAX({c}) AS {c}_max" for c in HISTORICAL_NUMERIC
+    )
+    categorical = ",\n".join(
+        f"mode() WITHIN GROUP (ORDER BY {c}) AS {c}" for c in HISTORICAL_CATEGORICAL
+    )
+    query = f"""
+    SELECT 
+        to_timestamp(floor(EXTRACT(EPOCH FROM time) / %(width)s) * %(width)s) AS time,
+        COUNT(*) AS samples,
+        {numeric},
+        {categorical},
+        bool_or(override_flag) AS override_flag,
+        bool_or(scrap_cut) AS scrap_cut
+    FROM {machine_data_source(cur, start_time, HISTORICAL_COLUMNS)}
+    WHERE machine_id = %(machine_id)s
+    AND time >= %(start)s
+    GROUP BY 1
+    ORDER BY 1 ASC;
+    """
+    cur.execute(query, {'width': bucket_seconds, 'machine_id': machine_id, 'start': start_time})
+    return [column.name for column in cur.description], cur.fetchall()
+
+# Candidate buckets per LTTB output point
+LTTB_CANDIDATE_FACTOR = 4
+
+def _historical_lttb(cur, machine_id, start_time, points, field):
+    """Shape-preserving subset of raw rows, selected by LTTB on ``field``.
+
+    The database first cuts the window into ``points * LTTB_CANDIDATE_FACTOR``
+    equal time buckets and keeps only each bucket's first, last, lowest and
+    highest row, so LTTB runs on a bounded candidate set however long the
+    range is. Buckets span from the first row present, not the window start,
+    so a window reaching back before the data still gets ``points`` rows.
+    """
+    archived = first_archived_time(cur, machine_id, start_time)
+    cur.execute("""
+        SELECT LEAST(MIN(time), %(archived)s), EXTRACT(EPOCH FROM now() - LEAST(MIN(time), %(archived)s))
+        FROM machine_data
+        WHERE machine_id = %(machine_id)s AND time >= %(start)s;
+    """, {'archived': archived, 'machine_id': machine_id, 'start': start_time})
+    first, window = cur.fetchone()
+    if first is None:
+        return HISTORICAL_COLUMNS, []
+    query = f"""
+    WITH bucketed AS (
+        SELECT {', '.join(HISTORICAL_COLUMNS)},
+               floor(EXTRACT(EPOCH FROM time - %(first)s) / %(width)s) AS bucket
+        FROM {machine_data_source(cur, first, HISTORICAL_COLUMNS)}
+        WHERE machine_id = %(machine_id)s
+        AND time >= %(first)s
+    ),
+    ranked AS (
+        SELECT *,
+               row_number() OVER (PARTITION BY bucket ORDER BY time ASC) AS first_rank,
+               row_number() OVER (PARTITION BY bucket ORDER BY time DESC) AS last_rank,
+               row_number() OVER (PARTITION BY bucket ORDER BY {field} ASC NULLS LAST, time) AS low_rank,
+               row_number() OVER (PARTITION BY bucket ORDER BY {field} DESC NULLS LAST, time) AS high_rank
+        FROM bucketed
+    )
+    SELECT {', '.join(HISTORICAL_COLUMNS)}
+    FROM ranked
+    WHERE 1 IN (first_rank, last_rank, low_rank, high_rank)
+    ORDER BY time ASC;
+    """
+    cur.execute(query, {'first': first, 'machine_id': machine_id,
+                        'width': max(float(window), 1.0) / (points * LTTB_CANDIDATE_FACTOR)})
+    rows = cur.fetchall()
+    if len(rows) <= points:
+        return HISTORICAL_COLUMNS, rows
+
+    field_index = HISTORICAL_COLUMNS.index(field)
+    x = np.fromiter((row[0].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    y = np.array([row[field_index] for row in rows], dtype=np.float64)
+    return HISTORICAL_COLUMNS, [rows[i] for i in lttb_indices(x, y, points)]
+
 @app.route('/api/machines/<machine_id>/historical', methods=['GET'])
+@cached_response('historical')
+@coalesced('historical')
 def get_historical_data(machine_id):
-    """Get historical data for charts"""
+    """Get historical data for charts.
+
+    Optional downsampling: ``points=N`` or ``bucket=5m`` returns time-bucketed
+    aggregates computed in the database; ``method=lttb`` with ``points=N``
+    returns N raw rows chosen to preserve the shape of ``field``
+    (default cutting_speed). Without downsampling, ``limit``/``cursor``
+    page through the rows and ``since`` returns only newer rows, as on
+    /raw-data. ``format=columnar`` returns one array per column in every
+    mode (see rows_response).
+    """
     try:
         time_range = request.args.get('range', '24h')
         start_time = parse_time_range(time_range)
+        points = request.args.get('points', type=int)
+        bucket = request.args.get('bucket')
+        method = request.args.get('method', 'bucket')
+        field = request.args.get('field', 'cutting_speed')
+        fmt = request.args.get('format')
+        after, limit = keyset_args(machine_id)
+        keyset = after is not None or limit is not None
         
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        if fmt not in (None, 'columnar'):
+            return jsonify({'success': False, 'error': f"Unknown format '{fmt}', expected columnar"}), 400
+        if keyset and (points or bucket):
+            return jsonify({
+                'success': False,
+                'error': 'since, cursor and limit apply to raw rows, not downsampled data'
+            }), 400
+        if points is not None and points < 1:
+            return jsonify({'success': False, 'error': 'points must be positive'}), 400
+        if method not in ('bucket', 'lttb'):
+            return jsonify({'success': False, 'error': f'Unknown method: {method}'}), 400
+        if method == 'lttb' and (points is None or field not in HISTORICAL_NUMERIC):
+            return jsonify({
+                'success': False,
+                'error': 'lttb needs points and a numeric field'
+            }), 400
         
-        # Get aggregated data
-        query = """
-        SELECT 
-            time,
-            cutting_speed,
-            current,
-            drilling,
-            drilling_depth,
-            thickness,
-            state,
-            material,
-            gas_type,
-            override_flag,
-            scrap_cut,
-            technology_name
-        FROM machine_data
-        WHERE machine_id = %s
-        AND time >= %s
-        ORDER BY time ASC;
-        """
+        bucket_seconds = None
+        if bucket:
+            bucket_seconds = parse_bucket(bucket)
+        elif points and method == 'bucket':
+            window = (datetime.now() - start_time).total_seconds()
+            bucket_seconds = max(1, math.ceil(window / points))
         
-        cur.execute(query, (machine_id, start_time))
-        data = cur.fetchall()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
+        if bucket_seconds:
+            names, rows = _historical_bucketed(cur, machine_id, start_time, bucket_seconds)
+        elif method == 'lttb':
+            names, rows = _historical_lttb(cur, machine_id, start_time, points, field)
+        else:
+            names, rows, has_more = fetch_keyset_page(cur, HISTORICAL_COLUMNS, machine_id, start_time,
+                                                      after, limit)
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
-        return jsonify({
+        response = {
             'success': True,
-            'data': data,
-            'count': len(data),
+            'count': len(rows),
             'time_range': time_range
-        })
+        }
+        if bucket_seconds:
+            response['bucket_seconds'] = bucket_seconds
+        if method == 'lttb':
+            response['method'] = 'lttb'
+        if keyset:
+            response.update(keyset_fields(machine_id, names, rows, has_more, after))
+        return rows_response(response, names, rows, fmt)
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"Error in get_historical_data: {e}")
         return jsonify({
@@ -645,6 +1336,8 @@ def get_historical_data(machine_id):
 # STATISTICS ENDPOINTS
 # ============================================================
 @app.route('/api/machines/<machine_id>/statistics', methods=['GET'])
+@cached_response('statistics')
+@coalesced('statistics')
 def get_statistics(machine_id):
     """Get statistical aggregations"""
     try:
@@ -654,7 +1347,9 @@ def get_statistics(machine_id):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = """
+        source = machine_data_source(cur, start_time,
+                                     ['cutting_speed', 'current', 'material', 'gas_type', 'scrap_cut'])
+        query = f"""
         SELECT 
             COUNT(*) as total_records,
             AVG(cutting_speed) as avg_speed,
@@ -665,7 +1360,7 @@ def get_statistics(machine_id):
             COUNT(DISTINCT material) as material_count,
             COUNT(DISTINCT gas_type) as gas_type_count,
             SUM(CASE WHEN scrap_cut = TRUE THEN 1 ELSE 0 END) as scrap_count
-        FROM machine_data
+        FROM {source}
         WHERE machine_id = %s
         AND time >= %s;
         """
@@ -674,7 +1369,7 @@ def get_statistics(machine_id):
         stats = cur.fetchone()
         
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         return jsonify({
             'success': True,
@@ -689,6 +1384,436 @@ def get_statistics(machine_id):
             'error': str(e)
         }), 500
 
+# ============================================================
+# DASHBOARD BUNDLE ENDPOINT
+# ============================================================
+STATISTICS_FIELDS = ['avg_speed', 'max_speed', 'min_speed', 'avg_current', 'max_current',
+                     'material_count', 'gas_type_count', 'scrap_count']
+
+# What /statistics returns for a window without samples
+EMPTY_STATISTICS = {
+    'total_records': 0, 'avg_speed': None, 'max_speed': None, 'min_speed': None,
+    'avg_current': None, 'max_current': None, 'material_count': 0,
+    'gas_type_count': 0, 'scrap_count': None
+}
+
+# The machine's window is read once into a materialized slice; every
+# section below aggregates that slice instead of scanning machine_data again
+BUNDLE_SLICE_SQL = """
+slice AS MATERIALIZED (
+    SELECT 
+        time,
+        state,
+        cutting_speed,
+        current,
+        material,
+        gas_type,
+        scrap_cut,
+        error_code,
+        error_text,
+        error_level,
+        arc_error{state_columns}
+    FROM {source}
+    WHERE machine_id = %(machine_id)s
+    AND time >= %(start)s
+),
+totals AS (
+    SELECT 
+        COUNT(*) as total_records,
+        SUM(CASE WHEN state = 'Running' THEN 1 ELSE 0 END) as running_count,
+        AVG(cutting_speed) as avg_speed,
+        MAX(cutting_speed) as max_speed,
+        MIN(cutting_speed) as min_speed,
+        AVG(current) as avg_current,
+        MAX(current) as max_current,
+        (SELECT COUNT(*) FROM (SELECT DISTINCT material FROM slice WHERE material IS NOT NULL) m) as material_count,
+        (SELECT COUNT(*) FROM (SELECT DISTINCT gas_type FROM slice WHERE gas_type IS NOT NULL) g) as gas_type_count,
+        SUM(CASE WHEN scrap_cut = TRUE THEN 1 ELSE 0 END) as scrap_count,
+        SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END) as error_count,
+        SUM(CASE WHEN arc_error = TRUE THEN 1 ELSE 0 END) as arc_errors
+    FROM slice
+),
+error_types AS (
+    SELECT 
+        error_code,
+        error_text,
+        error_level,
+        COUNT(*) as count,
+        MAX(time) as last_occurrence
+    FROM slice
+    WHERE error_code IS NOT NULL
+    GROUP BY error_code, error_text, error_level
+)
+"""
+
+BUNDLE_COLUMNS = f"""
+    totals.*,
+    {MACHINE_OEE_COLUMNS},
+    (SELECT json_agg(
+        json_build_object(
+            'code', error_code,
+            'text', error_text,
+            'level', error_level,
+            'count', count,
+            'last', last_occurrence
+        ) ORDER BY count DESC
+    ) FROM error_types) as error_types
+"""
+
+# Status and timeline from the same slice, for databases without
+# machine_state_intervals (same results as the standalone raw queries)
+BUNDLE_STATE_SLICE_COLUMNS = f""",
+        {PRIMARY_STATE_SQL} AS primary_state,
+        EXTRACT(EPOCH FROM (LEAD(time) OVER (ORDER BY time) - time)) AS duration_seconds"""
+
+BUNDLE_STATE_SQL = """,
+status AS (
+    SELECT state, COALESCE(SUM(duration_seconds), 0) as total_duration
+    FROM slice
+    WHERE state IS NOT NULL
+    GROUP BY state
+),
+marked AS (
+    SELECT 
+        time,
+        primary_state,
+        COALESCE(NULLIF(duration_seconds, 0), 2) AS duration_seconds,
+        CASE WHEN primary_state IS DISTINCT FROM LAG(primary_state) OVER (ORDER BY time)
+             THEN 1 ELSE 0 END AS is_start
+    FROM slice
+),
+islands AS (
+    SELECT *, SUM(is_start) OVER (ORDER BY time ROWS UNBOUNDED PRECEDING) AS island
+    FROM marked
+),
+timeline AS (
+    SELECT 
+        primary_state AS status,
+        MIN(time) AS start_time,
+        SUM(duration_seconds) AS duration_seconds,
+        COUNT(*) AS samples
+    FROM islands
+    GROUP BY island, primary_state
+)
+"""
+
+BUNDLE_STATE_COLUMNS = """,
+    (SELECT array_agg(state) FROM status) as status_states,
+    (SELECT array_agg(total_duration) FROM status) as status_durations,
+    (SELECT array_agg(status ORDER BY start_time) FROM timeline) as timeline_status,
+    (SELECT array_agg(start_time ORDER BY start_time) FROM timeline) as timeline_starts,
+    (SELECT array_agg(duration_seconds ORDER BY start_time) FROM timeline) as timeline_durations,
+    (SELECT array_agg(samples ORDER BY start_time) FROM timeline) as timeline_samples
+"""
+
+# Columns the slice reads, for machine_data_source()
+BUNDLE_SLICE_COLUMNS = ['state', 'cutting_speed', 'current', 'drilling', 'material', 'gas_type',
+                        'scrap_cut', 'error_code', 'error_text', 'error_level', 'arc_error']
+
+def _bundle_query(with_state, source="machine_data"):
+    ctes = BUNDLE_SLICE_SQL.format(state_columns=BUNDLE_STATE_SLICE_COLUMNS if with_state else "",
+                                   source=source)
+    ctes += BUNDLE_STATE_SQL if with_state else ""
+    columns = BUNDLE_COLUMNS + (BUNDLE_STATE_COLUMNS if with_state else "")
+    return f"WITH {ctes} SELECT {columns} FROM totals;"
+
+@app.route('/api/machines/<machine_id>/dashboard', methods=['GET'])
+@cached_response('dashboard')
+@coalesced('dashboard')
+def get_machine_dashboard(machine_id):
+    """Realtime, OEE, timeline, status summary, errors and statistics in one call.
+
+    Sections match the standalone endpoints. machine_data is read once:
+    realtime comes from the latest-row snapshot, timeline and status
+    summary from machine_state_intervals when it exists, and everything
+    else from a single multi-aggregate pass over the window.
+    ``min_width`` applies to the timeline as in /timeline.
+    """
+    try:
+        time_range = request.args.get('range', '24h')
+        start_time = parse_time_range(time_range)
+        min_width = request.args.get('min_width', 0, type=float)
+        params = {'machine_id': machine_id, 'start': start_time}
+        
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        use_intervals = table_exists_cached(cur, INTERVALS_TABLE)
+        source = machine_data_source(cur, start_time, BUNDLE_SLICE_COLUMNS)
+        cur.execute(_bundle_query(with_state=not use_intervals, source=source), params)
+        row = cur.fetchone()
+        if use_intervals:
+            cur.execute(STATUS_SUMMARY_SQL, params)
+            status_rows = cur.fetchall()
+            cur.execute(TIMELINE_SQL, params)
+            timeline_rows = cur.fetchall()
+        else:
+            status_rows = [
+                {'state': state, 'total_duration': duration}
+                for state, duration in zip(row['status_states'] or [], row['status_durations'] or [])
+            ]
+            timeline_rows = [
+                {'status': status, 'start_time': start, 'duration_seconds': duration, 'samples': samples}
+                for status, start, duration, samples in zip(
+                    row['timeline_status'] or [], row['timeline_starts'] or [],
+                    row['timeline_durations'] or [], row['timeline_samples'] or []
+                )
+            ]
+        
+        cur.close()
+        release_db_connection(conn)
+        
+        intervals = [
+            {
+                'status': r['status'],
+                'start': r['start_time'],
+                'duration': float(r['duration_seconds']),
+                'samples': r['samples']
+            }
+            for r in timeline_rows
+        ]
+        if min_width > 0:
+            intervals = _merge_short_intervals(intervals, min_width)
+        
+        total_records = row['total_records']
+        
+        return jsonify({
+            'success': True,
+            'machine_id': machine_id,
+            'realtime': latest_cache.get(machine_id),
+            'oee': {
+                'oee': float(row['oee']),
+                'availability': float(row['availability']),
+                'performance': float(row['performance']),
+                'quality': float(row['quality'])
+            },
+            'timeline': _build_timeline(intervals),
+            'status_summary': {
+                r['state']: float(r['total_duration']) if r['total_duration'] else 0.0
+                for r in status_rows
+            },
+            'errors': {
+                'totalErrors': row['error_count'],
+                'arcErrors': row['arc_errors'],
+                'errorRate': round(row['error_count'] / total_records * 100, 2) if total_records else 0,
+                'errorTypes': row['error_types'] or []
+            },
+            'statistics': {
+                'total_records': total_records,
+                **{field: row[field] for field in STATISTICS_FIELDS}
+            },
+            'time_range': time_range
+        })
+        
+    except Exception as e:
+        print(f"Error in get_machine_dashboard: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# ============================================================
+# FLEET BATCH ENDPOINT
+# ============================================================
+# %(machine_ids)s NULL means every machine
+FLEET_MACHINE_FILTER = "(%(machine_ids)s::text[] IS NULL OR machine_id = ANY(%(machine_ids)s::text[]))"
+
+FLEET_STATUS_SUMMARY_RAW_SQL = f"""
+WITH durations AS (
+    SELECT 
+        machine_id,
+        state,
+        EXTRACT(EPOCH FROM (LEAD(time) OVER (PARTITION BY machine_id ORDER BY time) - time)) as duration_seconds
+    FROM {{source}}
+    WHERE time >= %(start)s
+    AND {FLEET_MACHINE_FILTER}
+)
+SELECT machine_id, state, COALESCE(SUM(duration_seconds), 0) as total_duration
+FROM durations
+WHERE state IS NOT NULL
+GROUP BY machine_id, state;
+"""
+
+# Statistics and error counters share one pass over the window. Rows are
+# first hash-aggregated per (machine, material, gas type), so the distinct
+# counts only have to sort a few groups per machine instead of every row.
+FLEET_STATISTICS_SQL = f"""
+WITH groups AS (
+    SELECT 
+        machine_id,
+        material,
+        gas_type,
+        COUNT(*) as total_records,
+        SUM(cutting_speed) as speed_sum,
+        COUNT(cutting_speed) as speed_count,
+        MAX(cutting_speed) as max_speed,
+        MIN(cutting_speed) as min_speed,
+        SUM(current) as current_sum,
+        COUNT(current) as current_count,
+        MAX(current) as max_current,
+        SUM(CASE WHEN scrap_cut = TRUE THEN 1 ELSE 0 END) as scrap_count,
+        SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END) as total_errors,
+        SUM(CASE WHEN arc_error = TRUE THEN 1 ELSE 0 END) as arc_errors
+    FROM {{source}}
+    WHERE time >= %(start)s
+    AND {FLEET_MACHINE_FILTER}
+    GROUP BY machine_id, material, gas_type
+)
+SELECT 
+    machine_id,
+    SUM(total_records)::bigint as total_records,
+    SUM(speed_sum) / NULLIF(SUM(speed_count), 0) as avg_speed,
+    MAX(max_speed) as max_speed,
+    MIN(min_speed) as min_speed,
+    SUM(current_sum) / NULLIF(SUM(current_count), 0) as avg_current,
+    MAX(max_current) as max_current,
+    COUNT(DISTINCT material) as material_count,
+    COUNT(DISTINCT gas_type) as gas_type_count,
+    SUM(scrap_count)::bigint as scrap_count,
+    SUM(total_errors)::bigint as total_errors,
+    SUM(arc_errors)::bigint as arc_errors
+FROM groups
+GROUP BY machine_id;
+"""
+
+# Error types built as in /errors, so timestamps serialize the same way
+FLEET_ERROR_TYPES_SQL = f"""
+SELECT 
+    machine_id,
+    json_build_object(
+        'code', error_code,
+        'text', error_text,
+        'level', error_level,
+        'count', COUNT(*),
+        'last', MAX(time)
+    ) as error_type
+FROM {{source}}
+WHERE time >= %(start)s
+AND error_code IS NOT NULL
+AND {FLEET_MACHINE_FILTER}
+GROUP BY machine_id, error_code, error_text, error_level
+ORDER BY machine_id, COUNT(*) DESC;
+"""
+
+# machine_data columns read by each of the queries above
+FLEET_STATISTICS_COLUMNS = ['material', 'gas_type', 'cutting_speed', 'current', 'scrap_cut',
+                            'error_code', 'arc_error']
+FLEET_ERROR_TYPES_COLUMNS = ['error_code', 'error_text', 'error_level']
+
+def _requested_machines():
+    """Machine ids from ?machines=a,b,c or a JSON body {"machines": [...]}; None for all"""
+    machines = request.args.get('machines', 'all')
+    if request.method == 'POST':
+        machines = (request.get_json(silent=True) or {}).get('machines', 'all')
+    if machines == 'all':
+        return None
+    if isinstance(machines, str):
+        machines = machines.split(',')
+    if not isinstance(machines, list) or not all(isinstance(m, str) for m in machines):
+        raise ValueError("machines must be 'all' or a list of machine ids")
+    return list(dict.fromkeys(m.strip() for m in machines if m.strip()))
+
+def _fleet_sections(cur, machine_ids, start_time):
+    """OEE, status summary, errors and statistics per machine from set-based queries"""
+    params = {'machine_ids': machine_ids, 'start': start_time}
+    if machine_ids is None:
+        machine_ids = [row['machine_id'] for row in latest_cache.all()]
+    sections = {
+        machine_id: {
+            'oee': {'oee': 0.0, 'availability': 0.0, 'performance': 0.0, 'quality': 100.0},
+            'status_summary': {},
+            'errors': {'totalErrors': 0, 'arcErrors': 0, 'errorRate': 0, 'errorTypes': []},
+            'statistics': dict(EMPTY_STATISTICS)
+        }
+        for machine_id in machine_ids
+    }
+
+    stats_query, stats_params = oee_stats_query(cur, start_time, machine_ids=params['machine_ids'])
+    cur.execute(sql.SQL("""
+        WITH machine_stats AS ({stats})
+        SELECT machine_id, {columns}
+        FROM machine_stats;
+    """).format(stats=stats_query, columns=sql.SQL(MACHINE_OEE_COLUMNS)), stats_params)
+    for row in cur.fetchall():
+        if row['machine_id'] in sections:
+            sections[row['machine_id']]['oee'] = {
+                'oee': float(row['oee']),
+                'availability': float(row['availability']),
+                'performance': float(row['performance']),
+                'quality': float(row['quality'])
+            }
+
+    if table_exists_cached(cur, INTERVALS_TABLE):
+        cur.execute(FLEET_STATUS_SUMMARY_SQL, params)
+    else:
+        source = machine_data_source(cur, start_time, ['state'])
+        cur.execute(FLEET_STATUS_SUMMARY_RAW_SQL.format(source=source), params)
+    for row in cur.fetchall():
+        if row['machine_id'] in sections:
+            sections[row['machine_id']]['status_summary'][row['state']] = float(row['total_duration'] or 0.0)
+
+    source = machine_data_source(cur, start_time, FLEET_STATISTICS_COLUMNS)
+    cur.execute(FLEET_STATISTICS_SQL.format(source=source), params)
+    for row in cur.fetchall():
+        section = sections.get(row['machine_id'])
+        if section is None:
+            continue
+        section['statistics'] = {'total_records': row['total_records'],
+                                 **{f: row[f] for f in STATISTICS_FIELDS}}
+        errors = section['errors']
+        errors['totalErrors'] = row['total_errors']
+        errors['arcErrors'] = row['arc_errors']
+        errors['errorRate'] = round(row['total_errors'] / row['total_records'] * 100, 2)
+
+    source = machine_data_source(cur, start_time, FLEET_ERROR_TYPES_COLUMNS)
+    cur.execute(FLEET_ERROR_TYPES_SQL.format(source=source), params)
+    for row in cur.fetchall():
+        if row['machine_id'] in sections:
+            sections[row['machine_id']]['errors']['errorTypes'].append(row['error_type'])
+    return sections
+
+@app.route('/api/fleet/summary', methods=['GET', 'POST'])
+@cached_response('fleet-summary')
+@coalesced('fleet-summary')
+def get_fleet_summary():
+    """OEE, status summary, errors and statistics for many machines at once.
+
+    ``?machines=all`` (default) or ``?machines=a,b,c``; long lists can be
+    POSTed as ``{"machines": [...]}``. ``range`` is a query parameter in
+    both cases. Every section comes from one set-based query grouped by
+    machine_id, so the cost hardly depends on how many machines are asked for.
+    """
+    try:
+        time_range = request.args.get('range', '24h')
+        start_time = parse_time_range(time_range)
+        machine_ids = _requested_machines()
+        
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        machines = _fleet_sections(cur, machine_ids, start_time)
+        
+        cur.close()
+        release_db_connection(conn)
+        
+        return jsonify({
+            'success': True,
+            'machines': machines,
+            'count': len(machines),
+            'time_range': time_range
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in get_fleet_summary: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 # ============================================================
 # RUN SERVER
 # ============================================================
@@ -0,0 +1,352 @@
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import ARCHIVE_CONFIG
+from db import (get_connection, has_timescale, list_machine_ids, release_connection,
+                table_exists_cached)
+from export import EXPORT_COLUMNS
+from partitions import is_partitioned, list_partitions
+
+# ============================================================
+#  COLD-TIER ARCHIVE
+# ============================================================
+# With TimescaleDB old chunks are compressed in place, segmented by machine.
+# Without it, closed UTC days older than ``after_days`` move out of
+# machine_data into machine_data_cold the same way: one row per machine and
+# hour holding an array per column, sorted by time and TOAST-compressed.
+# Queries read both through machine_data_source(), which unnests only the
+# segments and columns they need, so they keep their SQL and nothing is
+# copied per request; export.py still writes Parquet of any window on
+# demand. Archived days are cataloged here. Rows written into a day after
+# it was archived simply stay in machine_data.
+# Rollups and state intervals already made for archived days are kept,
+# but a full rebuild_state_intervals() only sees what is left in
+# machine_data.
+ARCHIVE_TABLE = "machine_data_archive"
+COLD_TABLE = "machine_data_cold"
+
+# Postgres types of the EXPORT_COLUMNS Arrow types
+_PG_TYPES = {
+    'timestamp': 'TIMESTAMPTZ', 'string': 'TEXT', 'float64': 'DOUBLE PRECISION',
+    'bool': 'BOOLEAN', 'int32': 'INTEGER'
+}
+# Columns stored as arrays; machine_id is the segment key
+_COLD_COLUMNS = [(name, _PG_TYPES[kind]) for name, kind in EXPORT_COLUMNS if name != 'machine_id']
+
+_DAY = timedelta(days=1)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def create_archive_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+            range_start TIMESTAMPTZ PRIMARY KEY,
+            range_end TIMESTAMPTZ NOT NULL,
+            rows BIGINT NOT NULL,
+            bytes BIGINT NOT NULL,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    arrays = ",\n".join(f"{name} {pg_type}[]" for name, pg_type in _COLD_COLUMNS)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {COLD_TABLE} (
+            machine_id TEXT NOT NULL,
+            segment_start TIMESTAMPTZ NOT NULL,
+            last_time TIMESTAMPTZ NOT NULL,
+            rows INTEGER NOT NULL,
+            {arrays},
+            PRIMARY KEY (machine_id, segment_start)
+        );
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{COLD_TABLE}_last
+        ON {COLD_TABLE} (machine_id, last_time);
+    """)
+
+def archive_table_exists(cur):
+    with cur.connection.cursor() as plain:
+        plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (ARCHIVE_TABLE,))
+        return plain.fetchone()[0]
+
+# ---------- reading ----------
+def archived_since(cur, start, end=None):
+    """True if archived days hold rows at or after ``start`` (and before ``end``)"""
+    if not table_exists_cached(cur, ARCHIVE_TABLE):
+        return False
+    with cur.connection.cursor() as plain:
+        plain.execute(f"""
+            SELECT EXISTS (
+                SELECT 1 FROM {ARCHIVE_TABLE}
+                WHERE range_end > %s AND (%s::timestamptz IS NULL OR range_start < %s)
+            );
+        """, (start, end, end))
+        return plain.fetchone()[0]
+
+def machine_data_source(cur, start, columns=None, end=None):
+    """Relation to select machine_data rows from ``start`` on, archived ones included.
+
+    Plain ``machine_data`` unless archived days overlap [start, end). Then
+    it is machine_data UNION ALL the unnested cold segments overlapping
+    that window (only ``columns``, plus time and machine_id; others read
+    as NULL), under the name machine_data, so a query's ``FROM
+    machine_data`` can be swapped for it unchanged. Every listed column is
+    unnested whether the query uses it or not, so pass only the ones it
+    reads. ``end`` only prunes segments; the query's own machine_id and
+    time conditions are pushed down into both sides by the planner.
+    """
+    if start.tzinfo is None:
+        start = start.astimezone()
+    if not archived_since(cur, start, end):
+        return "machine_data"
+
+    names = [name for name, _ in _COLD_COLUMNS if columns is None or name in columns or name == 'time']
+    selected = [
+        "c.machine_id" if name == 'machine_id'
+        else f"u.{name}" if name in names
+        else f"NULL::{_PG_TYPES[kind]} AS {name}"
+        for name, kind in EXPORT_COLUMNS
+    ]
+    # Literal bounds, since callers use either parameter style
+    with cur.connection.cursor() as plain:
+        bounds = plain.mogrify("c.last_time >= %s", (start,)).decode()
+        if end is not None:
+            bounds += plain.mogrify(" AND c.segment_start < %s", (end,)).decode()
+    return f"""(
+        SELECT * FROM machine_data
+        UNION ALL
+        SELECT {', '.join(selected)}
+        FROM {COLD_TABLE} c
+        CROSS JOIN LATERAL (SELECT {', '.join(f'unnest(c.{name}) AS {name}' for name in names)}) AS u
+        WHERE {bounds}
+    ) AS machine_data"""
+
+def first_archived_time(cur, machine_id, start):
+    """Oldest archived sample of ``machine_id`` at or after ``start``, or None.
+
+    A machine's segments don't overlap, so it is in the first one reaching
+    ``start`` and only that one is unnested.
+    """
+    if start.tzinfo is None:
+        start = start.astimezone()
+    if not archived_since(cur, start):
+        return None
+    with cur.connection.cursor() as plain:
+        plain.execute(f"""
+            SELECT (SELECT MIN(t) FROM unnest(c.time) AS t WHERE t >= %s)
+            FROM {COLD_TABLE} c
+            WHERE c.machine_id = %s AND c.last_time >= %s
+            ORDER BY c.last_time
+            LIMIT 1;
+        """, (start, machine_id, start))
+        row = plain.fetchone()
+    return row[0] if row else None
+
+# ---------- archiving ----------
+def _oldest_time(cur):
+    """Oldest row in machine_data, one idx_machine_time probe per machine"""
+    cur.execute("""
+        SELECT MIN(first.time)
+        FROM unnest(%s::text[]) AS m(machine_id)
+        CROSS JOIN LATERAL (
+            SELECT time FROM machine_data d
+            WHERE d.machine_id = m.machine_id
+            ORDER BY time ASC
+            LIMIT 1
+        ) first;
+    """, (list_machine_ids(cur),))
+    return cur.fetchone()[0]
+
+def _remove_range(cur, start, end, machine_ids):
+    """Delete machine_data rows of [start, end) in the caller's transaction.
+
+    A native partition covering exactly that range is dropped instead.
+    Returns the number of rows removed.
+    """
+    if is_partitioned(cur):
+        for name, lower, upper in list_partitions(cur):
+            if lower == start and upper == end:
+                cur.execute(f"SELECT COUNT(*) FROM {name};")
+                rows = cur.fetchone()[0]
+                cur.execute(f"DROP TABLE {name};")
+                return rows
+    removed = 0
+    for machine_id in machine_ids:
+        cur.execute("""
+            DELETE FROM machine_data
+            WHERE machine_id = %s AND time >= %s AND time < %s;
+        """, (machine_id, start, end))
+        removed += cur.rowcount
+    return removed
+
+def _segment_range(cur, start, end):
+    """Pack machine_data rows of [start, end) into cold segments, one per
+    machine and UTC hour, in the caller's transaction.
+
+    Returns the number of rows packed and the machines they belong to.
+    """
+    arrays = ",\n".join(f"array_agg({name} ORDER BY time)" for name, _ in _COLD_COLUMNS)
+    cur.execute(f"""
+        INSERT INTO {COLD_TABLE}
+            (machine_id, segment_start, last_time, rows, {', '.join(name for name, _ in _COLD_COLUMNS)})
+        SELECT machine_id,
+               date_trunc('hour', time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+               MAX(time),
+               COUNT(*),
+               {arrays}
+        FROM machine_data
+        WHERE time >= %s AND time < %s
+        GROUP BY 1, 2
+        RETURNING machine_id, rows;
+    """, (start, end))
+    segments = cur.fetchall()
+    return sum(rows for _, rows in segments), sorted({machine_id for machine_id, _ in segments})
+
+def _segment_bytes(cur, start, end):
+    """Stored (compressed) size of the cold segments of [start, end)"""
+    sizes = " + ".join(f"pg_column_size({name})" for name, _ in _COLD_COLUMNS)
+    cur.execute(f"""
+        SELECT COALESCE(SUM({sizes}), 0)
+        FROM {COLD_TABLE}
+        WHERE segment_start >= %s AND segment_start < %s;
+    """, (start, end))
+    return cur.fetchone()[0]
+
+def archive_day(start):
+    """Move one UTC day of machine_data into cold segments.
+
+    In one transaction the day's rows are packed into segments, deleted
+    and cataloged; that is rolled back if the counts disagree, e.g.
+    because rows arrived meanwhile. Returns a stats dict, or None when
+    rolled back.
+    """
+    end = start + _DAY
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        packed, machine_ids = _segment_range(cur, start, end)
+        removed = _remove_range(cur, start, end, machine_ids)
+        if removed != packed:
+            conn.rollback()
+            print(f"⚠️ {start:%Y-%m-%d}: packed {packed:,} rows but {removed:,} to remove; "
+                  f"left in machine_data, retry later")
+            return None
+        size = _segment_bytes(cur, start, end)
+        cur.execute(f"""
+            INSERT INTO {ARCHIVE_TABLE} (range_start, range_end, rows, bytes)
+            VALUES (%s, %s, %s, %s);
+        """, (start, end, packed, size))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+    return {'day': start, 'rows': packed, 'bytes': size}
+
+def archive_old_data(after_days=None):
+    """Archive every closed UTC day older than ``after_days`` not archived yet.
+
+    Days are processed oldest first, each in its own transaction, so an
+    interrupted run just continues with the next day. Returns per-day stats.
+    """
+    after_days = ARCHIVE_CONFIG['after_days'] if after_days is None else after_days
+    cutoff = _EPOCH + (datetime.now(timezone.utc) - timedelta(days=after_days) - _EPOCH) // _DAY * _DAY
+
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        create_archive_table(cur)
+        cur.execute(f"SELECT range_start FROM {ARCHIVE_TABLE};")
+        archived = {row[0] for row in cur.fetchall()}
+        oldest = _oldest_time(cur)
+        conn.commit()
+    finally:
+        cur.close()
+        release_connection(conn)
+    if oldest is None or oldest >= cutoff:
+        print("ℹ️ Nothing old enough to archive")
+        return []
+
+    results = []
+    day = _EPOCH + (oldest - _EPOCH) // _DAY * _DAY
+    while day < cutoff:
+        if day not in archived:
+            started = time.perf_counter()
+            result = archive_day(day)
+            if result is not None:
+                results.append(result)
+                print(f"🗄️ {day:%Y-%m-%d}: {result['rows']:,} rows archived, "
+                      f"{result['bytes'] / 1e6:.1f}MB in {time.perf_counter() - started:.1f}s")
+        day += _DAY
+    return results
+
+def prune_archive(cur, cutoff):
+    """Forget archived data lying entirely before ``cutoff`` (see db.cleanup_old_data).
+
+    Cold segments and catalog rows are deleted in the caller's
+    transaction; returns the number of segments deleted.
+    """
+    if not archive_table_exists(cur):
+        return 0
+    with cur.connection.cursor() as plain:
+        plain.execute(f"DELETE FROM {COLD_TABLE} WHERE last_time < %s;", (cutoff,))
+        segments = plain.rowcount
+        plain.execute(f"DELETE FROM {ARCHIVE_TABLE} WHERE range_end <= %s;", (cutoff,))
+        return segments
+
+def enable_compression(after_days=None):
+    """TimescaleDB: compress chunks older than ``after_days``, segmented by machine.
+
+    Segmenting by machine_id keeps each machine's rows together, so
+    per-machine range queries only decompress their own segments.
+    """
+    after_days = ARCHIVE_CONFIG['after_days'] if after_days is None else after_days
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            ALTER TABLE machine_data SET (
+                timescaledb.compress,
+                timescaledb.compress_segmentby = 'machine_id',
+                timescaledb.compress_orderby = 'time DESC'
+            );
+        """)
+        cur.execute("SELECT add_compression_policy('machine_data', %s, if_not_exists => TRUE);",
+                    (timedelta(days=after_days),))
+        conn.commit()
+        print(f"🗜️ Compression enabled for chunks older than {after_days} days")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error enabling compression: {e}")
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def run_tiering(after_days=None):
+    """Compression on TimescaleDB, cold segments otherwise"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            timescale = has_timescale(cur)
+        conn.rollback()
+    finally:
+        release_connection(conn)
+    if timescale:
+        enable_compression(after_days)
+        return []
+    return archive_old_data(after_days)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress or archive old machine_data")
+    parser.add_argument("--after-days", type=float, default=ARCHIVE_CONFIG['after_days'],
+                        help="keep this many days uncompressed / in machine_data")
+    args = parser.parse_args()
+
+    results = run_tiering(args.after_days)
+    if results:
+        rows = sum(r['rows'] for r in results)
+        size = sum(r['bytes'] for r in results)
+        print(f"🗄️ Archived {len(results)} days, {rows:,} rows, {size / 1e6:.1f}MB")
@@ -0,0 +1,131 @@
+import argparse
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from batch_generator import FleetSimulator
+from db import bulk_insert_machine_data, notify_latest
+
+# ============================================================
+#  HISTORICAL BACKFILL
+# ============================================================
+def _simulated_ticks(start, end, interval, seed=None):
+    """Simulated clock: same cadence and jitter as run_continuous_generation"""
+    jitter = random.Random(seed)
+    current = start
+    while current < end:
+        yield current
+        current += timedelta(seconds=interval + jitter.uniform(-0.2, 0.5))
+
+def _insert_worker(batches, stats, method, copy_format):
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        try:
+            result = bulk_insert_machine_data(
+                batch, method=method, copy_format=copy_format, batch_size=len(batch),
+                notify=False
+            )
+            stats['inserted'] += result['rows']
+            stats['insert_seconds'] += result['seconds']
+        except Exception as e:
+            stats['failed'] += len(batch)
+            print(f"❌ Backfill batch of {len(batch)} rows failed: {e}")
+
+def run_backfill(machine_ids, start, end, interval=2, batch_size=20000,
+                 method="copy", copy_format="binary", dry_run=False, seed=None):
+    """Synthesize machine_data for [start, end) at maximum speed.
+
+    Uses FleetSimulator on a simulated clock instead of wall-clock sleeps and
+    writes through bulk_insert_machine_data() on a background thread, so
+    generation and inserts overlap. Naive ``start``/``end`` are taken as UTC.
+    A ``seed`` makes the data and the simulated clock reproducible.
+    Batches skip NOTIFY; one summary notification is sent at the end.
+    Returns a stats dict with generated/inserted rows and rows per second.
+    """
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+
+    fleet = FleetSimulator(machine_ids, seed=seed)
+    stats = {'generated': 0, 'inserted': 0, 'failed': 0,
+             'generate_seconds': 0.0, 'insert_seconds': 0.0}
+    batches = queue.Queue(maxsize=4)
+    inserter = None
+    if not dry_run:
+        inserter = threading.Thread(
+            target=_insert_worker, args=(batches, stats, method, copy_format), daemon=True
+        )
+        inserter.start()
+
+    print(f"Backfilling {len(machine_ids)} machines from {start.isoformat()} to {end.isoformat()}")
+    started = time.perf_counter()
+    last_report = started
+    pending = []
+
+    for tick_time in _simulated_ticks(start, end, interval, seed):
+        tick_started = time.perf_counter()
+        pending.extend(fleet.to_rows(fleet.step(), tick_time))
+        stats['generate_seconds'] += time.perf_counter() - tick_started
+
+        if len(pending) >= batch_size:
+            stats['generated'] += len(pending)
+            if not dry_run:
+                batches.put(pending)
+            pending = []
+
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                last_report = now
+                progress = (tick_time - start) / (end - start) * 100
+                print(f"  {progress:5.1f}% | simulated {tick_time:%Y-%m-%d %H:%M} | "
+                      f"{stats['generated']:,} generated | {stats['inserted']:,} inserted")
+
+    if pending:
+        stats['generated'] += len(pending)
+        if not dry_run:
+            batches.put(pending)
+    if inserter:
+        batches.put(None)
+        inserter.join()
+        if stats['inserted']:
+            notify_latest(machine_ids)
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 2)
+    stats['generated_per_sec'] = round(stats['generated'] / stats['generate_seconds'], 1) if stats['generate_seconds'] else 0.0
+    stats['inserted_per_sec'] = round(stats['inserted'] / stats['insert_seconds'], 1) if stats['insert_seconds'] else 0.0
+    stats['overall_per_sec'] = round(stats['generated'] / elapsed, 1) if elapsed else 0.0
+
+    print(f"✅ Backfill complete in {elapsed:.1f}s")
+    print(f"   Generated: {stats['generated']:,} rows ({stats['generated_per_sec']:,.0f} rows/sec)")
+    print(f"   Inserted:  {stats['inserted']:,} rows ({stats['inserted_per_sec']:,.0f} rows/sec)")
+    if stats['failed']:
+        print(f"   Failed:    {stats['failed']:,} rows")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill historical CNC machine data")
+    parser.add_argument("--machines", type=int, default=3, help="number of machines (machine_1..N)")
+    parser.add_argument("--days", type=float, default=30, help="window length ending now")
+    parser.add_argument("--start", help="window start (ISO 8601, overrides --days)")
+    parser.add_argument("--end", help="window end (ISO 8601, default now)")
+    parser.add_argument("--interval", type=float, default=2, help="simulated seconds between samples")
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--method", choices=["copy", "values"], default="copy")
+    parser.add_argument("--format", choices=["text", "binary"], default="binary")
+    parser.add_argument("--dry-run", action="store_true", help="generate only, do not insert")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible data")
+    args = parser.parse_args()
+
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now(timezone.utc)
+    start = datetime.fromisoformat(args.start) if args.start else end - timedelta(days=args.days)
+    machine_ids = [f"machine_{i}" for i in range(1, args.machines + 1)]
+
+    run_backfill(machine_ids, start, end, interval=args.interval, batch_size=args.batch_size,
+                 method=args.method, copy_format=args.format, dry_run=args.dry_run,
+                 seed=args.seed)
@@ -0,0 +1,346 @@
+import hashlib
+import time
+import numpy as np
+from collections import Counter
+from faker.providers.lorem.en_US import Provider as LoremProvider
+from db import MACHINE_DATA_COLUMNS
+from generator import (
+    PARAMETER_RANGES, STATES, PROGRAM_STATES, TECHNOLOGY_NAMES, MATERIALS,
+    GAS_TYPES, TECHNOLOGY_DATASETS, ERROR_MESSAGES,
+    generate_multiple_machines, machine_states
+)
+
+# ============================================================
+#  VECTORIZED FLEET SIMULATOR
+# ============================================================
+# Same vocabulary fake.word() draws from, upper-cased like generate_random_parameters
+ERROR_PARAMETERS = [w.upper() for w in LoremProvider.word_list]
+
+# Categorical columns are emitted as integer codes into these label lists;
+# code -1 means NULL.
+CATEGORIES = {
+    'state': STATES,
+    'program_state': PROGRAM_STATES,
+    'technology_name': TECHNOLOGY_NAMES,
+    'technology_dataset': TECHNOLOGY_DATASETS,
+    'material': MATERIALS,
+    'gas_type': GAS_TYPES,
+    'error_text': ERROR_MESSAGES,
+    'error_parameter': ERROR_PARAMETERS
+}
+
+IDLE, RUNNING, ERROR, STOPPED = (STATES.index(s) for s in ('Idle', 'Running', 'Error', 'Stopped'))
+READY, ACTIVE, PAUSED, COMPLETE, PROGRAM_ERROR = (
+    PROGRAM_STATES.index(s) for s in ('READY', 'ACTIVE', 'PAUSED', 'COMPLETE', 'ERROR')
+)
+LASER_CUT, PLASMA_CUT, DRILLING, MARKING = (
+    TECHNOLOGY_NAMES.index(t) for t in ('LASER_CUT', 'PLASMA_CUT', 'DRILLING', 'MARKING')
+)
+
+# One uniform draw per machine per tick for each of these, in this order
+DRAWS = [
+    'stay', 'error', 'leave', 'spontaneous_error', 'program_state',
+    'technology_name', 'technology_index', 'material', 'thickness',
+    'cutting_speed', 'current', 'drilling', 'drilling_depth', 'arc',
+    'arc_ignite', 'arc_error', 'homing', 'homed', 'error_code',
+    'error_text', 'error_parameter', 'error_level', 'override_flag',
+    'technology_dataset', 'gas_type', 'scrap_cut', 'din_file_name'
+]
+_D = {name: i for i, name in enumerate(DRAWS)}
+
+_LABELS = {
+    # Trailing None so that code -1 decodes to NULL
+    column: np.array(list(labels) + [None], dtype=object)
+    for column, labels in CATEGORIES.items()
+}
+
+
+def _randint(u, low, high):
+    """Vectorized random.randint(low, high) from uniforms in [0, 1)"""
+    return low + np.floor(u * (high - low + 1)).astype(np.int32)
+
+
+def _uniform(u, low, high):
+    return low + u * (high - low)
+
+
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def _mix64(x):
+    """splitmix64 finalizer over uint64 arrays (wrapping arithmetic)"""
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * _MIX_1
+        x = (x ^ (x >> np.uint64(27))) * _MIX_2
+        return x ^ (x >> np.uint64(31))
+
+def machine_key(machine_id):
+    """Stable 64-bit key for a machine id, independent of process and shard"""
+    return int.from_bytes(hashlib.blake2b(str(machine_id).encode(), digest_size=8).digest(), 'little')
+
+def seeded_uniforms(seed, keys, tick, n_draws):
+    """Counter-based uniforms in [0, 1) for (seed, machine key, tick, draw).
+
+    Every machine gets an independent stream that depends only on its own
+    key, so splitting a fleet across shards does not change its output.
+    """
+    seed_word = np.array([seed & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64)
+    tick_key = _mix64(seed_word ^ _mix64(np.array([tick], dtype=np.uint64)))
+    with np.errstate(over='ignore'):
+        draw_keys = _mix64(tick_key + np.arange(1, n_draws + 1, dtype=np.uint64) * _GOLDEN)
+        bits = _mix64(keys[:, None] + draw_keys[None, :])
+    return (bits >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def columns_to_rows(machine_ids, columns, timestamp):
+    """Decode step() columns into tuples in MACHINE_DATA_COLUMNS order.
+
+    ``machine_ids`` has one entry per row and ``timestamp`` is a single
+    datetime or one per row. Works on one tick or many ticks concatenated.
+    """
+    n = len(machine_ids)
+    if not n:
+        return []
+    decoded = {
+        'time': list(timestamp) if isinstance(timestamp, (list, tuple, np.ndarray)) else [timestamp] * n,
+        'machine_id': list(machine_ids),
+        'din_file_name': [f"program_{number}.din" for number in columns['din_file_name'].tolist()]
+    }
+    error_code = columns['error_code']
+    decoded['error_code'] = np.where(
+        error_code >= 0, error_code.astype(object), None
+    ).tolist()
+    for column, labels in _LABELS.items():
+        decoded[column] = labels[columns[column]].tolist()
+    for column in MACHINE_DATA_COLUMNS:
+        if column not in decoded:
+            decoded[column] = columns[column].tolist()
+    return list(zip(*(decoded[c] for c in MACHINE_DATA_COLUMNS)))
+
+
+class FleetSimulator:
+    """Generates one tick for a whole fleet with NumPy array operations.
+
+    Holds per-machine state, state duration and error probability in arrays
+    and reproduces the transition rules of get_realistic_state_transition()
+    and the parameter distributions of generate_random_parameters(), so the
+    output is statistically equivalent to the per-record generator.
+
+    With a ``seed`` every machine draws from its own counter-based stream
+    keyed by (seed, machine id, tick), so runs are reproducible and a
+    machine produces the same data whichever shard simulates it.
+    """
+
+    def __init__(self, machine_ids, error_probability=0.0015, seed=None):
+        self.machine_ids = list(machine_ids)
+        n = len(self.machine_ids)
+        self.state = np.full(n, IDLE, dtype=np.int8)
+        self.state_duration = np.zeros(n, dtype=np.int32)
+        self.error_probability = np.full(n, error_probability)
+        self.ticks = 0
+        self.seed = seed
+        self._rng = np.random.default_rng()
+        self._keys = np.array([machine_key(m) for m in self.machine_ids], dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.machine_ids)
+
+    def _uniforms(self):
+        if self.seed is None:
+            return self._rng.random((len(self), len(DRAWS)))
+        return seeded_uniforms(self.seed, self._keys, self.ticks, len(DRAWS))
+
+    def _transition(self, u):
+        state = self.state
+        duration = self.state_duration + 1
+        stay, error, leave = u[:, _D['stay']], u[:, _D['error']], u[:, _D['leave']]
+
+        from_running = np.where(
+            stay < 0.85, RUNNING,
+            np.where(error < self.error_probability, ERROR,
+                     np.where(leave < 0.3, IDLE, STOPPED))
+        )
+        from_idle = np.where(
+            (stay < 0.4) & (duration > 3), RUNNING,
+            np.where(error < 0.1, STOPPED, IDLE)
+        )
+        from_error = np.where(duration > 5, IDLE, ERROR)
+        from_stopped = np.where(duration > 2, IDLE, STOPPED)
+
+        new_state = np.select(
+            [state == RUNNING, state == IDLE, state == ERROR, state == STOPPED],
+            [from_running, from_idle, from_error, from_stopped],
+            default=IDLE
+        ).astype(np.int8)
+
+        duration[new_state != state] = 0
+        self.state = new_state
+        self.state_duration = duration
+        return new_state
+
+    def step(self):
+        """Advance every machine one tick and return columnar arrays.
+
+        Categorical columns (see CATEGORIES) are integer codes, error_code is
+        -1 where NULL and din_file_name is the program number.
+        """
+        u = self._uniforms()
+        state = self._transition(u)
+        running = state == RUNNING
+        idle = state == IDLE
+        has_error = (state == ERROR) | (u[:, _D['spontaneous_error']] < 0.02)
+
+        program_u = u[:, _D['program_state']]
+        program_state = np.select(
+            [running, state == ERROR, idle],
+            [np.where(program_u < 0.75, ACTIVE, PAUSED),
+             PROGRAM_ERROR,
+             np.where(program_u < 0.5, READY, COMPLETE)],
+            default=READY
+        ).astype(np.int8)
+
+        technology = _randint(u[:, _D['technology_name']], 0, len(TECHNOLOGY_NAMES) - 1)
+        thickness = np.round(_uniform(u[:, _D['thickness']], *PARAMETER_RANGES['thickness']), 1)
+
+        speed_factor = np.maximum(0.4, 1 - thickness / 25)
+        base_speed = _uniform(u[:, _D['cutting_speed']], *PARAMETER_RANGES['cutting_speed'])
+        cutting_speed = np.where(running, np.round(base_speed * speed_factor, 1), 0.0)
+
+        current_u = u[:, _D['current']]
+        plasma_base = 30 + thickness * 3
+        plasma_low = np.maximum(30, plasma_base - 15)
+        plasma_high = np.minimum(150, plasma_base + 15)
+        current = np.select(
+            [technology == LASER_CUT, technology == PLASMA_CUT, technology == MARKING],
+            [_uniform(current_u, 10, 80),
+             _uniform(current_u, plasma_low, plasma_high),
+             _uniform(current_u, 5, 30)],
+            default=_uniform(current_u, 10, 60)
+        )
+        current = np.where(running, np.round(current, 2), 0.0)
+
+        is_drilling = running & (technology == DRILLING)
+        drilling = np.where(
+            is_drilling,
+            np.round(_uniform(u[:, _D['drilling']], *PARAMETER_RANGES['drilling']), 1), 0.0
+        )
+        drilling_depth = np.where(
+            is_drilling,
+            np.round(_uniform(u[:, _D['drilling_depth']], *PARAMETER_RANGES['drilling_depth']), 1), 0.0
+        )
+
+        arc_active = running & ((technology == LASER_CUT) | (technology == PLASMA_CUT))
+        homing = idle & (u[:, _D['homing']] < 0.1)
+
+        no_error = np.int32(-1)
+        error_code = np.where(
+            has_error, _randint(u[:, _D['error_code']], *PARAMETER_RANGES['error_code']), no_error
+        )
+        error_text = np.where(
+            has_error, _randint(u[:, _D['error_text']], 0, len(ERROR_MESSAGES) - 1), no_error
+        )
+        error_parameter = np.where(
+            has_error, _randint(u[:, _D['error_parameter']], 0, len(ERROR_PARAMETERS) - 1), no_error
+        )
+        error_level = np.where(has_error, _randint(u[:, _D['error_level']], 1, 5), 0)
+
+        self.ticks += 1
+        return {
+            'state': state,
+            'program_state': program_state,
+            'current': current,
+            'drilling': drilling,
+            'cutting_speed': cutting_speed,
+            'override_flag': u[:, _D['override_flag']] < 0.5,
+            'homing': homing,
+            'homed': ~homing & (u[:, _D['homed']] < 0.75),
+            'technology_name': technology,
+            'technology_index': _randint(u[:, _D['technology_index']], *PARAMETER_RANGES['technology_index']),
+            'technology_dataset': _randint(u[:, _D['technology_dataset']], 0, len(TECHNOLOGY_DATASETS) - 1),
+            'material': _randint(u[:, _D['material']], 0, len(MATERIALS) - 1),
+            'thickness': thickness,
+            'gas_type': _randint(u[:, _D['gas_type']], 0, len(GAS_TYPES) - 1),
+            'arc': arc_active & (u[:, _D['arc']] < 0.5),
+            'arc_ignite': arc_active & (u[:, _D['arc_ignite']] < 0.5),
+            'drilling_depth': drilling_depth,
+            'scrap_cut': u[:, _D['scrap_cut']] < 0.05,
+            'din_file_name': _randint(u[:, _D['din_file_name']], 1000, 9999),
+            'arc_error': has_error & (u[:, _D['arc_error']] < 0.3),
+            'error_code': error_code,
+            'error_text': error_text,
+            'error_parameter': error_parameter,
+            'error_level': error_level
+        }
+
+    def to_rows(self, columns, timestamp):
+        """Decode a step() result into tuples in MACHINE_DATA_COLUMNS order.
+
+        ``timestamp`` is one datetime for the whole tick or a sequence with
+        one datetime per machine. The rows can be passed straight to
+        bulk_insert_machine_data().
+        """
+        return columns_to_rows(self.machine_ids, columns, timestamp)
+
+    def to_records(self, columns, timestamp):
+        """Like to_rows() but as dicts, matching generate_random_parameters()"""
+        return [dict(zip(MACHINE_DATA_COLUMNS, row)) for row in self.to_rows(columns, timestamp)]
+
+
+# ============================================================
+#  BENCHMARK
+# ============================================================
+def _summarize(records):
+    """Distribution summary used to compare the two engines"""
+    n = len(records)
+    states = Counter(r['state'] for r in records)
+    running = [r for r in records if r['state'] == 'Running']
+    return {
+        'state_share': {s: round(states.get(s, 0) / n, 4) for s in STATES},
+        'error_rate': round(sum(r['error_code'] is not None for r in records) / n, 4),
+        'avg_running_speed': round(float(np.mean([r['cutting_speed'] for r in running])), 2) if running else 0.0,
+        'avg_running_current': round(float(np.mean([r['current'] for r in running])), 2) if running else 0.0,
+    }
+
+def benchmark(n_machines=10000, ticks=20, warmup=10):
+    """Compare per-record generation with FleetSimulator at fleet scale"""
+    from datetime import datetime, timezone
+
+    machine_ids = [f"bench_{i}" for i in range(n_machines)]
+
+    for _ in range(warmup):
+        generate_multiple_machines(machine_ids)
+    legacy_records = []
+    started = time.perf_counter()
+    for _ in range(ticks):
+        legacy_records.extend(generate_multiple_machines(machine_ids))
+    legacy_seconds = time.perf_counter() - started
+    for mid in machine_ids:
+        machine_states.pop(mid, None)
+
+    fleet = FleetSimulator(machine_ids)
+    for _ in range(warmup):
+        fleet.step()
+    batch_rows = []
+    started = time.perf_counter()
+    for _ in range(ticks):
+        batch_rows.extend(fleet.to_rows(fleet.step(), datetime.now(timezone.utc)))
+    batch_seconds = time.perf_counter() - started
+    batch_records = [dict(zip(MACHINE_DATA_COLUMNS, row)) for row in batch_rows]
+
+    total = n_machines * ticks
+    print(f"{'engine':12s} {'seconds':>9s} {'rows/sec':>12s}")
+    print(f"{'per-record':12s} {legacy_seconds:9.2f} {total / legacy_seconds:12,.0f}")
+    print(f"{'vectorized':12s} {batch_seconds:9.2f} {total / batch_seconds:12,.0f}")
+    print(f"Speed-up: {legacy_seconds / batch_seconds:.1f}x\n")
+    print("Distribution (per-record vs vectorized):")
+    legacy_summary, batch_summary = _summarize(legacy_records), _summarize(batch_records)
+    for key in legacy_summary:
+        print(f"  {key:20s} {legacy_summary[key]}  |  {batch_summary[key]}")
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("Fleet generator benchmark (10k machines)")
+    print("=" * 80)
+    benchmark(n_machines=10000)
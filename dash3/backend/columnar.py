@@ -0,0 +1,110 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ============================================================
+#  COLUMNAR RESPONSES
+# ============================================================
+# Low-cardinality text columns sent as a dictionary plus integer codes
+CATEGORICAL_COLUMNS = {
+    'machine_id', 'state', 'program_state', 'material', 'gas_type',
+    'technology_name', 'technology_dataset', 'din_file_name'
+}
+
+def to_columnar(columns, rows, categorical=CATEGORICAL_COLUMNS):
+    """Column-oriented payload from tuple rows.
+
+    Returns ``{'columns': [...], 'data': {column: [values]},
+    'dictionaries': {column: [distinct values]}}``. Columns listed in
+    ``categorical`` hold indexes into their dictionary instead of the
+    values themselves (None stays None), so repeated strings are sent once.
+    """
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    data = {}
+    dictionaries = {}
+    for column, column_values in zip(columns, values):
+        if column in categorical:
+            codes = {}
+            data[column] = [None if value is None else codes.setdefault(value, len(codes))
+                            for value in column_values]
+            dictionaries[column] = list(codes)
+        else:
+            data[column] = column_values
+    return {'columns': list(columns), 'data': data, 'dictionaries': dictionaries}
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(payload):
+    """JSON bytes for ``payload``; datetimes become ISO 8601, Decimals floats.
+
+    Uses orjson when it is installed (datetimes are handled natively),
+    otherwise the standard library encoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import tracemalloc
+    from flask import Flask
+    from psycopg2.extras import RealDictCursor
+    from db import get_connection, release_connection
+
+    parser = argparse.ArgumentParser(description="Compare row and columnar response encoding")
+    parser.add_argument("--machine", default="machine_1")
+    parser.add_argument("--hours", type=float, default=24 * 7)
+    parser.add_argument("--columns", default="*", help="comma separated, default all")
+    args = parser.parse_args()
+
+    query = f"""
+    SELECT {args.columns}
+    FROM machine_data
+    WHERE machine_id = %s
+    AND time >= now() - %s * INTERVAL '1 hour'
+    ORDER BY time ASC;
+    """
+    flask_json = Flask(__name__).json
+
+    def rows_format(conn):
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(query, (args.machine, args.hours))
+        body = flask_json.dumps({'data': cur.fetchall()})
+        cur.close()
+        return body.encode()
+
+    def columnar_format(conn):
+        cur = conn.cursor()
+        cur.execute(query, (args.machine, args.hours))
+        columns = [column.name for column in cur.description]
+        body = dumps(to_columnar(columns, cur.fetchall()))
+        cur.close()
+        return body
+
+    conn = get_connection()
+    try:
+        for name, build in (('rows (RealDictCursor + jsonify)', rows_format),
+                            ('columnar (tuples + ' + ('orjson' if orjson else 'json') + ')', columnar_format)):
+            build(conn)  # warm the cache
+            started = time.perf_counter()
+            body = build(conn)
+            elapsed = time.perf_counter() - started
+            tracemalloc.start()
+            build(conn)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:40s} {elapsed:7.3f}s  peak {peak / 1e6:7.1f}MB  body {len(body) / 1e6:7.1f}MB")
+    finally:
+        release_connection(conn)
@@ -5,3 +5,99 @@ DB_CONFIG = {
     "user": "postgres",
     "password": "sam123"  # Replace with actual password
 }
+
+# Shared connection pool used by the API and the ingest helpers in db.py
+POOL_CONFIG = {
+    "minconn": 2,
+    "maxconn": 20,
+    "checkout_timeout": 5.0,     # seconds to wait for a free connection
+    "max_lifetime": 1800,        # recycle connections older than this (seconds)
+    "health_check_idle": 30      # ping connections idle longer than this (seconds)
+}
+
+# Latest-row snapshot behind /api/machines and /realtime
+LATEST_CACHE_CONFIG = {
+    "max_age": 2.0,              # reload the snapshot when older than this (seconds)
+    "max_stale": 30.0,           # keep serving the old snapshot this long if reloads fail
+    "min_age": 0.25              # after a change notification, reload once this old (seconds)
+}
+
+# Server-Sent Events push stream (/api/stream, /api/machines/<id>/stream)
+STREAM_CONFIG = {
+    "max_queue": 256,            # events buffered per client before it is dropped
+    "poll_interval": 1.0,        # seconds between upstream snapshot checks
+    "heartbeat": 15.0            # keepalive comment when idle (seconds)
+}
+
+# Response cache for the per-machine analytics endpoints (/oee, /timeline,
+# /status-summary, /errors, /historical, /statistics). Window ends snap to
+# multiples of "align" seconds so requests within a bucket share a result;
+# entries live "ttl" seconds, and new data for the machine evicts them once
+# they are "min_age" seconds old.
+RESPONSE_CACHE_CONFIG = {
+    "max_entries": 512,
+    "ranges": {
+        "1h":  {"align": 5,   "ttl": 5,   "min_age": 1},
+        "24h": {"align": 30,  "ttl": 30,  "min_age": 5},
+        "7d":  {"align": 60,  "ttl": 60,  "min_age": 15},
+        "30d": {"align": 300, "ttl": 300, "min_age": 60},
+        "1y":  {"align": 900, "ttl": 900, "min_age": 300}
+    }
+}
+
+# Concurrent identical analytics requests share one in-flight execution
+COALESCE_CONFIG = {
+    "timeout": 30.0              # seconds a follower waits for the leader's result
+}
+
+# Streaming /raw-data (?format=ndjson or ?format=json-stream)
+RAW_STREAM_CONFIG = {
+    "itersize": 2000             # rows fetched per round trip from the server-side cursor
+}
+
+# Keyset pagination (?limit=, ?cursor=) on /raw-data and /historical
+PAGINATION_CONFIG = {
+    "max_limit": 50000           # largest accepted page size (rows)
+}
+
+# Arrow/Parquet export (/api/machines/<id>/export, export.py)
+EXPORT_CONFIG = {
+    "block_size": 1 << 20,       # bytes of COPY output parsed per record batch
+    "row_group_rows": 262144,    # rows per Parquet row group
+    "workers": 4,                # parallel COPY connections (CLI default)
+    "http_workers": 2,           # parallel COPY connections per export request
+    "slices_per_worker": 2,      # time slices per worker for one-machine exports
+    "queue_batches": 2           # record batches buffered per slice
+}
+
+# Bulk CSV/Parquet import (importer.py)
+IMPORT_CONFIG = {
+    "workers": 4,                # parallel COPY processes
+    "chunk_mb": 64,              # CSV bytes per chunk (Parquet: one row group per chunk)
+    "batch_rows": 20000,         # rows per COPY inside a chunk's transaction
+    "copy_format": "binary",     # "binary" or "text"
+    "max_errors": 1000,          # abort once more rows than this are rejected
+    "report_interval": 5         # seconds between progress lines
+}
+
+# Native time partitioning of machine_data when TimescaleDB is not installed
+# (create_table(partition_by_time=True) or "enabled")
+PARTITION_CONFIG = {
+    "enabled": False,            # partition new tables by default
+    "interval_days": 1,          # width of each partition
+    "premake_days": 3            # partitions kept ready ahead of now
+}
+
+# cleanup_old_data(): batch size and pacing of row-by-row deletes
+RETENTION_CONFIG = {
+    "batch_rows": 5000,          # rows deleted per transaction
+    "pause": 0.05,               # seconds to sleep between batches
+    "report_interval": 5         # seconds between progress lines
+}
+
+# Cold tier (archive.py): TimescaleDB compression, otherwise compressed
+# per-machine segments that /raw-data, /historical and the other raw
+# queries read back
+ARCHIVE_CONFIG = {
+    "after_days": 7              # days kept uncompressed / in machine_data
+}
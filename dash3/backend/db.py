@@ -1,55 +1,259 @@
+import io
+import struct
+import threading
+import time
+from itertools import islice
 import psycopg2
 from psycopg2 import pool
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from config import DB_CONFIG
+from psycopg2 import extensions
+from psycopg2 import errors
+from psycopg2.extras import RealDictCursor, execute_values
+from datetime import datetime, timedelta, timezone
+from config import DB_CONFIG, POOL_CONFIG, PARTITION_CONFIG, RETENTION_CONFIG
+from partitions import (DEFAULT_PARTITION, create_default_partition, drop_partitions_before,
+                        ensure_partitions, is_partitioned)
+from state_intervals import INTERVALS_TABLE, record_state_intervals, prune_state_intervals
+from latest import LATEST_TABLE, record_latest
+from rollup_dirty import DIRTY_TABLE, mark_late_rows
+from notify import notify_changes
 
 # ============================================================
 #  CONNECTION POOL
 # ============================================================
-connection_pool = None
+class PoolTimeout(psycopg2.pool.PoolError):
+    """Raised when no connection becomes free within the checkout timeout"""
 
-def init_connection_pool(minconn=1, maxconn=5):
-    """Initialize PostgreSQL connection pool"""
-    global connection_pool
-    if connection_pool is None:
-        try:
-            connection_pool = psycopg2.pool.SimpleConnectionPool(
-                minconn, maxconn, **DB_CONFIG
+
+class InstrumentedConnectionPool:
+    """Thread-safe pool with checkout timeouts, health checks and counters.
+
+    Wraps psycopg2's ThreadedConnectionPool. A semaphore bounds the number of
+    checked-out connections so callers wait (up to ``checkout_timeout``)
+    instead of failing immediately when the pool is exhausted. Connections
+    that are closed, broken or older than ``max_lifetime`` are discarded and
+    replaced transparently.
+    """
+
+    def __init__(self, minconn, maxconn, checkout_timeout=5.0,
+                 max_lifetime=1800, health_check_idle=30, **dsn):
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **dsn)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._created = {}    # id(conn) -> monotonic creation time
+        self._released = {}   # id(conn) -> monotonic time of last release
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'saturated_checkouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'broken_discarded': 0,
+            'recycled': 0
+        }
+
+    def getconn(self, timeout=None):
+        """Check out a healthy connection, waiting up to ``timeout`` seconds"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+
+        saturated = not self._slots.acquire(blocking=False)
+        if saturated and not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(
+                f"no database connection available within {timeout:.1f}s "
+                f"(pool size {self.maxconn})"
             )
-            print("✅ Database connection pool initialized")
-        except Exception as e:
-            print(f"❌ Error creating connection pool: {e}")
+
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
             raise
 
-def get_connection():
-    """Get connection from pool or create new if pool unavailable"""
+        waited = time.monotonic() - start
+        with self._lock:
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['wait_time_total'] += waited
+            stats['wait_time_max'] = max(stats['wait_time_max'], waited)
+            stats['in_use'] += 1
+            stats['peak_in_use'] = max(stats['peak_in_use'], stats['in_use'])
+            if saturated:
+                stats['saturated_checkouts'] += 1
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection, discarding it if broken or past its lifetime"""
+        try:
+            if not close:
+                close = self._should_discard(conn)
+            self._pool.putconn(conn, close=close)
+            if close:
+                self._forget(conn)
+            else:
+                self._released[id(conn)] = time.monotonic()
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+        self._created.clear()
+        self._released.clear()
+
+    def stats(self):
+        """Snapshot of pool counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        checkouts = snapshot['checkouts']
+        snapshot['wait_time_avg'] = (
+            snapshot['wait_time_total'] / checkouts if checkouts else 0.0
+        )
+        snapshot['max_size'] = self.maxconn
+        snapshot['saturation'] = round(snapshot['in_use'] / self.maxconn, 3)
+        return snapshot
+
+    def _checkout_healthy(self):
+        while True:
+            conn = self._pool.getconn()
+            key = id(conn)
+            self._created.setdefault(key, time.monotonic())
+            if self._is_healthy(conn):
+                return conn
+            with self._lock:
+                self._stats['broken_discarded'] += 1
+            self._pool.putconn(conn, close=True)
+            self._forget(conn)
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        idle_since = self._released.get(id(conn))
+        if idle_since is None or time.monotonic() - idle_since < self.health_check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _should_discard(self, conn):
+        if conn.closed:
+            with self._lock:
+                self._stats['broken_discarded'] += 1
+            return True
+
+        status = conn.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            with self._lock:
+                self._stats['broken_discarded'] += 1
+            return True
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                with self._lock:
+                    self._stats['broken_discarded'] += 1
+                return True
+
+        age = time.monotonic() - self._created.get(id(conn), time.monotonic())
+        if age > self.max_lifetime:
+            with self._lock:
+                self._stats['recycled'] += 1
+            return True
+        return False
+
+    def _forget(self, conn):
+        self._created.pop(id(conn), None)
+        self._released.pop(id(conn), None)
+
+
+connection_pool = None
+_pool_init_lock = threading.Lock()
+
+def init_connection_pool(minconn=None, maxconn=None):
+    """Initialize PostgreSQL connection pool"""
     global connection_pool
+    with _pool_init_lock:
+        if connection_pool is None:
+            options = dict(POOL_CONFIG)
+            if minconn is not None:
+                options['minconn'] = minconn
+            if maxconn is not None:
+                options['maxconn'] = maxconn
+            try:
+                connection_pool = InstrumentedConnectionPool(**options, **DB_CONFIG)
+                print("✅ Database connection pool initialized")
+            except Exception as e:
+                print(f"❌ Error creating connection pool: {e}")
+                raise
+
+def get_connection(timeout=None):
+    """Get connection from pool, initializing the pool on first use"""
     if connection_pool is None:
         init_connection_pool()
     try:
-        return connection_pool.getconn()
+        return connection_pool.getconn(timeout=timeout)
     except Exception as e:
         print(f"❌ Error getting connection from pool: {e}")
         raise
 
-def release_connection(conn):
+def release_connection(conn, close=False):
     """Release connection back to pool"""
-    global connection_pool
     if connection_pool:
-        connection_pool.putconn(conn)
+        connection_pool.putconn(conn, close=close)
     else:
         conn.close()
 
+def get_pool_stats():
+    """Pool counters (checkouts, wait time, saturation...) or None if unused"""
+    if connection_pool is None:
+        return None
+    return connection_pool.stats()
+
+def has_timescale(cur):
+    """True if the TimescaleDB extension is installed in this database"""
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb';")
+    return cur.fetchone() is not None
+
 # ============================================================
 #  TABLE CREATION
 # ============================================================
-def create_table():
-    """Create machine_data table (Timescale-enabled if available)"""
+def create_table(partition_by_time=None):
+    """Create machine_data table (Timescale-enabled if available).
+
+    Without TimescaleDB, ``partition_by_time`` (default from PARTITION_CONFIG)
+    creates the table range-partitioned on time instead: a default partition
+    plus fixed-width partitions up to ``premake_days`` ahead, so retention
+    drops whole partitions. An existing table keeps its layout.
+    """
+    if partition_by_time is None:
+        partition_by_time = PARTITION_CONFIG['enabled']
     conn = get_connection()
     cur = conn.cursor()
 
-    create_table_query = """
+    partitioned = False
+    if partition_by_time:
+        cur.execute("SELECT to_regclass('machine_data') IS NOT NULL;")
+        exists = cur.fetchone()[0]
+        if has_timescale(cur):
+            print("ℹ️ TimescaleDB installed – using a hypertable instead of native partitions")
+        elif exists and not is_partitioned(cur):
+            print("ℹ️ machine_data already exists unpartitioned – leaving it as it is")
+        else:
+            partitioned = True
+
+    create_table_query = f"""
     CREATE TABLE IF NOT EXISTS machine_data (
         time TIMESTAMPTZ NOT NULL,
         machine_id TEXT NOT NULL,
@@ -77,23 +281,33 @@ def create_table():
         error_text TEXT,
         error_parameter TEXT,
         error_level INTEGER
-    );
+    ){" PARTITION BY RANGE (time)" if partitioned else ""};
     """
 
     try:
         cur.execute(create_table_query)
 
-        # Try to convert to hypertable (if TimescaleDB exists)
-        try:
-            cur.execute("""
-                SELECT create_hypertable('machine_data', 'time',
-                    if_not_exists => TRUE,
-                    migrate_data => TRUE
-                );
-            """)
-            print("🧩 Hypertable created successfully (TimescaleDB)")
-        except Exception:
-            print("ℹ️ TimescaleDB not installed – using normal table")
+        if partitioned:
+            create_default_partition(cur)
+            now = datetime.now(timezone.utc)
+            created = ensure_partitions(cur, now, now + timedelta(days=PARTITION_CONFIG['premake_days']),
+                                        PARTITION_CONFIG['interval_days'])
+            print(f"🧩 Partitioned by time ({len(created)} new partitions)")
+        else:
+            # Try to convert to hypertable (if TimescaleDB exists). The savepoint
+            # keeps the transaction usable when the function is missing.
+            cur.execute("SAVEPOINT hypertable")
+            try:
+                cur.execute("""
+                    SELECT create_hypertable('machine_data', 'time',
+                        if_not_exists => TRUE,
+                        migrate_data => TRUE
+                    );
+                """)
+                print("🧩 Hypertable created successfully (TimescaleDB)")
+            except Exception:
+                cur.execute("ROLLBACK TO SAVEPOINT hypertable")
+                print("ℹ️ TimescaleDB not installed – using normal table")
 
         # Indexes
         cur.execute("""
@@ -124,6 +338,38 @@ def create_table():
 # ============================================================
 #  INSERT OPERATIONS
 # ============================================================
+# Column order shared by every insert path (single, batch, COPY)
+MACHINE_DATA_COLUMNS = [
+    "time", "machine_id", "state", "program_state", "current", "drilling",
+    "cutting_speed", "override_flag", "homing", "homed", "technology_name",
+    "technology_index", "technology_dataset", "material", "thickness", "gas_type",
+    "arc", "arc_ignite", "drilling_depth", "scrap_cut", "din_file_name",
+    "arc_error", "error_code", "error_text", "error_parameter", "error_level"
+]
+
+# Postgres type of each column, as declared in create_table()
+MACHINE_DATA_TYPES = {
+    "time": "timestamptz", "machine_id": "text", "state": "text",
+    "program_state": "text", "current": "float8", "drilling": "float8",
+    "cutting_speed": "float8", "override_flag": "bool", "homing": "bool",
+    "homed": "bool", "technology_name": "text", "technology_index": "int4",
+    "technology_dataset": "text", "material": "text", "thickness": "float8",
+    "gas_type": "text", "arc": "bool", "arc_ignite": "bool",
+    "drilling_depth": "float8", "scrap_cut": "bool", "din_file_name": "text",
+    "arc_error": "bool", "error_code": "int4", "error_text": "text",
+    "error_parameter": "text", "error_level": "int4"
+}
+
+def _utc_time(value):
+    """Sample time as an aware datetime; naive values and ISO strings without
+    an offset are UTC, so every insert path stores the same instant whatever
+    the session TimeZone"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
 def _normalize_data(data):
     """Fix legacy field names and missing values"""
     # Backward compatibility for old key name
@@ -132,20 +378,86 @@ def _normalize_data(data):
 
     # Auto-fill missing time if not present
     if "time" not in data:
-        data["time"] = datetime.utcnow()
+        data["time"] = datetime.now(timezone.utc)
+    else:
+        data["time"] = _utc_time(data["time"])
 
     # Fill missing optional keys to prevent KeyError
-    default_fields = [
-        "state", "program_state", "current", "drilling", "cutting_speed",
-        "override_flag", "homing", "homed", "technology_name", "technology_index",
-        "technology_dataset", "material", "thickness", "gas_type", "arc", "arc_ignite",
-        "drilling_depth", "scrap_cut", "din_file_name", "arc_error", "error_code",
-        "error_text", "error_parameter", "error_level"
-    ]
-    for f in default_fields:
+    for f in MACHINE_DATA_COLUMNS[2:]:
         data.setdefault(f, None)
     return data
 
+# ============================================================
+#  DERIVED TABLES
+# ============================================================
+# Optional tables (state intervals, latest rows, dirty rollup marks, the
+# archive) are looked up at most every _RECHECK_SECONDS, so ones created or
+# dropped while writers and the API are running are noticed without a restart
+_RECHECK_SECONDS = 60
+_table_cache = {}
+
+def table_exists_cached(cur, name):
+    """Whether table ``name`` exists, cached for the ingest and query paths"""
+    now = time.monotonic()
+    cached = _table_cache.get(name)
+    if cached is None or now - cached[1] >= _RECHECK_SECONDS:
+        with cur.connection.cursor() as plain:
+            plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+            cached = _table_cache[name] = (plain.fetchone()[0], now)
+    return cached[0]
+
+def forget_tables():
+    """Drop cached table lookups, e.g. after an UndefinedTable error"""
+    _table_cache.clear()
+
+def _update_derived(cur, rows, notify=True):
+    """Maintain derived tables and queue change notifications for rows just
+    written, in the same transaction. ``rows`` come from _record_tuple(), so
+    their times are aware and match what machine_data stored. A derived
+    table dropped meanwhile fails this transaction once; the next one
+    skips it."""
+    try:
+        if table_exists_cached(cur, INTERVALS_TABLE):
+            record_state_intervals(cur, [(row[1], row[0], row[2], row[5], row[4]) for row in rows])
+        if table_exists_cached(cur, LATEST_TABLE):
+            record_latest(cur, MACHINE_DATA_COLUMNS, rows)
+        if table_exists_cached(cur, DIRTY_TABLE):
+            mark_late_rows(cur, [row[0] for row in rows])
+    except errors.UndefinedTable:
+        forget_tables()
+        raise
+    if notify:
+        notify_changes(cur, [(row[1], row[0], row[2]) for row in rows])
+
+def notify_latest(machine_ids):
+    """One change notification with the newest row of each of ``machine_ids``.
+
+    For loads that ran with ``notify=False``: listeners get a single summary
+    instead of one NOTIFY per batch. Returns the number of NOTIFY calls.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT newest.machine_id, newest.time, newest.state
+            FROM unnest(%s::text[]) AS m(machine_id)
+            CROSS JOIN LATERAL (
+                SELECT machine_id, time, state FROM machine_data d
+                WHERE d.machine_id = m.machine_id
+                ORDER BY time DESC
+                LIMIT 1
+            ) newest;
+        """, (sorted(set(machine_ids)),))
+        sent = notify_changes(cur, cur.fetchall())
+        conn.commit()
+        return sent
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
 def insert_machine_data(data):
     """Insert single record"""
     conn = get_connection()
@@ -171,6 +483,7 @@ def insert_machine_data(data):
     """
     try:
         cur.execute(insert_query, data)
+        _update_derived(cur, [_record_tuple(data)])
         conn.commit()
     except Exception as e:
         conn.rollback()
@@ -188,25 +501,10 @@ def insert_multiple_machine_data(data_list):
     conn = get_connection()
     cur = conn.cursor()
 
-    insert_query = """
-    INSERT INTO machine_data (
-        time, machine_id, state, program_state, current, drilling,
-        cutting_speed, override_flag, homing, homed, technology_name,
-        technology_index, technology_dataset, material, thickness, gas_type,
-        arc, arc_ignite, drilling_depth, scrap_cut, din_file_name,
-        arc_error, error_code, error_text, error_parameter, error_level
-    ) VALUES (
-        %(time)s, %(machine_id)s, %(state)s, %(program_state)s, %(current)s,
-        %(drilling)s, %(cutting_speed)s, %(override_flag)s, %(homing)s,
-        %(homed)s, %(technology_name)s, %(technology_index)s, %(technology_dataset)s,
-        %(material)s, %(thickness)s, %(gas_type)s, %(arc)s, %(arc_ignite)s,
-        %(drilling_depth)s, %(scrap_cut)s, %(din_file_name)s, %(arc_error)s,
-        %(error_code)s, %(error_text)s, %(error_parameter)s, %(error_level)s
-    );
-    """
     try:
-        normalized_list = [_normalize_data(d) for d in data_list]
-        cur.executemany(insert_query, normalized_list)
+        rows = [_record_tuple(d) for d in data_list]
+        _values_rows(cur, rows)
+        _update_derived(cur, rows)
         conn.commit()
         return True
     except Exception as e:
@@ -217,6 +515,178 @@ def insert_multiple_machine_data(data_list):
         cur.close()
         release_connection(conn)
 
+# ============================================================
+#  BULK INGEST (COPY)
+# ============================================================
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+_NULL_FIELD = struct.pack("!i", -1)
+_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def _record_tuple(record):
+    """Dict records are normalized; tuples must already follow MACHINE_DATA_COLUMNS.
+    Either way the time comes back aware (see _utc_time)."""
+    if isinstance(record, dict):
+        record = _normalize_data(record)
+        return tuple(record[c] for c in MACHINE_DATA_COLUMNS)
+    record = tuple(record)
+    return (_utc_time(record[0]),) + record[1:]
+
+def _text_timestamptz(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def _text_escaped(value):
+    return str(value).translate(_TEXT_ESCAPES)
+
+_TEXT_FORMATTERS = {
+    "timestamptz": _text_timestamptz,
+    "text": _text_escaped,
+    "float8": lambda v: repr(float(v)),
+    "int4": lambda v: str(int(v)),
+    "bool": lambda v: "t" if v else "f",
+}
+
+def _binary_timestamptz(value):
+    # Always aware here, see _record_tuple
+    delta = value - _PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return struct.pack("!iq", 8, micros)
+
+def _binary_text(value):
+    encoded = str(value).encode("utf-8")
+    return struct.pack("!i", len(encoded)) + encoded
+
+_BINARY_FORMATTERS = {
+    "timestamptz": _binary_timestamptz,
+    "text": _binary_text,
+    "float8": lambda v: struct.pack("!id", 8, float(v)),
+    "int4": lambda v: struct.pack("!ii", 4, int(v)),
+    "bool": lambda v: struct.pack("!i?", 1, bool(v)),
+}
+
+def _copy_text_buffer(rows):
+    """Encode rows as COPY text format"""
+    formatters = [_TEXT_FORMATTERS[MACHINE_DATA_TYPES[c]] for c in MACHINE_DATA_COLUMNS]
+    lines = []
+    for row in rows:
+        lines.append("\t".join(
+            "\\N" if v is None else fmt(v) for fmt, v in zip(formatters, row)
+        ))
+    lines.append("")
+    return io.StringIO("\n".join(lines))
+
+def _copy_binary_buffer(rows):
+    """Encode rows as COPY binary format"""
+    formatters = [_BINARY_FORMATTERS[MACHINE_DATA_TYPES[c]] for c in MACHINE_DATA_COLUMNS]
+    field_count = struct.pack("!h", len(MACHINE_DATA_COLUMNS))
+    parts = [_COPY_SIGNATURE]
+    for row in rows:
+        parts.append(field_count)
+        parts.extend(
+            _NULL_FIELD if v is None else fmt(v) for fmt, v in zip(formatters, row)
+        )
+    parts.append(_COPY_TRAILER)
+    return io.BytesIO(b"".join(parts))
+
+def _copy_rows(cur, rows, copy_format):
+    columns = ", ".join(MACHINE_DATA_COLUMNS)
+    if copy_format == "binary":
+        buf = _copy_binary_buffer(rows)
+        cur.copy_expert(f"COPY machine_data ({columns}) FROM STDIN WITH (FORMAT binary)", buf)
+    else:
+        buf = _copy_text_buffer(rows)
+        cur.copy_expert(f"COPY machine_data ({columns}) FROM STDIN", buf)
+
+def _values_rows(cur, rows, page_size=1000):
+    columns = ", ".join(MACHINE_DATA_COLUMNS)
+    execute_values(
+        cur, f"INSERT INTO machine_data ({columns}) VALUES %s", rows, page_size=page_size
+    )
+
+def bulk_insert_machine_data(records, method="copy", copy_format="text", batch_size=5000,
+                             update_derived=True, notify=True):
+    """Stream records into machine_data in batches, one transaction per batch.
+
+    ``records`` may be any iterable of dicts (normalized like insert_machine_data)
+    or tuples already in MACHINE_DATA_COLUMNS order. ``method`` is "copy"
+    (COPY FROM STDIN, ``copy_format`` "text" or "binary") or "values"
+    (multi-row INSERT via execute_values). If COPY is rejected by the server
+    the remaining batches fall back to execute_values. Derived tables
+    (machine_state_intervals, machine_latest) and change notifications are
+    handled in each batch's transaction unless ``update_derived`` is False,
+    e.g. for loads that rebuild them afterwards. ``notify=False`` keeps the
+    derived tables but skips the per-batch NOTIFY, whose commit-time queue
+    lock serializes concurrent writers; bulk loads call notify_latest()
+    once when done instead.
+
+    Returns a stats dict with rows, batches, seconds, rows_per_sec and the
+    method actually used.
+    """
+    if method not in ("copy", "values"):
+        raise ValueError(f"Unknown bulk insert method: {method}")
+    if copy_format not in ("text", "binary"):
+        raise ValueError(f"Unknown COPY format: {copy_format}")
+
+    conn = get_connection()
+    cur = conn.cursor()
+    total_rows = 0
+    batches = 0
+    started = time.perf_counter()
+    iterator = iter(records)
+
+    try:
+        while True:
+            batch = [_record_tuple(r) for r in islice(iterator, batch_size)]
+            if not batch:
+                break
+
+            if method == "copy":
+                try:
+                    _copy_rows(cur, batch, copy_format)
+                except (psycopg2.DataError, psycopg2.IntegrityError):
+                    raise
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    print(f"⚠️ COPY unavailable ({e}); falling back to execute_values")
+                    method = "values"
+
+            if method == "values":
+                _values_rows(cur, batch)
+
+            if update_derived:
+                _update_derived(cur, batch, notify)
+            conn.commit()
+            total_rows += len(batch)
+            batches += 1
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error in bulk insert after {total_rows} rows: {e}")
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': total_rows,
+        'batches': batches,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(total_rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'method': f"copy-{copy_format}" if method == "copy" else "values"
+    }
+
+def copy_machine_data(cur, rows, copy_format="binary"):
+    """COPY tuple rows (MACHINE_DATA_COLUMNS order) on the caller's cursor.
+
+    Unlike bulk_insert_machine_data() nothing is committed and derived tables
+    are left alone, so the rows commit atomically with whatever else the
+    caller does in the same transaction.
+    """
+    if copy_format not in ("text", "binary"):
+        raise ValueError(f"Unknown COPY format: {copy_format}")
+    _copy_rows(cur, [_record_tuple(r) for r in rows], copy_format)
+
 # ============================================================
 #  QUERY FUNCTIONS
 # ============================================================
@@ -282,18 +752,126 @@ def get_data_statistics():
 # ============================================================
 #  CLEANUP + UTILITIES
 # ============================================================
-def cleanup_old_data(days=30):
-    """Delete records older than N days"""
+def list_machine_ids(cur, table="machine_data"):
+    """Distinct machine ids of ``table``, one idx_machine_time probe each"""
+    cur.execute(f"""
+        WITH RECURSIVE machines AS (
+            (SELECT machine_id FROM {table} ORDER BY machine_id LIMIT 1)
+            UNION ALL
+            SELECT (SELECT machine_id FROM {table}
+                    WHERE machine_id > machines.machine_id
+                    ORDER BY machine_id LIMIT 1)
+            FROM machines
+            WHERE machines.machine_id IS NOT NULL
+        )
+        SELECT machine_id FROM machines WHERE machine_id IS NOT NULL;
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+def _delete_in_batches(conn, cur, table, cutoff, batch_rows, pause):
+    """Delete rows of ``table`` older than ``cutoff``, batch by batch.
+
+    Walks idx_machine_time machine by machine and commits every batch, so
+    each transaction only locks ``batch_rows`` rows and never scans the
+    heap. ``table`` must be the plain table or a single partition, since
+    ctids are only unique within one.
+    """
+    machine_ids = list_machine_ids(cur, table)
+    deleted = 0
+    started = last_report = time.perf_counter()
+    for done, machine_id in enumerate(machine_ids, 1):
+        while True:
+            cur.execute(f"""
+                DELETE FROM {table}
+                WHERE ctid = ANY(ARRAY(
+                    SELECT ctid FROM {table}
+                    WHERE machine_id = %s AND time < %s
+                    LIMIT %s
+                ));
+            """, (machine_id, cutoff, batch_rows))
+            count = cur.rowcount
+            conn.commit()
+            deleted += count
+
+            now = time.perf_counter()
+            if now - last_report >= RETENTION_CONFIG['report_interval']:
+                print(f"🧹 {table}: {deleted:,} rows deleted | "
+                      f"{deleted / (now - started):,.0f} rows/sec | machines {done}/{len(machine_ids)}")
+                last_report = now
+            if count < batch_rows:
+                break
+            time.sleep(pause)
+    return deleted
+
+def cleanup_old_data(days=30, batch_rows=None, pause=None):
+    """Remove records older than N days without one long-running DELETE.
+
+    TimescaleDB: chunks entirely older than the cutoff are dropped
+    (drop_chunks). Native partitions: partitions entirely older than the
+    cutoff are dropped, the ones for the next days created, and old rows
+    in the default partition deleted in batches. In both cases rows in the
+    chunk or partition straddling the cutoff stay until it ages out. Plain
+    table: rows are deleted ``batch_rows`` at a time with a commit and a
+    ``pause`` between batches, so locks stay short and ingest keeps up.
+
+    Rollup buckets, closed state intervals and archived data (cold
+    segments, catalog rows and Parquet files) lying entirely before the
+    cutoff are removed in the same job, so they keep the same retention as
+    the raw rows.
+
+    Returns a stats dict with the method used, the chunks or partitions
+    dropped, rows deleted (estimated for dropped ones), rollup buckets,
+    state intervals and cold segments removed, and seconds.
+    """
+    # Both import this module
+    from archive import prune_archive
+    from rollups import prune_rollups
+    batch_rows = batch_rows or RETENTION_CONFIG['batch_rows']
+    pause = RETENTION_CONFIG['pause'] if pause is None else pause
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
     conn = get_connection()
     cur = conn.cursor()
+    stats = {'method': 'batched', 'dropped': 0, 'deleted': 0}
+    started = time.perf_counter()
 
-    query = "DELETE FROM machine_data WHERE time < NOW() - INTERVAL %s;"
     try:
-        cur.execute(query, (f'{days} days',))
-        deleted_count = cur.rowcount
+        if has_timescale(cur):
+            stats['method'] = 'drop_chunks'
+            cur.execute("""
+                SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint, COUNT(*)
+                FROM show_chunks('machine_data', older_than => %s) AS chunk
+                JOIN pg_class c ON c.oid = chunk;
+            """, (cutoff,))
+            stats['deleted'], stats['dropped'] = cur.fetchone()
+            cur.execute("SELECT drop_chunks('machine_data', older_than => %s);", (cutoff,))
+            conn.commit()
+        elif is_partitioned(cur):
+            stats['method'] = 'partitions'
+            dropped = drop_partitions_before(cur, cutoff)
+            now = datetime.now(timezone.utc)
+            ensure_partitions(cur, now, now + timedelta(days=PARTITION_CONFIG['premake_days']),
+                              PARTITION_CONFIG['interval_days'])
+            conn.commit()
+            stats['dropped'] = len(dropped)
+            stats['deleted'] = sum(rows for _, rows in dropped)
+            stats['deleted'] += _delete_in_batches(conn, cur, DEFAULT_PARTITION, cutoff,
+                                                   batch_rows, pause)
+        else:
+            stats['deleted'] = _delete_in_batches(conn, cur, "machine_data", cutoff,
+                                                  batch_rows, pause)
+
+        stats['rollup_buckets'] = prune_rollups(cur, cutoff)
+        stats['intervals'] = prune_state_intervals(cur, cutoff)
+        stats['cold_segments'] = prune_archive(cur, cutoff)
         conn.commit()
-        print(f"🧹 Deleted {deleted_count} old records (> {days} days)")
-        return deleted_count
+
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        dropped = f", {stats['dropped']} dropped" if stats['dropped'] else ""
+        print(f"🧹 Removed ~{stats['deleted']:,} old records (> {days} days) via "
+              f"{stats['method']}{dropped} in {stats['seconds']}s; pruned "
+              f"{stats['rollup_buckets']:,} rollup buckets, {stats['intervals']:,} state intervals, "
+              f"{stats['cold_segments']:,} cold segments")
+        return stats
     except Exception as e:
         conn.rollback()
         print(f"❌ Error cleaning data: {e}")
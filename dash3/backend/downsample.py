@@ -0,0 +1,62 @@
+import re
+import numpy as np
+
+# ============================================================
+#  DOWNSAMPLING HELPERS
+# ============================================================
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$")
+_UNIT_SECONDS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_bucket(value):
+    """Bucket width in seconds from '300', '30s', '5m', '1h' or '1d'"""
+    match = _DURATION.match(value.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid bucket width: {value}")
+    seconds = float(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+    if seconds <= 0:
+        raise ValueError(f"Invalid bucket width: {value}")
+    return seconds
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of the points that keep the shape.
+
+    ``x`` must be increasing. Always keeps the first and last point and
+    picks one point per bucket in between, the one forming the largest
+    triangle with the previously selected point and the next bucket's mean.
+    NaN values (NULL readings) are skipped rather than read as 0, unless
+    every value is NaN, in which case evenly spaced points are returned.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    valid = ~np.isnan(y)
+    if not valid.all():
+        if not valid.any():
+            return np.unique(np.linspace(0, n - 1, threshold).astype(np.int64))
+        index = np.flatnonzero(valid)
+        return index[lttb_indices(x[index], y[index], threshold)]
+    # Bucket boundaries for the n - 2 interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        next_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        areas = np.abs(
+            (x[previous] - next_x) * (bucket_y - y[previous])
+            - (x[previous] - bucket_x) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return selected
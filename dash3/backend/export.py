@@ -0,0 +1,408 @@
+import argparse
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from config import EXPORT_CONFIG
+from db import get_connection, release_connection
+from latest import LATEST_TABLE, latest_table_exists
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# ============================================================
+#  ARROW / PARQUET EXPORT
+# ============================================================
+# machine_data columns in table order, with their Arrow types
+EXPORT_COLUMNS = [
+    ('time', 'timestamp'), ('machine_id', 'string'), ('state', 'string'),
+    ('program_state', 'string'), ('current', 'float64'), ('drilling', 'float64'),
+    ('cutting_speed', 'float64'), ('override_flag', 'bool'), ('homing', 'bool'),
+    ('homed', 'bool'), ('technology_name', 'string'), ('technology_index', 'int32'),
+    ('technology_dataset', 'string'), ('material', 'string'), ('thickness', 'float64'),
+    ('gas_type', 'string'), ('arc', 'bool'), ('arc_ignite', 'bool'),
+    ('drilling_depth', 'float64'), ('scrap_cut', 'bool'), ('din_file_name', 'string'),
+    ('arc_error', 'bool'), ('error_code', 'int32'), ('error_text', 'string'),
+    ('error_parameter', 'string'), ('error_level', 'int32')
+]
+
+# Response content types per export format
+EXPORT_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+def export_available():
+    """True if pyarrow is installed"""
+    return pa is not None
+
+# Codecs each format can be written with
+EXPORT_COMPRESSION = {
+    'arrow': ('lz4', 'zstd'),
+    'parquet': ('none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd')
+}
+
+# Window start for exports without one
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def check_compression(fmt, compression):
+    """ValueError unless ``compression`` (None for the default) works for ``fmt``"""
+    if compression is None:
+        return
+    if compression not in EXPORT_COMPRESSION[fmt]:
+        raise ValueError(f"Unsupported {fmt} compression '{compression}', expected one of "
+                         f"{', '.join(EXPORT_COMPRESSION[fmt])}")
+    if compression != 'none' and not pa.Codec.is_available(compression):
+        raise ValueError(f"Compression '{compression}' is not available in this pyarrow build")
+
+def export_schema():
+    types = {
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'string': pa.string(),
+        'float64': pa.float64(),
+        'bool': pa.bool_(),
+        'int32': pa.int32()
+    }
+    return pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS])
+
+def iter_record_batches(conn, machine_id=None, start=None, end=None, block_size=None):
+    """Typed Arrow record batches of machine_data rows, oldest first.
+
+    The window is streamed with ``COPY ... TO STDOUT (FORMAT csv)`` on a
+    helper thread into a pipe that Arrow's streaming CSV reader parses, so
+    rows never become Python objects and memory stays at a bounded number
+    of ``block_size`` blocks (Arrow reads a few dozen ahead) whatever the
+    window. ``machine_id`` is one machine,
+    a (first, last) range of machine ids, or None for every machine. Naive ``start``/``end`` are taken as UTC.
+    Archived days are read too (archive.machine_data_source). The caller
+    owns ``conn`` and ends its transaction afterwards.
+    """
+    schema = export_schema()
+    names = [name for name, _ in EXPORT_COLUMNS]
+    conditions, params = [], []
+    if isinstance(machine_id, tuple):
+        conditions.append("machine_id BETWEEN %s AND %s")
+        params.extend(machine_id)
+    elif machine_id is not None:
+        conditions.append("machine_id = %s")
+        params.append(machine_id)
+    if start is not None and start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end is not None and end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    for bound, operator in ((start, '>='), (end, '<')):
+        if bound is not None:
+            conditions.append(f"time {operator} %s")
+            params.append(bound)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "time" if isinstance(machine_id, str) else "machine_id, time"
+
+    with conn.cursor() as cur:
+        # COPY prints timestamptz in the session time zone
+        cur.execute("SET LOCAL TimeZone = 'UTC';")
+        from archive import machine_data_source  # archive imports this module
+        table = machine_data_source(cur, start or _EPOCH, end=end)
+        query = cur.mogrify(
+            f"COPY (SELECT {', '.join(names)} FROM {table} {where} ORDER BY {order}) "
+            f"TO STDOUT WITH (FORMAT csv)",
+            params
+        ).decode()
+
+    read_fd, write_fd = os.pipe()
+    source = os.fdopen(read_fd, 'rb')
+    target = os.fdopen(write_fd, 'wb')
+    errors = []
+
+    def copy():
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(query, target)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                target.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=copy, name="export-copy", daemon=True)
+    writer.start()
+    try:
+        try:
+            reader = pa_csv.open_csv(
+                source,
+                read_options=pa_csv.ReadOptions(
+                    column_names=names, block_size=block_size or EXPORT_CONFIG['block_size'],
+                    # Parallelism comes from the slice workers
+                    use_threads=False
+                ),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=schema,
+                    true_values=['t'], false_values=['f'],
+                    # COPY writes NULL unquoted and '' quoted
+                    strings_can_be_null=True, quoted_strings_can_be_null=False
+                )
+            )
+        except pa.ArrowInvalid as e:
+            # Arrow refuses empty input, which is just an empty window
+            writer.join()
+            if errors:
+                raise errors[0]
+            if "Empty CSV" not in str(e):
+                raise
+            return
+        for batch in reader:
+            yield batch
+    finally:
+        # Closing the read end makes an unfinished COPY fail, ending the thread
+        source.close()
+        writer.join()
+    if errors:
+        raise errors[0]
+
+
+# ------------------------------------------------------------
+#  Parallel slices
+# ------------------------------------------------------------
+def plan_slices(machine_id, start, end, slices):
+    """(machine_id, start, end) pieces of an export, in output order.
+
+    One machine is cut into ``slices`` equal time ranges; the whole fleet
+    into ``slices`` ranges of consecutive machine ids, ordered by machine,
+    then time. Either way each slice is a range scan on idx_machine_time.
+    """
+    if machine_id is not None:
+        step = (end - start) / slices
+        edges = [start + step * i for i in range(slices)] + [end]
+        return [(machine_id, edges[i], edges[i + 1]) for i in range(slices)]
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            if latest_table_exists(cur):
+                cur.execute(f"SELECT machine_id FROM {LATEST_TABLE} ORDER BY machine_id;")
+            else:
+                cur.execute("SELECT DISTINCT machine_id FROM machine_data ORDER BY machine_id;")
+            machine_ids = [row[0] for row in cur.fetchall()]
+        conn.rollback()
+    finally:
+        release_connection(conn)
+    groups = [machine_ids[len(machine_ids) * i // slices:len(machine_ids) * (i + 1) // slices]
+              for i in range(slices)]
+    return [((group[0], group[-1]), start, end) for group in groups if group]
+
+def _put(out, item, stop):
+    """Queue ``item`` unless the export was stopped; False if it was"""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _slice_worker(tasks, outputs, stop):
+    conn = None
+    healthy = True
+    try:
+        while not stop.is_set():
+            try:
+                index, (machine_id, start, end) = tasks.get_nowait()
+            except queue.Empty:
+                return
+            out = outputs[index]
+            try:
+                if conn is None:
+                    conn = get_connection()
+                batches = iter_record_batches(conn, machine_id, start, end)
+                try:
+                    for batch in batches:
+                        if not _put(out, batch, stop):
+                            healthy = False
+                            return
+                finally:
+                    batches.close()
+                conn.rollback()
+            except Exception as e:
+                healthy = False
+                _put(out, e, stop)
+                return
+            _put(out, None, stop)
+    finally:
+        if conn is not None:
+            # A COPY cut short can leave the connection unusable
+            release_connection(conn, close=not healthy)
+
+def iter_parallel_batches(slices, workers=None):
+    """Record batches of ``slices`` (see plan_slices), in slice order.
+
+    ``workers`` threads, each with its own pooled connection, export the
+    slices concurrently; every slice buffers at most
+    EXPORT_CONFIG['queue_batches'] batches, so memory stays bounded while
+    the consumer works through them in order. Closing the generator stops
+    the workers and releases their connections.
+    """
+    workers = max(1, min(workers or EXPORT_CONFIG['workers'], len(slices)))
+    tasks = queue.Queue()
+    for task in enumerate(slices):
+        tasks.put(task)
+    outputs = [queue.Queue(maxsize=EXPORT_CONFIG['queue_batches']) for _ in slices]
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=_slice_worker, args=(tasks, outputs, stop),
+                         name=f"export-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        # Slices are taken in order, so the one read here always has a worker
+        for out in outputs:
+            while True:
+                item = out.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file object that collects bytes until drained"""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ExportWriter:
+    """Incremental Arrow IPC stream or Parquet writer for export batches.
+
+    ``arrow`` writes each batch as it comes; ``parquet`` collects batches
+    into row groups of about ``row_group_rows`` rows, so at most one row
+    group is held in memory. ``sink`` is a path or a writable file object.
+    """
+
+    def __init__(self, sink, fmt='parquet', compression=None, row_group_rows=None):
+        self.schema = export_schema()
+        self.fmt = fmt
+        self.row_group_rows = row_group_rows or EXPORT_CONFIG['row_group_rows']
+        self.rows = 0
+        self._pending = []
+        self._pending_rows = 0
+        if fmt == 'arrow':
+            self._writer = pa.ipc.new_stream(
+                sink, self.schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+            )
+        else:
+            self._writer = pq.ParquetWriter(sink, self.schema, compression=compression or 'snappy')
+
+    def write(self, batch):
+        self.rows += batch.num_rows
+        if self.fmt == 'arrow':
+            self._writer.write_batch(batch)
+            return
+        self._pending.append(batch)
+        self._pending_rows += batch.num_rows
+        if self._pending_rows >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write_table(pa.Table.from_batches(self._pending, self.schema),
+                                     row_group_size=self._pending_rows)
+            self._pending, self._pending_rows = [], 0
+
+    def close(self):
+        if self.fmt == 'parquet':
+            self._flush()
+        self._writer.close()
+
+
+def _export_batches(machine_id, start, end, workers):
+    workers = workers or EXPORT_CONFIG['workers']
+    slices = plan_slices(machine_id, start, end, workers * EXPORT_CONFIG['slices_per_worker'])
+    return iter_parallel_batches(slices, workers)
+
+def export_chunks(machine_id, start, end, fmt='parquet', compression=None, workers=None):
+    """Encoded export as a generator of byte chunks, for streaming responses"""
+    sink = _ChunkSink()
+    writer = ExportWriter(pa.PythonFile(sink, mode='w'), fmt, compression)
+    batches = _export_batches(machine_id, start, end, workers)
+    try:
+        for batch in batches:
+            writer.write(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        batches.close()
+    writer.close()
+    yield sink.drain()
+
+def export_to_file(machine_id, start, end, path, fmt='parquet', compression=None, workers=None):
+    """Export a window to ``path``; returns a stats dict with rows and rows per second"""
+    started = time.perf_counter()
+    writer = ExportWriter(path, fmt, compression)
+    try:
+        for batch in _export_batches(machine_id, start, end, workers):
+            writer.write(batch)
+    finally:
+        writer.close()
+    seconds = time.perf_counter() - started
+    return {
+        'rows': writer.rows,
+        'seconds': seconds,
+        'rows_per_second': writer.rows / seconds if seconds else 0.0,
+        'bytes': os.path.getsize(path)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export machine_data as Arrow IPC or Parquet")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--machine", help="machine to export (default: all machines)")
+    parser.add_argument("--days", type=float, default=7, help="window length ending at --end")
+    parser.add_argument("--start", help="window start (ISO 8601, overrides --days)")
+    parser.add_argument("--end", help="window end (ISO 8601, default now)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default=None,
+                        help="default from the output extension, else parquet")
+    parser.add_argument("--compression", help="e.g. zstd, lz4 (arrow) or snappy, zstd, gzip (parquet)")
+    parser.add_argument("--workers", type=int, default=EXPORT_CONFIG['workers'],
+                        help="parallel COPY connections")
+    args = parser.parse_args()
+
+    if not export_available():
+        parser.error("pyarrow is not installed")
+    fmt = args.format or ('arrow' if args.output.endswith(('.arrow', '.arrows', '.ipc')) else 'parquet')
+    try:
+        check_compression(fmt, args.compression)
+    except ValueError as e:
+        parser.error(str(e))
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now(timezone.utc)
+    start = datetime.fromisoformat(args.start) if args.start else end - timedelta(days=args.days)
+
+    stats = export_to_file(args.machine, start, end, args.output, fmt, args.compression, args.workers)
+    print(f"📦 Exported {stats['rows']:,} rows to {args.output} ({fmt}, {stats['bytes'] / 1e6:.1f}MB) "
+          f"in {stats['seconds']:.1f}s, {stats['rows_per_second']:,.0f} rows/s")
@@ -4,6 +4,7 @@ import numpy as np
 from faker import Faker
 from datetime import datetime
 from db import insert_machine_data
+from writer import BufferedWriter
 
 fake = Faker()
 
@@ -199,41 +200,81 @@ def generate_random_parameters(machine_id):
 def generate_multiple_machines(machine_ids):
     return [generate_random_parameters(mid) for mid in machine_ids]
 
-def run_continuous_generation(machine_ids, interval=2):
+def _format_record(timestamp, data):
+    state_info = f"[{data['state']:8s}]"
+    speed_info = f"Speed: {data['cutting_speed']:6.1f}" if data['cutting_speed'] > 0 else "Speed:    0.0"
+    current_info = f"Current: {data['current']:6.2f}A" if data['current'] > 0 else "Current:   0.00A"
+    error_info = f" ERROR: {data['error_code']}" if data['error_code'] else ""
+    
+    return (f"{timestamp.strftime('%H:%M:%S')} | {data['machine_id']:12s} | "
+            f"{state_info} | {speed_info} | {current_info} | {data['material']:18s}{error_info}")
+
+def run_continuous_generation(machine_ids, interval=2, buffered=False, batch_size=500,
+                              flush_interval=1.0, verbose=True):
+    """Generate one record per machine every ``interval`` seconds.
+
+    With ``buffered=True`` records go through a BufferedWriter that
+    group-commits them in the background, and ticks are scheduled on a fixed
+    cadence so slow inserts do not make the loop drift.
+    """
     print(f"Starting continuous data generation for machines: {machine_ids}")
     print(f"Generation interval: {interval} seconds")
     print("Press Ctrl+C to stop\n")
     
     iteration = 0
+    writer = None
+    if buffered:
+        writer = BufferedWriter(batch_size=batch_size, flush_interval=flush_interval).start()
+    next_tick = time.monotonic()
     
     try:
         while True:
             iteration += 1
-            timestamp = datetime.now()
+            # Stamped at generation, not when a buffered batch is flushed
+            timestamp = datetime.now().astimezone()
             
             machine_data = generate_multiple_machines(machine_ids)
             
             for data in machine_data:
+                data['time'] = timestamp
                 try:
-                    insert_machine_data(data)
-                    state_info = f"[{data['state']:8s}]"
-                    speed_info = f"Speed: {data['cutting_speed']:6.1f}" if data['cutting_speed'] > 0 else "Speed:    0.0"
-                    current_info = f"Current: {data['current']:6.2f}A" if data['current'] > 0 else "Current:   0.00A"
-                    error_info = f" ERROR: {data['error_code']}" if data['error_code'] else ""
-                    
-                    print(f"{timestamp.strftime('%H:%M:%S')} | {data['machine_id']:12s} | "
-                          f"{state_info} | {speed_info} | {current_info} | {data['material']:18s}{error_info}")
+                    if writer:
+                        writer.write(data)
+                    else:
+                        insert_machine_data(data)
+                    if verbose:
+                        print(_format_record(timestamp, data))
                     
                 except Exception as e:
                     print(f"Error inserting data for {data['machine_id']}: {e}")
             
-            print(f"--- Iteration {iteration} complete ---\n")
+            if writer:
+                stats = writer.stats()
+                print(f"--- Iteration {iteration} complete | queued {stats['pending']} | "
+                      f"last flush {stats['last_flush_rows']} rows in "
+                      f"{stats['last_flush_seconds'] * 1000:.1f} ms ---\n")
+            else:
+                print(f"--- Iteration {iteration} complete ---\n")
             
-            time.sleep(interval + random.uniform(-0.2, 0.5))  # Adds jitter
+            next_tick += interval + random.uniform(-0.2, 0.5)  # Adds jitter
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                print(f"⚠️ Generation is {-delay:.2f}s behind schedule")
+                next_tick = time.monotonic()
             
     except KeyboardInterrupt:
         print("\n\nStopping data generation...")
         print(f"Total iterations: {iteration}")
+        if writer:
+            print(f"Flushing {writer.pending()} queued records...")
+            writer.close()
+            stats = writer.stats()
+            print(f"Writer: {stats['written']} written, {stats['failed']} failed, "
+                  f"{stats['retries']} retries, "
+                  f"{stats['flushes']} flushes, avg flush "
+                  f"{stats['avg_flush_seconds'] * 1000:.1f} ms")
         print("Data generation stopped successfully.")
 
 
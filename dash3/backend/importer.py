@@ -0,0 +1,563 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from datetime import datetime, timezone
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+from config import IMPORT_CONFIG
+from db import (MACHINE_DATA_COLUMNS, MACHINE_DATA_TYPES, copy_machine_data,
+                get_connection, init_connection_pool, release_connection)
+from latest import latest_table_exists, rebuild_latest
+from rollups import get_watermarks, refresh_rollups
+from state_intervals import intervals_table_exists, rebuild_state_intervals
+
+# ============================================================
+#  BULK IMPORT (CSV / PARQUET)
+# ============================================================
+# Files are split into chunks (byte ranges of a CSV, row groups of a
+# Parquet file). Each chunk is loaded by one worker in one transaction that
+# also records it here, so an interrupted import resumes exactly where the
+# committed chunks end.
+CHECKPOINT_TABLE = "machine_data_import_checkpoints"
+
+# Source column names (lowercased) that differ from machine_data's,
+# e.g. the headers of public/data/realtime_data.csv
+COLUMN_ALIASES = {
+    'timestamp': 'time',
+    'override': 'override_flag',
+    'scrapcut': 'scrap_cut',
+    'din_filename': 'din_file_name',
+}
+
+REQUIRED_COLUMNS = ('time', 'machine_id')
+
+# Rejected rows quoted per chunk; the rest are only counted
+_ERRORS_PER_CHUNK = 5
+
+def create_checkpoint_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            source TEXT NOT NULL,
+            source_size BIGINT NOT NULL,
+            chunk_start BIGINT NOT NULL,
+            chunk_end BIGINT NOT NULL,
+            rows INTEGER NOT NULL,
+            rejected INTEGER NOT NULL,
+            imported_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (source, chunk_start)
+        );
+    """)
+
+# ---------- column mapping and conversion ----------
+def map_columns(names):
+    """machine_data column for each source column (None: not imported).
+
+    Returns ``(mapping, ignored)``. Raises ValueError when a required column
+    is missing or two source columns map to the same target.
+    """
+    mapping, ignored, seen = [], [], {}
+    for name in names:
+        key = name.strip().lower()
+        column = COLUMN_ALIASES.get(key, key)
+        if column not in MACHINE_DATA_TYPES:
+            mapping.append(None)
+            ignored.append(name)
+            continue
+        if column in seen:
+            raise ValueError(f"Columns {seen[column]!r} and {name!r} both map to {column}")
+        seen[column] = name
+        mapping.append(column)
+    missing = [column for column in REQUIRED_COLUMNS if column not in seen]
+    if missing:
+        raise ValueError(f"Required column(s) missing: {', '.join(missing)}")
+    return mapping, ignored
+
+def _to_timestamptz(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    elif not isinstance(value, datetime):
+        raise ValueError(f"not a timestamp: {value!r}")
+    # Naive timestamps are taken as UTC, like everywhere else on the ingest path
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def _to_int4(value):
+    if isinstance(value, str):
+        value = value.strip()
+        number = int(value) if value.lstrip('+-').isdigit() else float(value)
+    else:
+        number = value
+    if isinstance(number, float):
+        if not number.is_integer():
+            raise ValueError(f"not an integer: {value!r}")
+        number = int(number)
+    if not -2**31 <= number < 2**31:
+        raise ValueError(f"integer out of range: {value!r}")
+    return int(number)
+
+_TRUE = {'t', 'true', 'y', 'yes', 'on', '1'}
+_FALSE = {'f', 'false', 'n', 'no', 'off', '0'}
+
+def _to_bool(value):
+    if isinstance(value, str):
+        key = value.strip().lower()
+        if key in _TRUE:
+            return True
+        if key in _FALSE:
+            return False
+        # Numeric flags such as an override of 100 (%)
+        return float(key) != 0
+    return bool(value)
+
+def _to_float8(value):
+    try:
+        return float(value)
+    except ValueError:
+        # Flags exported as booleans, e.g. drilling in realtime_data.csv
+        key = value.strip().lower()
+        if key in _TRUE or key in _FALSE:
+            return float(key in _TRUE)
+        raise
+
+_CONVERTERS = {
+    "timestamptz": _to_timestamptz,
+    "text": str,
+    "float8": _to_float8,
+    "int4": _to_int4,
+    "bool": _to_bool,
+}
+
+def row_converter(mapping):
+    """Function turning one source row into a MACHINE_DATA_COLUMNS tuple.
+
+    Empty strings and None load as NULL, columns absent from the source as
+    NULL. Raises ValueError (or TypeError) for rows that do not fit the
+    schema: wrong field count, unparsable values, no time or machine_id.
+    """
+    positions = {column: index for index, column in enumerate(mapping) if column}
+    plan = [(positions.get(column), _CONVERTERS[MACHINE_DATA_TYPES[column]])
+            for column in MACHINE_DATA_COLUMNS]
+    width = len(mapping)
+
+    def convert(fields):
+        if len(fields) != width:
+            raise ValueError(f"expected {width} fields, found {len(fields)}")
+        row = tuple(
+            None if index is None or (value := fields[index]) is None or value == ''
+            else to_type(value)
+            for index, to_type in plan
+        )
+        if row[0] is None or row[1] is None:
+            raise ValueError("time and machine_id are required")
+        return row
+
+    return convert
+
+# ---------- planning ----------
+def _csv_header(path, delimiter):
+    with open(path, 'rb') as f:
+        line = f.readline()
+    if not line.strip():
+        raise ValueError(f"{path}: no header line")
+    return next(csv.reader([line.decode('utf-8-sig')], delimiter=delimiter))
+
+def plan_file(path, chunk_mb=None, delimiter=','):
+    """Chunk tasks and ignored source columns for one CSV or Parquet file.
+
+    CSV files are cut into byte ranges of ``chunk_mb``; a chunk owns every
+    line that starts inside its range, so quoted fields must not contain
+    line breaks. Parquet files are split by row group.
+    """
+    path = os.path.abspath(path)
+    size = os.path.getsize(path)
+    base = {'source': path, 'size': size}
+
+    if path.lower().endswith(('.parquet', '.pq')):
+        if pq is None:
+            raise ValueError("pyarrow is required to import Parquet files")
+        parquet = pq.ParquetFile(path)
+        mapping, ignored = map_columns(parquet.schema_arrow.names)
+        columns = [name for name, column in zip(parquet.schema_arrow.names, mapping) if column]
+        mapping = [column for column in mapping if column]
+        tasks = [{**base, 'kind': 'parquet', 'start': group, 'end': group + 1,
+                  'columns': columns, 'mapping': mapping,
+                  'weight': parquet.metadata.row_group(group).num_rows}
+                 for group in range(parquet.num_row_groups)]
+        return tasks, ignored
+
+    mapping, ignored = map_columns(_csv_header(path, delimiter))
+    chunk_bytes = max(1, int((chunk_mb or IMPORT_CONFIG['chunk_mb']) * (1 << 20)))
+    tasks = [{**base, 'kind': 'csv', 'start': start, 'end': min(start + chunk_bytes, size),
+              'delimiter': delimiter, 'mapping': mapping,
+              'weight': min(start + chunk_bytes, size) - start}
+             for start in range(0, size, chunk_bytes)]
+    return tasks, ignored
+
+def pending_tasks(cur, tasks, restart=False):
+    """Tasks not yet committed according to the checkpoint table.
+
+    ``restart`` forgets the sources' checkpoints instead (rows already
+    imported stay). Raises ValueError when a source changed size or was
+    checkpointed with different chunk boundaries.
+    """
+    by_source = {}
+    for task in tasks:
+        by_source.setdefault(task['source'], []).append(task)
+
+    pending = []
+    for source, source_tasks in by_source.items():
+        if restart:
+            cur.execute(f"DELETE FROM {CHECKPOINT_TABLE} WHERE source = %s;", (source,))
+            pending.extend(source_tasks)
+            continue
+        cur.execute(f"SELECT chunk_start, chunk_end, source_size FROM {CHECKPOINT_TABLE} "
+                    f"WHERE source = %s;", (source,))
+        done = {row[0]: row for row in cur.fetchall()}
+        planned = {(task['start'], task['end']) for task in source_tasks}
+        size = source_tasks[0]['size']
+        for start, end, source_size in done.values():
+            if source_size != size or (start, end) not in planned:
+                raise ValueError(
+                    f"{source} was partly imported with other chunk boundaries or has changed "
+                    f"since; rerun with the same --chunk-mb, or pass --restart"
+                )
+        pending.extend(task for task in source_tasks if task['start'] not in done)
+    return pending
+
+# ---------- workers ----------
+def _csv_rows(task):
+    """(byte offset, fields) of the lines starting inside the task's range"""
+    with open(task['source'], 'rb') as f:
+        if task['start'] == 0:
+            f.readline()  # header
+        else:
+            # The line running into the range belongs to the previous chunk
+            f.seek(task['start'] - 1)
+            f.readline()
+        position = f.tell()
+        lines = []
+        while position < task['end']:
+            line = f.readline()
+            if not line:
+                break
+            lines.append((position, line))
+            position += len(line)
+            if len(lines) >= 10000 or position >= task['end']:
+                reader = csv.reader((line.decode('utf-8') for _, line in lines),
+                                    delimiter=task['delimiter'])
+                for (offset, _), fields in zip(lines, reader):
+                    yield offset, fields
+                lines = []
+
+def _parquet_rows(task, batch_rows):
+    """(row number, values) of the task's row group"""
+    parquet = pq.ParquetFile(task['source'])
+    offset = 0
+    for batch in parquet.iter_batches(batch_size=batch_rows, row_groups=[task['start']],
+                                      columns=task['columns'], use_threads=False):
+        values = [column.to_pylist() for column in batch.columns]
+        for number, fields in enumerate(zip(*values), offset):
+            yield number, fields
+        offset += batch.num_rows
+
+class _Stopped(Exception):
+    pass
+
+def _import_chunk(task, reports, stop_event, copy_format, batch_rows):
+    convert = row_converter(task['mapping'])
+    if task['kind'] == 'csv':
+        rows, where = _csv_rows(task), "byte"
+    else:
+        rows, where = _parquet_rows(task, batch_rows), f"row group {task['start']} row"
+    result = {'rows': 0, 'rejected': 0, 'errors': [], 'machines': set(), 'min_time': None}
+    batch = []
+    reported = {'rejected': 0}
+
+    def report_progress(rows):
+        reports.put({'type': 'progress', 'rows': rows,
+                     'rejected': result['rejected'] - reported['rejected']})
+        reported['rejected'] = result['rejected']
+
+    def flush(cur):
+        copy_machine_data(cur, batch, copy_format)
+        result['rows'] += len(batch)
+        result['machines'].update(row[1] for row in batch)
+        oldest = min(row[0] for row in batch)
+        if result['min_time'] is None or oldest < result['min_time']:
+            result['min_time'] = oldest
+        report_progress(len(batch))
+        batch.clear()
+
+    conn = get_connection()
+    cur = conn.cursor()
+    healthy = True
+    try:
+        for location, fields in rows:
+            try:
+                batch.append(convert(fields))
+            except (ValueError, TypeError) as e:
+                result['rejected'] += 1
+                if len(result['errors']) < _ERRORS_PER_CHUNK:
+                    result['errors'].append(f"{task['source']} {where} {location}: {e}")
+                continue
+            if len(batch) >= batch_rows:
+                flush(cur)
+                if stop_event.is_set():
+                    raise _Stopped()
+        if batch:
+            flush(cur)
+        elif result['rejected'] > reported['rejected']:
+            report_progress(0)
+        cur.execute(f"""
+            INSERT INTO {CHECKPOINT_TABLE}
+                (source, source_size, chunk_start, chunk_end, rows, rejected)
+            VALUES (%s, %s, %s, %s, %s, %s);
+        """, (task['source'], task['size'], task['start'], task['end'],
+              result['rows'], result['rejected']))
+        conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except Exception:
+            healthy = False
+        raise
+    finally:
+        cur.close()
+        release_connection(conn, close=not healthy)
+    return result
+
+def _import_worker(tasks, reports, stop_event, copy_format, batch_rows):
+    """Loads chunks from ``tasks`` until a None sentinel or stop_event"""
+    # The coordinator handles Ctrl+C and signals shutdown through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_connection_pool(minconn=1, maxconn=2)
+
+    while not stop_event.is_set():
+        task = tasks.get()
+        if task is None:
+            break
+        key = (task['source'], task['start'])
+        try:
+            result = _import_chunk(task, reports, stop_event, copy_format, batch_rows)
+        except _Stopped:
+            reports.put({'type': 'stopped', 'key': key})
+            break
+        except Exception as e:
+            reports.put({'type': 'failed', 'key': key, 'error': str(e)})
+            continue
+        reports.put({'type': 'chunk', 'key': key, 'weight': task['weight'], **result})
+    reports.put({'type': 'exit', 'pid': os.getpid()})
+
+# ---------- coordinator ----------
+def refresh_derived(machine_ids, oldest_time):
+    """Rebuild derived tables after a load that bypassed them.
+
+    State intervals are recomputed for the imported machines, machine_latest
+    is reloaded, and the rollups are refreshed, from scratch when the
+    imported data reaches back past their watermarks.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        if intervals_table_exists(cur):
+            for machine_id in sorted(machine_ids):
+                rebuild_state_intervals(cur, machine_id)
+            print(f"🔄 State intervals rebuilt for {len(machine_ids):,} machines")
+        if latest_table_exists(cur):
+            rebuild_latest(cur)
+            print("🔄 Latest rows reloaded")
+        watermarks = get_watermarks(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
+    try:
+        refresh_rollups(rebuild=bool(watermarks) and oldest_time < min(watermarks.values()))
+    except RuntimeError:
+        pass  # rollups are not set up
+
+def run_import(paths, workers=None, chunk_mb=None, batch_rows=None, copy_format=None,
+               max_errors=None, restart=False, derived=True, delimiter=','):
+    """Load CSV/Parquet files into machine_data with parallel COPY workers.
+
+    Columns are matched to machine_data by name (see COLUMN_ALIASES);
+    unknown ones are ignored and rows that do not fit the schema are
+    rejected and counted. Every chunk commits together with its checkpoint,
+    so running the same command again after an interruption or failure
+    loads only the remaining chunks. The import stops once more than
+    ``max_errors`` rows have been rejected. Derived tables are rebuilt at
+    the end unless ``derived`` is False. Returns a stats dict.
+    """
+    workers = workers or IMPORT_CONFIG['workers']
+    batch_rows = batch_rows or IMPORT_CONFIG['batch_rows']
+    copy_format = copy_format or IMPORT_CONFIG['copy_format']
+    max_errors = IMPORT_CONFIG['max_errors'] if max_errors is None else max_errors
+
+    tasks = []
+    for path in paths:
+        file_tasks, ignored = plan_file(path, chunk_mb, delimiter)
+        if ignored:
+            print(f"⚠️ {path}: ignoring columns not in machine_data: {', '.join(ignored)}")
+        tasks.extend(file_tasks)
+
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        create_checkpoint_table(cur)
+        pending = pending_tasks(cur, tasks, restart)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
+
+    total_weight = sum(task['weight'] for task in pending) or 1
+    print(f"Importing {len(paths)} file(s): {len(pending)} of {len(tasks)} chunks pending, "
+          f"{workers} workers")
+    stats = {'rows': 0, 'rejected': 0, 'chunks': 0, 'failed': 0,
+             'skipped_chunks': len(tasks) - len(pending), 'seconds': 0.0, 'rows_per_sec': 0.0}
+    if not pending:
+        return stats
+
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    task_queue = ctx.Queue()
+    reports = ctx.Queue()
+    for task in pending:
+        task_queue.put(task)
+    workers = min(workers, len(pending))
+    for _ in range(workers):
+        task_queue.put(None)
+
+    processes = [
+        ctx.Process(target=_import_worker,
+                    args=(task_queue, reports, stop_event, copy_format, batch_rows),
+                    name=f"import-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    machines = set()
+    oldest_time = None
+    done_weight = 0
+    copied = 0
+    exited = 0
+    started = time.monotonic()
+    last_report, last_copied = started, 0
+
+    def absorb(report):
+        nonlocal oldest_time, done_weight, copied, exited
+        kind = report['type']
+        if kind == 'progress':
+            copied += report['rows']
+            stats['rejected'] += report['rejected']
+        elif kind == 'chunk':
+            stats['rows'] += report['rows']
+            stats['chunks'] += 1
+            done_weight += report['weight']
+            machines.update(report['machines'])
+            if report['min_time'] is not None and (oldest_time is None or report['min_time'] < oldest_time):
+                oldest_time = report['min_time']
+            for error in report['errors']:
+                print(f"⚠️ Rejected {error}")
+        elif kind == 'failed':
+            stats['failed'] += 1
+            print(f"❌ Chunk {report['key'][0]}@{report['key'][1]} failed: {report['error']}")
+            stop_event.set()
+        elif kind == 'exit':
+            exited += 1
+
+    try:
+        while exited < len(processes):
+            try:
+                absorb(reports.get(timeout=0.5))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+            if max_errors >= 0 and stats['rejected'] > max_errors and not stop_event.is_set():
+                print(f"❌ More than {max_errors} rows rejected; stopping")
+                stop_event.set()
+
+            now = time.monotonic()
+            if now - last_report >= IMPORT_CONFIG['report_interval']:
+                elapsed = now - started
+                fraction = done_weight / total_weight
+                eta = f"{elapsed / fraction - elapsed:,.0f}s" if fraction else "?"
+                print(f"{datetime.now():%H:%M:%S} | {(copied - last_copied) / (now - last_report):10,.0f} rows/sec | "
+                      f"{copied:,} rows | chunks {stats['chunks']}/{len(pending)} ({fraction:.0%}) | "
+                      f"ETA {eta} | rejected {stats['rejected']:,}")
+                last_report, last_copied = now, copied
+    except KeyboardInterrupt:
+        print("\n\nStopping import; chunks in progress are rolled back...")
+        stop_event.set()
+        while exited < len(processes) and any(process.is_alive() for process in processes):
+            try:
+                absorb(reports.get(timeout=0.5))
+            except queue.Empty:
+                pass
+    finally:
+        stop_event.set()
+        # Tasks left in the queue must not block the coordinator's exit
+        task_queue.cancel_join_thread()
+        for process in processes:
+            process.join(timeout=5)
+
+    elapsed = time.monotonic() - started
+    stats['seconds'] = round(elapsed, 1)
+    stats['rows_per_sec'] = round(stats['rows'] / elapsed, 1) if elapsed else 0.0
+    print(f"Imported {stats['rows']:,} rows in {stats['chunks']} chunks in {elapsed:.1f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/sec) | rejected {stats['rejected']:,} | "
+          f"failed chunks {stats['failed']}")
+    if stats['chunks'] < len(pending):
+        print(f"⚠️ {len(pending) - stats['chunks']} chunks not imported; "
+              f"run the same command again to resume")
+
+    # Also after a failure or Ctrl+C: a resumed run only knows its own machines
+    if derived and machines:
+        refresh_derived(machines, oldest_time)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import CSV/Parquet files into machine_data")
+    parser.add_argument("files", nargs="+", help="CSV or Parquet (.parquet) files")
+    parser.add_argument("--workers", type=int, default=IMPORT_CONFIG['workers'],
+                        help="parallel COPY processes")
+    parser.add_argument("--chunk-mb", type=float, default=IMPORT_CONFIG['chunk_mb'],
+                        help="CSV bytes per chunk (must stay the same when resuming)")
+    parser.add_argument("--batch-rows", type=int, default=IMPORT_CONFIG['batch_rows'],
+                        help="rows per COPY")
+    parser.add_argument("--format", choices=["text", "binary"], default=IMPORT_CONFIG['copy_format'],
+                        help="COPY format")
+    parser.add_argument("--delimiter", default=",", help="CSV field delimiter")
+    parser.add_argument("--max-errors", type=int, default=IMPORT_CONFIG['max_errors'],
+                        help="stop after more rejected rows than this (-1: never)")
+    parser.add_argument("--restart", action="store_true",
+                        help="forget checkpoints of these files and import them from the start")
+    parser.add_argument("--skip-derived", action="store_true",
+                        help="do not rebuild intervals, latest rows and rollups afterwards")
+    args = parser.parse_args()
+
+    try:
+        run_import(args.files, workers=args.workers, chunk_mb=args.chunk_mb,
+                   batch_rows=args.batch_rows, copy_format=args.format,
+                   max_errors=args.max_errors, restart=args.restart,
+                   derived=not args.skip_derived, delimiter=args.delimiter)
+    except ValueError as e:
+        parser.error(str(e))
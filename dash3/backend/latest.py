@@ -0,0 +1,187 @@
+import argparse
+import threading
+import time
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+
+# ============================================================
+#  LATEST ROW PER MACHINE
+# ============================================================
+# Same columns as machine_data, one row per machine, upserted on ingest so
+# "latest value" reads never touch the history.
+LATEST_TABLE = "machine_latest"
+
+def create_latest_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LATEST_TABLE} (
+            LIKE machine_data INCLUDING DEFAULTS,
+            PRIMARY KEY (machine_id)
+        );
+    """)
+
+def rebuild_latest(cur):
+    """Reload machine_latest from machine_data"""
+    cur.execute(f"LOCK TABLE {LATEST_TABLE} IN EXCLUSIVE MODE;")
+    cur.execute(f"DELETE FROM {LATEST_TABLE};")
+    cur.execute(f"""
+        INSERT INTO {LATEST_TABLE}
+        SELECT DISTINCT ON (machine_id) *
+        FROM machine_data
+        ORDER BY machine_id, time DESC;
+    """)
+    return cur.rowcount
+
+def latest_table_exists(cur):
+    with cur.connection.cursor() as plain:
+        plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (LATEST_TABLE,))
+        return plain.fetchone()[0]
+
+def record_latest(cur, columns, rows):
+    """Upsert the newest of ``rows`` (tuples in ``columns`` order) per machine.
+
+    Runs in the caller's transaction. A stored row is only replaced by a
+    newer one, so late or replayed samples never move a machine backwards.
+    """
+    time_index = columns.index("time")
+    machine_index = columns.index("machine_id")
+    newest = {}
+    for row in rows:
+        current = newest.get(row[machine_index])
+        if current is None or row[time_index] >= current[time_index]:
+            newest[row[machine_index]] = row
+    if not newest:
+        return 0
+
+    column_list = ", ".join(columns)
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != "machine_id")
+    with cur.connection.cursor() as plain:
+        execute_values(plain, f"""
+            INSERT INTO {LATEST_TABLE} ({column_list}) VALUES %s
+            ON CONFLICT (machine_id) DO UPDATE SET {updates}
+            WHERE {LATEST_TABLE}.time <= EXCLUDED.time;
+        """, sorted(newest.values(), key=lambda r: r[machine_index]), page_size=1000)
+    return len(newest)
+
+# ============================================================
+#  API CACHE
+# ============================================================
+class LatestCache:
+    """In-process snapshot of the latest row of every machine.
+
+    ``loader()`` returns the rows (dicts with machine_id and time). The
+    snapshot is reloaded when it is older than ``max_age`` seconds, so
+    readers never see data staler than that plus the loader's own latency;
+    concurrent readers of a stale snapshot wait for a single reload.
+    invalidate() (called on change notifications) makes the next read
+    reload as soon as the snapshot is ``min_age`` seconds old, which caps
+    reloads under constant ingest. If a reload fails the previous snapshot
+    keeps being served and the error is counted, up to ``max_stale``
+    seconds after which the error propagates.
+    """
+
+    def __init__(self, loader, max_age=2.0, max_stale=30.0, min_age=0.25):
+        self.loader = loader
+        self.max_age = max_age
+        self.max_stale = max_stale
+        self.min_age = min_age
+        self._lock = threading.Lock()
+        self._rows = None
+        self._by_machine = {}
+        self._loaded_at = None
+        self._invalidated = False
+        self._counters = {'hits': 0, 'reloads': 0, 'reload_errors': 0, 'invalidations': 0,
+                          'reload_seconds_total': 0.0, 'reload_seconds_max': 0.0}
+
+    def age(self):
+        return None if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    def _fresh(self, age):
+        if age is None or age > self.max_age:
+            return False
+        return not (self._invalidated and age >= self.min_age)
+
+    def _snapshot(self):
+        if self._fresh(self.age()):
+            self._counters['hits'] += 1
+            return
+        with self._lock:
+            age = self.age()
+            if self._fresh(age):
+                self._counters['hits'] += 1
+                return
+            started = time.monotonic()
+            # Changes notified during the reload mark the new snapshot stale again
+            self._invalidated = False
+            try:
+                rows = self.loader()
+            except Exception:
+                self._invalidated = True
+                self._counters['reload_errors'] += 1
+                if age is None or age > self.max_stale:
+                    raise
+                return
+            elapsed = time.monotonic() - started
+            self._rows = rows
+            self._by_machine = {row['machine_id']: row for row in rows}
+            self._loaded_at = time.monotonic()
+            self._counters['reloads'] += 1
+            self._counters['reload_seconds_total'] += elapsed
+            self._counters['reload_seconds_max'] = max(self._counters['reload_seconds_max'], elapsed)
+
+    def all(self):
+        """Latest rows of all machines, ordered by machine_id"""
+        self._snapshot()
+        return self._rows
+
+    def get(self, machine_id):
+        """Latest row of one machine, or None"""
+        self._snapshot()
+        return self._by_machine.get(machine_id)
+
+    def invalidate(self):
+        """Mark the snapshot outdated; the next read after min_age reloads"""
+        self._invalidated = True
+        self._counters['invalidations'] += 1
+
+    def stats(self):
+        """Counters plus snapshot age and the age of its newest sample"""
+        newest = max((row['time'] for row in self._rows), default=None) if self._rows else None
+        reloads = self._counters['reloads']
+        return {
+            **self._counters,
+            'reload_seconds_avg': self._counters['reload_seconds_total'] / reloads if reloads else 0.0,
+            'max_age': self.max_age,
+            'min_age': self.min_age,
+            'invalidated': self._invalidated,
+            'age': self.age(),
+            'machines': len(self._by_machine),
+            'newest_sample': newest.isoformat() if newest else None,
+            'newest_sample_lag': (datetime.now(timezone.utc) - newest).total_seconds() if newest else None
+        }
+
+
+if __name__ == "__main__":
+    from db import get_connection, release_connection
+
+    parser = argparse.ArgumentParser(description="Maintain machine_latest")
+    parser.add_argument("command", choices=["setup", "rebuild"],
+                        help="setup creates the table (seeding it when empty), rebuild reloads it")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        create_latest_table(cur)
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {LATEST_TABLE});")
+        if args.command == "rebuild" or not cur.fetchone()[0]:
+            count = rebuild_latest(cur)
+            print(f"🔁 Loaded latest rows for {count} machines")
+        conn.commit()
+        print("✅ machine_latest ready")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error maintaining machine_latest: {e}")
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
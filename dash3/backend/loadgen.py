@@ -0,0 +1,169 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from datetime import datetime, timezone
+
+# ============================================================
+#  SHARDED LOAD GENERATOR
+# ============================================================
+def shard_machine_ids(machine_ids, workers):
+    """Split machine ids round-robin into ``workers`` shards"""
+    return [machine_ids[i::workers] for i in range(workers) if machine_ids[i::workers]]
+
+def _shard_worker(shard_index, machine_ids, interval, stop_event, reports,
+                  report_interval, method, copy_format, seed, notify):
+    """Owns one shard: its FleetSimulator state and its own connection pool"""
+    # The coordinator handles Ctrl+C and signals shutdown through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Imported here so each spawned process builds its own pool
+    from batch_generator import FleetSimulator
+    from db import bulk_insert_machine_data, init_connection_pool
+
+    init_connection_pool(minconn=1, maxconn=2)
+    fleet = FleetSimulator(machine_ids, seed=seed)
+    window = {'ticks': 0, 'rows': 0, 'errors': 0, 'max_lag': 0.0, 'insert_seconds': 0.0}
+    next_tick = time.monotonic()
+    last_report = next_tick
+
+    while not stop_event.is_set():
+        rows = fleet.to_rows(fleet.step(), datetime.now(timezone.utc))
+        try:
+            result = bulk_insert_machine_data(
+                rows, method=method, copy_format=copy_format, batch_size=len(rows),
+                notify=notify
+            )
+            window['rows'] += result['rows']
+            window['insert_seconds'] += result['seconds']
+        except Exception as e:
+            window['errors'] += 1
+            print(f"❌ Shard {shard_index}: insert failed: {e}")
+        window['ticks'] += 1
+
+        now = time.monotonic()
+        if now - last_report >= report_interval:
+            reports.put({'shard': shard_index, 'pid': os.getpid(), **window})
+            window = dict.fromkeys(window, 0)
+            window['max_lag'] = 0.0
+            last_report = now
+
+        next_tick += interval
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            stop_event.wait(delay)
+        else:
+            window['max_lag'] = max(window['max_lag'], -delay)
+            next_tick = time.monotonic()
+
+    reports.put({'shard': shard_index, 'pid': os.getpid(), 'final': True, **window})
+
+def run_sharded_generation(machine_ids, workers=None, interval=2, duration=None,
+                           report_interval=5, method="copy", copy_format="binary", seed=None,
+                           notify=True):
+    """Generate data for a large fleet across a pool of processes.
+
+    Each worker process owns the state of its shard of ``machine_ids`` and
+    writes its rows through its own connection. The coordinator aggregates
+    throughput, lag behind the target interval and error counts from the
+    workers' periodic reports. Runs until ``duration`` seconds elapse or
+    Ctrl+C. With a ``seed`` each machine's data is reproducible regardless
+    of how many workers are used. ``notify=False`` drops the per-tick
+    NOTIFY, whose commit-time lock serializes the shards' commits, when
+    measuring raw ingest throughput.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shard_machine_ids(list(machine_ids), workers)
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    reports = ctx.Queue()
+
+    print(f"Starting sharded generation: {len(machine_ids)} machines across {len(shards)} workers")
+    print(f"Target interval: {interval} seconds ({len(machine_ids) / interval:,.0f} rows/sec)")
+    print("Press Ctrl+C to stop\n")
+
+    processes = [
+        ctx.Process(
+            target=_shard_worker,
+            args=(i, shard, interval, stop_event, reports, report_interval, method, copy_format, seed,
+                  notify),
+            name=f"loadgen-shard-{i}",
+            daemon=True
+        )
+        for i, shard in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+
+    totals = {'ticks': 0, 'rows': 0, 'errors': 0, 'max_lag': 0.0}
+    started = time.monotonic()
+    window_started = started
+    window = {'rows': 0, 'errors': 0, 'max_lag': 0.0, 'insert_seconds': 0.0}
+    finished = set()
+
+    def absorb(report):
+        for key in ('ticks', 'rows', 'errors'):
+            totals[key] += report[key]
+        totals['max_lag'] = max(totals['max_lag'], report['max_lag'])
+        for key in ('rows', 'errors', 'insert_seconds'):
+            window[key] += report[key]
+        window['max_lag'] = max(window['max_lag'], report['max_lag'])
+        if report.get('final'):
+            finished.add(report['shard'])
+
+    try:
+        while duration is None or time.monotonic() - started < duration:
+            try:
+                absorb(reports.get(timeout=0.5))
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if now - window_started >= report_interval:
+                elapsed = now - window_started
+                print(f"{datetime.now():%H:%M:%S} | {window['rows'] / elapsed:10,.0f} rows/sec | "
+                      f"max lag {window['max_lag']:5.2f}s | errors {window['errors']} | "
+                      f"total {totals['rows']:,}")
+                window = dict.fromkeys(window, 0)
+                window['max_lag'] = 0.0
+                window_started = now
+    except KeyboardInterrupt:
+        print("\n\nStopping sharded generation...")
+    finally:
+        stop_event.set()
+        deadline = time.monotonic() + interval + 10
+        while len(finished) < len(processes) and time.monotonic() < deadline:
+            try:
+                absorb(reports.get(timeout=0.5))
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes):
+                    break
+        for process in processes:
+            process.join(timeout=5)
+
+    elapsed = time.monotonic() - started
+    totals['seconds'] = round(elapsed, 1)
+    totals['rows_per_sec'] = round(totals['rows'] / elapsed, 1) if elapsed else 0.0
+    print(f"Total rows: {totals['rows']:,} in {elapsed:.1f}s ({totals['rows_per_sec']:,.0f} rows/sec)")
+    print(f"Max lag: {totals['max_lag']:.2f}s | Errors: {totals['errors']}")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded multi-process CNC load generator")
+    parser.add_argument("--machines", type=int, default=5000, help="number of machines (machine_1..N)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--interval", type=float, default=2, help="seconds between ticks")
+    parser.add_argument("--duration", type=float, default=None, help="stop after N seconds")
+    parser.add_argument("--method", choices=["copy", "values"], default="copy")
+    parser.add_argument("--format", choices=["text", "binary"], default="binary")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible data")
+    parser.add_argument("--no-notify", action="store_true", help="skip change notifications")
+    args = parser.parse_args()
+
+    machine_ids = [f"machine_{i}" for i in range(1, args.machines + 1)]
+    run_sharded_generation(machine_ids, workers=args.workers, interval=args.interval,
+                           duration=args.duration, method=args.method, copy_format=args.format,
+                           seed=args.seed, notify=not args.no_notify)
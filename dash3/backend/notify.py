@@ -0,0 +1,168 @@
+import json
+import select
+import threading
+import time
+from datetime import datetime
+import psycopg2
+from psycopg2 import extensions
+from config import DB_CONFIG
+
+# ============================================================
+#  CHANGE NOTIFICATIONS
+# ============================================================
+# Writers send one (machine_id, time, state) entry per machine and batch on
+# this channel; Postgres delivers them at commit, so listeners never see
+# rows that were rolled back.
+NOTIFY_CHANNEL = "machine_data_changes"
+
+# NOTIFY payloads must stay below 8000 bytes
+_MAX_PAYLOAD = 7500
+
+def notify_changes(cur, rows):
+    """Queue change notifications for ``rows`` in the caller's transaction.
+
+    ``rows`` are (machine_id, time, state) tuples; only the newest entry of
+    each machine is sent. Returns the number of NOTIFY calls issued.
+    """
+    newest = {}
+    for machine_id, sample_time, state in rows:
+        current = newest.get(machine_id)
+        if current is None or sample_time >= current[1]:
+            newest[machine_id] = (machine_id, sample_time, state)
+
+    payloads = []
+    chunk, size = [], 2
+    for machine_id, sample_time, state in newest.values():
+        entry = json.dumps([machine_id, sample_time.isoformat(), state], separators=(",", ":"))
+        if chunk and size + len(entry) + 1 > _MAX_PAYLOAD:
+            payloads.append("[" + ",".join(chunk) + "]")
+            chunk, size = [], 2
+        chunk.append(entry)
+        size += len(entry) + 1
+    if chunk:
+        payloads.append("[" + ",".join(chunk) + "]")
+
+    with cur.connection.cursor() as plain:
+        for payload in payloads:
+            plain.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, payload))
+    return len(payloads)
+
+def parse_changes(payload):
+    """(machine_id, time, state) tuples from one notification payload"""
+    return [(machine_id, datetime.fromisoformat(sample_time), state)
+            for machine_id, sample_time, state in json.loads(payload)]
+
+
+class ChangeListener:
+    """One dedicated LISTEN connection fanned out to in-process consumers.
+
+    Consumers register with ``subscribe(on_changes, on_reset)``.
+    ``on_changes(changes)`` is called on the listener thread with the
+    (machine_id, time, state) tuples of each notification and must not
+    block. ``on_reset()`` is called after every (re)connect, because
+    notifications sent while disconnected are lost and consumers have to
+    resynchronize. The connection lives outside the pool and reconnects
+    with exponential backoff.
+    """
+
+    def __init__(self, channel=NOTIFY_CHANNEL, ping_interval=30.0, max_backoff=30.0):
+        self.channel = channel
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        self._consumers = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._connected = False
+        self._counters = {'notifications': 0, 'changes': 0, 'reconnects': 0,
+                          'consumer_errors': 0, 'bad_payloads': 0}
+        self._last_notification = None
+
+    def subscribe(self, on_changes, on_reset=None):
+        with self._lock:
+            self._consumers.append((on_changes, on_reset))
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="change-listener", daemon=True)
+                self._thread.start()
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**DB_CONFIG)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel};")
+                self._connected = True
+                backoff = 1.0
+                self._dispatch_reset()
+                self._listen(conn)
+            except Exception as e:
+                print(f"⚠️ Change listener disconnected: {e}")
+            finally:
+                self._connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._counters['reconnects'] += 1
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _listen(self, conn):
+        last_ping = time.monotonic()
+        while True:
+            readable, _, _ = select.select([conn], [], [], self.ping_interval)
+            if not readable:
+                if time.monotonic() - last_ping >= self.ping_interval:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1;")
+                    last_ping = time.monotonic()
+                continue
+            conn.poll()
+            while conn.notifies:
+                self._dispatch(conn.notifies.pop(0).payload)
+
+    def _dispatch(self, payload):
+        try:
+            changes = parse_changes(payload)
+        except (ValueError, TypeError):
+            self._counters['bad_payloads'] += 1
+            return
+        self._counters['notifications'] += 1
+        self._counters['changes'] += len(changes)
+        self._last_notification = time.time()
+        for on_changes, _ in list(self._consumers):
+            try:
+                on_changes(changes)
+            except Exception as e:
+                self._counters['consumer_errors'] += 1
+                print(f"⚠️ Change consumer failed: {e}")
+
+    def _dispatch_reset(self):
+        for _, on_reset in list(self._consumers):
+            if on_reset is None:
+                continue
+            try:
+                on_reset()
+            except Exception as e:
+                self._counters['consumer_errors'] += 1
+                print(f"⚠️ Change consumer reset failed: {e}")
+
+    def stats(self):
+        return {
+            **self._counters,
+            'channel': self.channel,
+            'connected': self._connected,
+            'consumers': len(self._consumers),
+            'seconds_since_notification': (time.time() - self._last_notification
+                                           if self._last_notification else None)
+        }
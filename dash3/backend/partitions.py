@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta, timezone
+
+# ============================================================
+#  NATIVE TIME PARTITIONS
+# ============================================================
+# Used when TimescaleDB is not installed and create_table() is asked to
+# partition machine_data by time. Partitions are aligned, fixed-width UTC
+# ranges named machine_data_pYYYYMMDD after their lower bound; rows outside
+# every partition land in the default partition, so inserts never fail.
+PARTITION_PREFIX = "machine_data_p"
+DEFAULT_PARTITION = "machine_data_default"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def partition_name(lower):
+    return f"{PARTITION_PREFIX}{lower:%Y%m%d}"
+
+def is_partitioned(cur):
+    """True if machine_data is a natively partitioned table"""
+    with cur.connection.cursor() as plain:
+        plain.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_partitioned_table
+                WHERE partrelid = to_regclass('machine_data')
+            );
+        """)
+        return plain.fetchone()[0]
+
+def list_partitions(cur):
+    """(name, lower, upper) of machine_data's partitions, oldest first.
+
+    The default partition has no bounds and is listed last.
+    """
+    with cur.connection.cursor() as plain:
+        plain.execute(r"""
+            SELECT c.relname,
+                   (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\)'))[1]::timestamptz,
+                   (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::timestamptz
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'machine_data'::regclass
+            ORDER BY 2 NULLS LAST;
+        """)
+        return plain.fetchall()
+
+def create_default_partition(cur):
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF machine_data DEFAULT;")
+
+def _create_partition(cur, name, lower, upper):
+    # Rows already caught by the default partition move into the new one;
+    # ATTACH refuses a range the default partition still holds rows for
+    cur.execute(f"CREATE TABLE {name} (LIKE machine_data INCLUDING DEFAULTS);")
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE time >= %(lower)s AND time < %(upper)s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+    """, {'lower': lower, 'upper': upper})
+    cur.execute(f"""
+        ALTER TABLE machine_data ATTACH PARTITION {name}
+        FOR VALUES FROM (%(lower)s) TO (%(upper)s);
+    """, {'lower': lower, 'upper': upper})
+
+def ensure_partitions(cur, start, end, interval_days=1):
+    """Create the partitions missing to cover [start, end).
+
+    Ranges are ``interval_days`` wide and aligned to the Unix epoch; a slot
+    overlapping an existing partition (e.g. one made with another width) is
+    left to it. Runs in the caller's transaction. Returns the names created.
+    """
+    width = timedelta(days=interval_days)
+    existing = [(lower, upper) for _, lower, upper in list_partitions(cur) if lower is not None]
+    lower = _EPOCH + (start - _EPOCH) // width * width
+    created = []
+    while lower < end:
+        upper = lower + width
+        if not any(a < upper and lower < b for a, b in existing):
+            name = partition_name(lower)
+            _create_partition(cur, name, lower, upper)
+            existing.append((lower, upper))
+            created.append(name)
+        lower = upper
+    return created
+
+def drop_partitions_before(cur, cutoff):
+    """Drop partitions whose whole range is older than ``cutoff``.
+
+    Returns ``[(name, estimated_rows)]``; the estimates come from the
+    planner statistics, so nothing is scanned.
+    """
+    dropped = []
+    for name, lower, upper in list_partitions(cur):
+        if upper is None or upper > cutoff:
+            continue
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass;", (name,))
+        dropped.append((name, max(cur.fetchone()[0], 0)))
+        cur.execute(f"DROP TABLE {name};")
+    return dropped
@@ -0,0 +1,173 @@
+import argparse
+import json
+import random
+import time
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from batch_generator import FleetSimulator, CATEGORIES, columns_to_rows
+from db import bulk_insert_machine_data, notify_latest
+
+# ============================================================
+#  RECORD / REPLAY
+# ============================================================
+FORMAT_VERSION = 1
+
+# Narrowest dtype that holds each generated column losslessly
+COLUMN_DTYPES = {
+    'state': np.int8, 'program_state': np.int8, 'technology_name': np.int8,
+    'technology_dataset': np.int8, 'material': np.int8, 'gas_type': np.int8,
+    'error_text': np.int8, 'error_parameter': np.int16,
+    'technology_index': np.int8, 'error_code': np.int16, 'error_level': np.int8,
+    'din_file_name': np.int16,
+    'current': np.float64, 'drilling': np.float64, 'cutting_speed': np.float64,
+    'thickness': np.float64, 'drilling_depth': np.float64,
+    'override_flag': np.bool_, 'homing': np.bool_, 'homed': np.bool_,
+    'arc': np.bool_, 'arc_ignite': np.bool_, 'scrap_cut': np.bool_,
+    'arc_error': np.bool_
+}
+
+def record_run(machine_ids, ticks, path, seed=None, interval=2):
+    """Generate ``ticks`` ticks for ``machine_ids`` and save them to ``path``.
+
+    The file is a compressed .npz holding one (ticks, machines) array per
+    column in COLUMN_DTYPES, the tick offsets in seconds and the category
+    labels, so it can be replayed without re-running the simulation.
+    """
+    fleet = FleetSimulator(machine_ids, seed=seed)
+    jitter = random.Random(seed)
+    columns = {name: np.empty((ticks, len(fleet)), dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+    offsets = np.empty(ticks)
+    offset = 0.0
+
+    for tick in range(ticks):
+        step = fleet.step()
+        for name, values in step.items():
+            columns[name][tick] = values
+        offsets[tick] = offset
+        offset += interval + jitter.uniform(-0.2, 0.5)
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'seed': seed,
+        'interval': interval,
+        'recorded_at': datetime.now(timezone.utc).isoformat(),
+        'categories': CATEGORIES
+    }
+    np.savez_compressed(
+        path,
+        machine_ids=np.array(fleet.machine_ids),
+        tick_offsets=offsets,
+        meta=np.array(json.dumps(meta)),
+        **columns
+    )
+    print(f"💾 Recorded {ticks} ticks x {len(fleet)} machines to {path}")
+
+def load_run(path):
+    """Load a recorded run, checking it matches the current category labels"""
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version: {meta.get('version')}")
+        if meta['categories'] != {k: list(v) for k, v in CATEGORIES.items()}:
+            raise ValueError("Recording was made with different category labels")
+        return {
+            'meta': meta,
+            'machine_ids': data['machine_ids'].tolist(),
+            'tick_offsets': data['tick_offsets'],
+            'columns': {name: data[name] for name in COLUMN_DTYPES}
+        }
+
+def replay_run(path, speed=1.0, start=None, batch_size=20000,
+               method="copy", copy_format="binary", notify=None):
+    """Insert a recorded run into machine_data.
+
+    Timestamps keep the recorded spacing starting at ``start`` (default now).
+    ``speed`` scales wall-clock pacing: 1.0 is real time, 10 is ten times
+    faster and 0 inserts as fast as the database accepts, in batches of about
+    ``batch_size`` rows. ``notify`` sends change notifications per batch like
+    a live writer; it defaults to paced replays only, max-speed replays send
+    one summary at the end. Returns rows, seconds, rows/sec and max lag.
+    """
+    if notify is None:
+        notify = bool(speed)
+    run = load_run(path)
+    machine_ids = run['machine_ids']
+    offsets = run['tick_offsets']
+    columns = run['columns']
+    n_machines = len(machine_ids)
+    n_ticks = len(offsets)
+    start = start or datetime.now(timezone.utc)
+    ticks_per_batch = max(1, batch_size // max(n_machines, 1))
+
+    print(f"▶️ Replaying {n_ticks} ticks x {n_machines} machines "
+          f"({'max speed' if not speed else f'{speed}x'})")
+    stats = {'rows': 0, 'batches': 0, 'max_lag': 0.0}
+    started = time.monotonic()
+    tick = 0
+
+    while tick < n_ticks:
+        if speed:
+            # Send every tick that is already due, and at least one
+            elapsed = (time.monotonic() - started) * speed
+            end = max(tick + 1, int(np.searchsorted(offsets, elapsed, side='right')))
+            stats['max_lag'] = max(stats['max_lag'], (elapsed - offsets[tick]) / speed)
+        else:
+            end = tick + ticks_per_batch
+        end = min(end, n_ticks)
+
+        batch_columns = {name: values[tick:end].reshape(-1) for name, values in columns.items()}
+        timestamps = [start + timedelta(seconds=float(o)) for o in offsets[tick:end]]
+        rows = columns_to_rows(
+            machine_ids * (end - tick),
+            batch_columns,
+            [ts for ts in timestamps for _ in range(n_machines)]
+        )
+        result = bulk_insert_machine_data(rows, method=method, copy_format=copy_format,
+                                          batch_size=len(rows), notify=notify)
+        stats['rows'] += result['rows']
+        stats['batches'] += 1
+        tick = end
+
+        if speed and tick < n_ticks:
+            delay = offsets[tick] / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    if not notify and stats['rows']:
+        notify_latest(machine_ids)
+
+    elapsed = time.monotonic() - started
+    stats['seconds'] = round(elapsed, 2)
+    stats['rows_per_sec'] = round(stats['rows'] / elapsed, 1) if elapsed else 0.0
+    print(f"✅ Replayed {stats['rows']:,} rows in {elapsed:.1f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/sec, max lag {stats['max_lag']:.2f}s)")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and replay generator runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="generate a run and save it to a file")
+    record.add_argument("path")
+    record.add_argument("--machines", type=int, default=100, help="number of machines (machine_1..N)")
+    record.add_argument("--ticks", type=int, default=1800)
+    record.add_argument("--interval", type=float, default=2)
+    record.add_argument("--seed", type=int, default=None)
+
+    replay = commands.add_parser("replay", help="insert a recorded run into the database")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, default=1.0, help="pacing multiplier, 0 = max speed")
+    replay.add_argument("--batch-size", type=int, default=20000)
+    replay.add_argument("--method", choices=["copy", "values"], default="copy")
+    replay.add_argument("--format", choices=["text", "binary"], default="binary")
+    replay.add_argument("--notify", action=argparse.BooleanOptionalAction, default=None,
+                        help="NOTIFY per batch (default: only when paced)")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        machine_ids = [f"machine_{i}" for i in range(1, args.machines + 1)]
+        record_run(machine_ids, args.ticks, args.path, seed=args.seed, interval=args.interval)
+    else:
+        replay_run(args.path, speed=args.speed, batch_size=args.batch_size,
+                   method=args.method, copy_format=args.format, notify=args.notify)
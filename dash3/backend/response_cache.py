@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ============================================================
+#  RANGE-ALIGNED RESPONSE CACHE
+# ============================================================
+class ResponseCache:
+    """LRU cache of serialized responses keyed on (endpoint, machine, range, ...).
+
+    ``ranges`` maps a range name ('1h', '30d', ...) to its policy:
+    ``ttl`` is how long an entry is served, ``min_age`` how old it must be
+    before a change notification for its machine may evict it. Entries are
+    stored with their machine so invalidation only touches that machine's
+    entries (and fleet-wide ones, stored with machine None). At most
+    ``max_entries`` entries are kept; the least recently used go first.
+    """
+
+    def __init__(self, ranges, max_entries=512):
+        self.ranges = ranges
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_machine = {}
+        self._counters = {'hits': 0, 'misses': 0, 'stores': 0, 'expired': 0,
+                          'evicted': 0, 'invalidated': 0}
+        self._per_endpoint = {}
+
+    def _count(self, endpoint, outcome):
+        self._counters[outcome] += 1
+        counts = self._per_endpoint.setdefault(endpoint, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+
+    def get(self, key):
+        """Cached value for ``key`` or None; keys start with (endpoint, machine_id, range)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry['expires_at']:
+                self._remove(key)
+                self._counters['expired'] += 1
+                entry = None
+            if entry is None:
+                self._count(key[0], 'misses')
+                return None
+            self._entries.move_to_end(key)
+            self._count(key[0], 'hits')
+            return entry['value']
+
+    def put(self, key, value):
+        policy = self.ranges[key[2]]
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'value': value, 'stored_at': now,
+                                  'expires_at': now + policy['ttl']}
+            self._by_machine.setdefault(key[1], set()).add(key)
+            self._counters['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters['evicted'] += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._by_machine.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_machine[key[1]]
+
+    def invalidate_machines(self, machine_ids):
+        """Drop entries of ``machine_ids`` (and fleet entries) past their min_age"""
+        now = time.monotonic()
+        dropped = 0
+        with self._lock:
+            for machine_id in set(machine_ids) | {None}:
+                for key in list(self._by_machine.get(machine_id, ())):
+                    if now - self._entries[key]['stored_at'] >= self.ranges[key[2]]['min_age']:
+                        self._remove(key)
+                        dropped += 1
+            self._counters['invalidated'] += dropped
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_machine.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_ratio': self._counters['hits'] / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'endpoints': {name: dict(counts) for name, counts in self._per_endpoint.items()}
+            }
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+from psycopg2.extras import execute_values
+
+# ============================================================
+#  LATE ROWS FOR THE OEE ROLLUPS
+# ============================================================
+# Rollup tables are refreshed forward from a watermark, so rows arriving
+# for a minute that may already be aggregated (writer back-pressure,
+# backfill, replay) mark that minute here in their own transaction and the
+# next refresh_rollups() re-aggregates it, then the hour and day above it.
+# Kept apart from rollups.py so db.py can use it on the ingest path.
+DIRTY_TABLE = "machine_data_rollup_dirty"
+
+# Samples newer than this are left to the raw tail so in-flight writes land
+# before their bucket is closed; older ones are treated as late.
+SETTLE_SECONDS = 10
+
+def create_dirty_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} (
+            resolution TEXT NOT NULL,
+            bucket TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (resolution, bucket)
+        );
+    """)
+
+def dirty_table_exists(cur):
+    with cur.connection.cursor() as plain:
+        plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (DIRTY_TABLE,))
+        return plain.fetchone()[0]
+
+def mark_late_rows(cur, times):
+    """Mark the minutes of ``times`` (aware datetimes) older than the settle
+    window; live rows mark nothing. Runs in the caller's transaction."""
+    settled = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+    minutes = {t.astimezone(timezone.utc).replace(second=0, microsecond=0) for t in times if t < settled}
+    if minutes:
+        execute_values(cur, f"""
+            INSERT INTO {DIRTY_TABLE} (resolution, bucket) VALUES %s
+            ON CONFLICT DO NOTHING;
+        """, [('1m', minute) for minute in sorted(minutes)])
+    return len(minutes)
@@ -0,0 +1,515 @@
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from psycopg2 import sql
+from db import get_connection, release_connection, has_timescale
+from archive import machine_data_source
+from rollup_dirty import DIRTY_TABLE, SETTLE_SECONDS, create_dirty_table, dirty_table_exists
+
+# ============================================================
+#  OEE ROLLUPS
+# ============================================================
+# Per-machine rollups of the counters behind the OEE formulas, finest first.
+# Buckets are aligned to UTC, like Timescale's time_bucket().
+RESOLUTIONS = [
+    ('1m', 'minute', timedelta(minutes=1)),
+    ('1h', 'hour', timedelta(hours=1)),
+    ('1d', 'day', timedelta(days=1)),
+]
+_WIDTHS = {name: width for name, _, width in RESOLUTIONS}
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Largest window aggregated per statement during a plain-Postgres refresh
+REFRESH_STEP = timedelta(hours=6)
+
+STATE_TABLE = "machine_data_rollup_state"
+
+def rollup_table(resolution):
+    return f"machine_data_rollup_{resolution}"
+
+_RAW_COUNTERS = """
+    COUNT(*) AS total_records,
+    SUM(CASE WHEN state = 'Running' THEN 1 ELSE 0 END) AS running_count,
+    SUM(cutting_speed) AS speed_sum,
+    COUNT(cutting_speed) AS speed_count,
+    SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END) AS error_count
+"""
+
+# machine_data columns read by _RAW_COUNTERS
+RAW_COUNTER_COLUMNS = ['state', 'cutting_speed', 'error_code']
+
+_ROLLUP_COUNTERS = """
+    SUM(total_records) AS total_records,
+    SUM(running_count) AS running_count,
+    SUM(speed_sum) AS speed_sum,
+    SUM(speed_count) AS speed_count,
+    SUM(error_count) AS error_count
+"""
+
+def _as_utc(dt):
+    """Aware UTC datetime; naive values are local time, as from datetime.now()"""
+    return dt.astimezone(timezone.utc)
+
+def _floor(dt, resolution):
+    width = _WIDTHS[resolution]
+    return _EPOCH + ((_as_utc(dt) - _EPOCH) // width) * width
+
+def _ceil(dt, resolution):
+    floored = _floor(dt, resolution)
+    return floored if floored == _as_utc(dt) else floored + _WIDTHS[resolution]
+
+# ============================================================
+#  SCHEMA
+# ============================================================
+def create_rollup_tables():
+    """Create rollups: continuous aggregates on Timescale, tables otherwise"""
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        timescale = has_timescale(cur)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                resolution TEXT PRIMARY KEY,
+                watermark TIMESTAMPTZ,
+                mode TEXT NOT NULL
+            );
+        """)
+        for name, unit, width in RESOLUTIONS:
+            table = rollup_table(name)
+            if timescale:
+                conn.commit()
+                conn.autocommit = True
+                cur.execute(f"""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS {table}
+                    WITH (timescaledb.continuous, timescaledb.materialized_only = true) AS
+                    SELECT machine_id,
+                           time_bucket(INTERVAL '1 {unit}', time) AS bucket,
+                           {_RAW_COUNTERS}
+                    FROM machine_data
+                    GROUP BY machine_id, bucket
+                    WITH NO DATA;
+                """)
+                conn.autocommit = False
+            else:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        machine_id TEXT NOT NULL,
+                        bucket TIMESTAMPTZ NOT NULL,
+                        total_records BIGINT NOT NULL,
+                        running_count BIGINT NOT NULL,
+                        speed_sum DOUBLE PRECISION,
+                        speed_count BIGINT NOT NULL,
+                        error_count BIGINT NOT NULL,
+                        PRIMARY KEY (machine_id, bucket)
+                    );
+                """)
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket);")
+            cur.execute(f"""
+                INSERT INTO {STATE_TABLE} (resolution, watermark, mode)
+                VALUES (%s, NULL, %s)
+                ON CONFLICT (resolution) DO UPDATE SET mode = EXCLUDED.mode;
+            """, (name, 'timescale' if timescale else 'table'))
+        if not timescale:
+            # Late rows are re-aggregated from here; Timescale tracks them itself
+            create_dirty_table(cur)
+        conn.commit()
+        print(f"✅ OEE rollups ready ({'continuous aggregates' if timescale else 'rollup tables'})")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error creating rollups: {e}")
+        raise
+    finally:
+        if conn.autocommit:
+            conn.autocommit = False
+        cur.close()
+        release_connection(conn)
+
+def get_watermarks(cur):
+    """{resolution: watermark} for rollups that have been refreshed at least once"""
+    # Plain cursor on the same connection: callers may pass a RealDictCursor
+    with cur.connection.cursor() as plain:
+        plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (STATE_TABLE,))
+        if not plain.fetchone()[0]:
+            return {}
+        plain.execute(f"SELECT resolution, watermark FROM {STATE_TABLE};")
+        return {row[0]: row[1] for row in plain.fetchall() if row[1] is not None}
+
+# ============================================================
+#  REFRESH
+# ============================================================
+def _set_watermark(cur, resolution, watermark):
+    cur.execute(f"UPDATE {STATE_TABLE} SET watermark = %s WHERE resolution = %s;",
+                (watermark, resolution))
+
+def _aggregate(cur, resolution, source, start, end):
+    """Upsert the buckets of [start, end) from the next finer source.
+
+    Both bounds must be bucket-aligned, otherwise partial sums are stored.
+    """
+    _, unit, _ = next(r for r in RESOLUTIONS if r[0] == resolution)
+    if source == 'machine_data':
+        time_column, counters = 'time', _RAW_COUNTERS
+        # Late rows may land in archived days, whose other rows are cold
+        source = machine_data_source(cur, start, RAW_COUNTER_COLUMNS, end)
+    else:
+        time_column, counters = 'bucket', _ROLLUP_COUNTERS
+    cur.execute(f"""
+        INSERT INTO {rollup_table(resolution)} AS r
+            (machine_id, bucket, total_records, running_count, speed_sum, speed_count, error_count)
+        SELECT machine_id,
+               date_trunc('{unit}', {time_column} AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+               {counters}
+        FROM {source}
+        WHERE {time_column} >= %s AND {time_column} < %s
+        GROUP BY 1, 2
+        ON CONFLICT (machine_id, bucket) DO UPDATE SET
+            total_records = EXCLUDED.total_records,
+            running_count = EXCLUDED.running_count,
+            speed_sum = EXCLUDED.speed_sum,
+            speed_count = EXCLUDED.speed_count,
+            error_count = EXCLUDED.error_count;
+    """, (start, end))
+
+def _refresh_table(conn, cur, resolution, source, start, target):
+    """Upsert closed buckets in [start, target) from the next finer source"""
+    width = _WIDTHS[resolution]
+    # Whole buckets per statement, otherwise the upsert would store partial sums
+    step = max(REFRESH_STEP // width, 1) * width
+
+    window_start = start
+    while window_start < target:
+        window_end = min(window_start + step, target)
+        _aggregate(cur, resolution, source, window_start, window_end)
+        _set_watermark(cur, resolution, window_end)
+        conn.commit()
+        window_start = window_end
+
+def _runs(buckets, width):
+    """Contiguous [start, end) ranges covering sorted bucket starts"""
+    runs = []
+    for bucket in buckets:
+        if runs and runs[-1][1] == bucket:
+            runs[-1][1] = bucket + width
+        else:
+            runs.append([bucket, bucket + width])
+    return runs
+
+def _refresh_dirty(conn, cur, resolution, source, watermark, parent):
+    """Re-aggregate buckets marked dirty below ``watermark``.
+
+    Each batch of marks is taken, re-aggregated and handed on to the
+    ``parent`` resolution in one transaction, so a mark added meanwhile by
+    a late row either waits for it or survives to the next refresh. Marks
+    at or past the watermark (or all, without one) are only dropped: the
+    forward refresh covers them. Returns the number of buckets re-aggregated.
+    """
+    width = _WIDTHS[resolution]
+    refreshed = 0
+    while True:
+        cur.execute(f"""
+            DELETE FROM {DIRTY_TABLE}
+            WHERE resolution = %s AND bucket IN (
+                SELECT bucket FROM {DIRTY_TABLE}
+                WHERE resolution = %s
+                ORDER BY bucket
+                LIMIT %s
+            )
+            RETURNING bucket;
+        """, (resolution, resolution, max(REFRESH_STEP // width, 1)))
+        buckets = sorted(row[0] for row in cur.fetchall())
+        if not buckets:
+            break
+        buckets = [b for b in buckets if watermark is not None and b < watermark]
+        for start, end in _runs(buckets, width):
+            _aggregate(cur, resolution, source, start, end)
+        if parent is not None and buckets:
+            cur.execute(f"""
+                INSERT INTO {DIRTY_TABLE} (resolution, bucket)
+                SELECT DISTINCT %s, b FROM unnest(%s::timestamptz[]) AS b
+                ON CONFLICT DO NOTHING;
+            """, (parent, sorted({_floor(b, parent) for b in buckets})))
+        conn.commit()
+        refreshed += len(buckets)
+    return refreshed
+
+def _earliest(cur, source, time_column):
+    cur.execute(f"SELECT MIN({time_column}) FROM {source};")
+    return cur.fetchone()[0]
+
+def refresh_rollups(rebuild=False):
+    """Bring every rollup up to the last closed bucket.
+
+    Plain Postgres: 1m buckets are aggregated from machine_data past the
+    stored watermark, 1h from 1m and 1d from 1h, after re-aggregating the
+    buckets late rows marked dirty (see rollup_dirty). Timescale: the
+    continuous aggregates are refreshed up to the same targets with an open
+    start, so ranges Timescale invalidated for late rows are redone too.
+    ``rebuild`` restarts from the oldest row, e.g. after a load that
+    bypassed the ingest path (update_derived=False).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(f"SELECT resolution, watermark, mode FROM {STATE_TABLE};")
+        state = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+        if not state:
+            raise RuntimeError("Rollups are not set up; run create_rollup_tables() first")
+        if any(mode == 'table' for _, mode in state.values()):
+            create_dirty_table(cur)  # rollups set up before late-row tracking
+
+        now = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+        source, source_column = 'machine_data', 'time'
+        source_limit = now
+        started = time.perf_counter()
+
+        late = 0
+        for index, (name, _, _) in enumerate(RESOLUTIONS):
+            watermark, mode = state[name]
+            if rebuild:
+                watermark = None
+            target = _floor(source_limit, name)
+
+            if mode == 'timescale':
+                conn.commit()
+                conn.autocommit = True
+                cur.execute("CALL refresh_continuous_aggregate(%s, NULL, %s);",
+                            (rollup_table(name), target))
+                conn.autocommit = False
+                _set_watermark(cur, name, target)
+                conn.commit()
+            else:
+                parent = RESOLUTIONS[index + 1][0] if index + 1 < len(RESOLUTIONS) else None
+                late += _refresh_dirty(conn, cur, name, source, watermark, parent)
+                start = watermark or _earliest(cur, source, source_column)
+                if start is not None:
+                    _refresh_table(conn, cur, name, source, _floor(start, name), target)
+
+            cur.execute(f"SELECT watermark FROM {STATE_TABLE} WHERE resolution = %s;", (name,))
+            source_limit = cur.fetchone()[0] or source_limit
+            source, source_column = rollup_table(name), 'bucket'
+
+        print(f"🔄 Rollups refreshed in {time.perf_counter() - started:.2f}s"
+              + (f" ({late:,} late buckets redone)" if late else ""))
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error refreshing rollups: {e}")
+        raise
+    finally:
+        if conn.autocommit:
+            conn.autocommit = False
+        cur.close()
+        release_connection(conn)
+
+# Counters of run_refresh_loop(), see refresh_stats()
+_loop_stats = {'refreshes': 0, 'failures': 0, 'consecutive_failures': 0,
+               'last_success': None, 'last_error': None}
+
+def refresh_stats():
+    return dict(_loop_stats)
+
+def rollup_lag(cur):
+    """Seconds between now and the 1m watermark, None before the first refresh"""
+    watermark = get_watermarks(cur).get(RESOLUTIONS[0][0])
+    if watermark is None:
+        return None
+    return (datetime.now(timezone.utc) - watermark).total_seconds()
+
+def run_refresh_loop(interval=60, max_backoff=None):
+    """Refresh rollups every ``interval`` seconds until Ctrl+C.
+
+    After a failure the wait doubles per consecutive failure, up to
+    ``max_backoff`` seconds (default 10 intervals), so a database outage is
+    not hammered; every failure is reported with its count.
+    """
+    max_backoff = max_backoff or interval * 10
+    print(f"Refreshing OEE rollups every {interval} seconds (Ctrl+C to stop)")
+    try:
+        while True:
+            delay = interval
+            try:
+                refresh_rollups()
+                _loop_stats['refreshes'] += 1
+                _loop_stats['consecutive_failures'] = 0
+                _loop_stats['last_success'] = datetime.now(timezone.utc)
+            except Exception as e:
+                _loop_stats['failures'] += 1
+                _loop_stats['consecutive_failures'] += 1
+                _loop_stats['last_error'] = str(e)
+                failures = _loop_stats['consecutive_failures']
+                delay = min(interval * 2 ** failures, max_backoff)
+                print(f"⚠️ Rollup refresh failed {failures} time(s) in a row "
+                      f"({_loop_stats['failures']} total); retrying in {delay:.0f}s")
+            time.sleep(delay)
+    except KeyboardInterrupt:
+        print("\nRollup refresh stopped.")
+        print(f"Refreshes: {_loop_stats['refreshes']}, failures: {_loop_stats['failures']}")
+
+# ============================================================
+#  RETENTION
+# ============================================================
+def prune_rollups(cur, cutoff):
+    """Remove buckets lying entirely before ``cutoff``, in the caller's transaction.
+
+    Called by db.cleanup_old_data() so rollups keep the raw data's
+    retention; a bucket straddling the cutoff stays until it ages out.
+    Returns the number of buckets removed (chunks dropped on Timescale).
+    """
+    with cur.connection.cursor() as plain:
+        plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (STATE_TABLE,))
+        if not plain.fetchone()[0]:
+            return 0
+        plain.execute(f"SELECT resolution, mode FROM {STATE_TABLE};")
+        modes = dict(plain.fetchall())
+        dirty = dirty_table_exists(plain)
+        removed = 0
+        for name, _, _ in RESOLUTIONS:
+            if name not in modes:
+                continue
+            boundary = _floor(cutoff, name)
+            if modes[name] == 'timescale':
+                plain.execute("SELECT COUNT(*) FROM drop_chunks(%s, older_than => %s);",
+                              (rollup_table(name), boundary))
+                removed += plain.fetchone()[0]
+            else:
+                plain.execute(f"DELETE FROM {rollup_table(name)} WHERE bucket < %s;", (boundary,))
+                removed += plain.rowcount
+                if dirty:
+                    plain.execute(f"""
+                        DELETE FROM {DIRTY_TABLE} WHERE resolution = %s AND bucket < %s;
+                    """, (name, boundary))
+        return removed
+
+# ============================================================
+#  QUERY PLANNING
+# ============================================================
+def _cover(start, end, levels, watermarks):
+    """Cover [start, end) with the coarsest aligned rollup buckets available.
+
+    ``levels`` is ordered coarse to fine; whatever no rollup can cover is
+    read from raw machine_data.
+    """
+    if start >= end:
+        return []
+    if not levels:
+        return [('raw', start, end)]
+    level, finer = levels[0], levels[1:]
+    low = _ceil(start, level)
+    high = min(_floor(end, level), watermarks[level])
+    if low >= high:
+        return _cover(start, end, finer, watermarks)
+    return (_cover(start, low, finer, watermarks)
+            + [(level, low, high)]
+            + _cover(high, end, finer, watermarks))
+
+def plan_segments(start_time, watermarks):
+    """Segments (source, start, end) covering [start_time, now]; end None = open"""
+    levels = [name for name, _, _ in reversed(RESOLUTIONS) if name in watermarks]
+    finest = RESOLUTIONS[0][0]
+    if finest not in watermarks or _as_utc(start_time) >= watermarks[finest]:
+        return [('raw', start_time, None)]
+    tail = watermarks[finest]
+    return _cover(_as_utc(start_time), tail, levels, watermarks) + [('raw', tail, None)]
+
+def oee_stats_query(cur, start_time, machine_id=None, machine_ids=None):
+    """SQL and params yielding OEE counters since ``start_time``.
+
+    Produces total_records, running_count, avg_speed and error_count with the
+    same values as aggregating raw machine_data, but reads closed buckets
+    from the rollups and only the unrolled head/tail from the raw table
+    (with archived days, see archive.machine_data_source).
+    Grouped by machine_id unless ``machine_id`` is given, in which case it
+    returns exactly one row like a plain aggregate. ``machine_ids`` limits
+    the grouped form to those machines.
+    """
+    parts = []
+    params = []
+    if machine_id is not None:
+        machine_filter, machine_param = sql.SQL(" AND machine_id = %s"), machine_id
+    elif machine_ids is not None:
+        machine_filter, machine_param = sql.SQL(" AND machine_id = ANY(%s)"), list(machine_ids)
+    else:
+        machine_filter, machine_param = sql.SQL(""), None
+
+    segments = plan_segments(start_time, get_watermarks(cur))
+    for source, low, high in segments:
+        if source == 'raw':
+            # Scoped to the slice, so edges outside archived days skip the cold tier
+            table = sql.SQL(machine_data_source(cur, low, RAW_COUNTER_COLUMNS, high))
+            column, counters = sql.SQL('time'), sql.SQL(_RAW_COUNTERS)
+        else:
+            table, column, counters = sql.Identifier(rollup_table(source)), sql.SQL('bucket'), sql.SQL(_ROLLUP_COUNTERS)
+        upper = sql.SQL(" AND {} < %s").format(column) if high is not None else sql.SQL("")
+        parts.append(sql.SQL("SELECT machine_id, {counters} FROM {table} WHERE {column} >= %s{upper}{machine} GROUP BY machine_id").format(
+            counters=counters, table=table, column=column, upper=upper, machine=machine_filter
+        ))
+        params.append(low)
+        if high is not None:
+            params.append(high)
+        if machine_param is not None:
+            params.append(machine_param)
+
+    group = sql.SQL("machine_id, ") if machine_id is None else sql.SQL("")
+    query = sql.SQL("""
+        SELECT {group}
+               COALESCE(SUM(total_records), 0) AS total_records,
+               COALESCE(SUM(running_count), 0) AS running_count,
+               SUM(speed_sum) / NULLIF(SUM(speed_count), 0)::double precision AS avg_speed,
+               COALESCE(SUM(error_count), 0) AS error_count
+        FROM ({parts}) AS parts
+        {group_by}
+    """).format(
+        group=group,
+        parts=sql.SQL(" UNION ALL ").join(parts),
+        group_by=sql.SQL("GROUP BY machine_id") if machine_id is None else sql.SQL("")
+    )
+    return query, params
+
+def verify_rollups(time_range_days=(1 / 24, 1, 7, 30, 365)):
+    """Compare rollup-based OEE counters with a raw scan (archived days included)
+    for several windows"""
+    conn = get_connection()
+    cur = conn.cursor()
+    ok = True
+    try:
+        for days in time_range_days:
+            start = datetime.now(timezone.utc) - timedelta(days=days)
+            query, params = oee_stats_query(cur, start)
+            cur.execute(sql.SQL("SELECT * FROM ({}) s ORDER BY machine_id").format(query), params)
+            combined = cur.fetchall()
+            cur.execute(f"""
+                SELECT machine_id, COUNT(*), SUM(CASE WHEN state = 'Running' THEN 1 ELSE 0 END),
+                       AVG(cutting_speed), SUM(CASE WHEN error_code IS NOT NULL THEN 1 ELSE 0 END)
+                FROM {machine_data_source(cur, start, RAW_COUNTER_COLUMNS)}
+                WHERE time >= %s GROUP BY machine_id ORDER BY machine_id;
+            """, (start,))
+            raw = cur.fetchall()
+            same = len(raw) == len(combined) and all(
+                r[0] == c[0] and r[1] == c[1] and r[2] == c[2] and r[4] == c[4]
+                and (r[3] is None and c[3] is None or abs(r[3] - c[3]) < 1e-6)
+                for r, c in zip(raw, combined)
+            )
+            ok = ok and same
+            print(f"{'✅' if same else '❌'} {days:g} days: {len(raw)} machines")
+    finally:
+        cur.close()
+        release_connection(conn)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain OEE rollups for machine_data")
+    parser.add_argument("command", choices=["setup", "refresh", "rebuild", "loop", "verify"])
+    parser.add_argument("--interval", type=int, default=60, help="seconds between refreshes (loop)")
+    args = parser.parse_args()
+
+    if args.command == "setup":
+        create_rollup_tables()
+        refresh_rollups()
+    elif args.command == "refresh":
+        refresh_rollups()
+    elif args.command == "rebuild":
+        refresh_rollups(rebuild=True)
+    elif args.command == "loop":
+        run_refresh_loop(args.interval)
+    else:
+        verify_rollups()
@@ -0,0 +1,63 @@
+import threading
+
+# ============================================================
+#  SINGLE-FLIGHT REQUEST COALESCING
+# ============================================================
+class CoalesceTimeout(Exception):
+    """Raised when the in-flight call being waited on takes longer than the timeout"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome.
+
+    The first caller for a key (the leader) runs ``fn``; callers arriving
+    while it is in flight wait up to ``timeout`` seconds and receive the
+    same result, or the same exception if the leader failed. Nothing is
+    kept once the call finishes, so this only merges concurrent work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'errors': 0}
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                self._counters['errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            self._counters['timeouts'] += 1
+            raise CoalesceTimeout(f"No result after {timeout}s from the in-flight request")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'in_flight': len(self._calls)}
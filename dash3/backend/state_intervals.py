@@ -0,0 +1,279 @@
+import argparse
+from psycopg2.extras import execute_values
+
+# ============================================================
+#  MACHINE STATE INTERVALS
+# ============================================================
+# One row per run of consecutive samples with the same state. end_time is
+# the start of the next interval and stays NULL while the interval is open;
+# last_time is the newest sample seen in the interval.
+INTERVALS_TABLE = "machine_state_intervals"
+
+# Priority rules shared with the timeline: the most specific state wins while Running
+PRIMARY_STATE_SQL = """
+    CASE WHEN state = 'Running' THEN
+             CASE WHEN drilling > 0 THEN 'Drilling'
+                  WHEN current > 0 THEN 'Marking'
+                  ELSE 'Running' END
+         ELSE COALESCE(state, 'Unknown') END
+"""
+
+def primary_state(state, drilling, current):
+    """Python twin of PRIMARY_STATE_SQL"""
+    if state == 'Running':
+        if drilling and float(drilling) > 0:
+            return 'Drilling'
+        if current and float(current) > 0:
+            return 'Marking'
+        return 'Running'
+    return state or 'Unknown'
+
+def create_intervals_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INTERVALS_TABLE} (
+            machine_id TEXT NOT NULL,
+            start_time TIMESTAMPTZ NOT NULL,
+            end_time TIMESTAMPTZ,
+            last_time TIMESTAMPTZ NOT NULL,
+            state TEXT,
+            primary_state TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (machine_id, start_time)
+        );
+    """)
+    cur.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_state_intervals_open
+        ON {INTERVALS_TABLE} (machine_id) WHERE end_time IS NULL;
+    """)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_state_intervals_end
+        ON {INTERVALS_TABLE} (machine_id, (COALESCE(end_time, 'infinity'::timestamptz)));
+    """)
+
+def intervals_table_exists(cur):
+    with cur.connection.cursor() as plain:
+        plain.execute("SELECT to_regclass(%s) IS NOT NULL;", (INTERVALS_TABLE,))
+        return plain.fetchone()[0]
+
+# ============================================================
+#  INGEST MAINTENANCE
+# ============================================================
+def record_state_intervals(cur, samples):
+    """Extend or close intervals for newly inserted samples.
+
+    ``samples`` are (machine_id, time, state, drilling, current) tuples.
+    Runs in the caller's transaction under a per-machine advisory lock,
+    so concurrent writers for the same machine are serialized even before
+    it has an open interval to lock.
+    Samples older than a machine's newest interval sample are ignored;
+    rebuild_state_intervals() repairs intervals after out-of-order loads.
+    A sample sharing the open interval's start time but not its state
+    replaces that state, since closing the interval there would leave it
+    zero-length and the new one colliding on (machine_id, start_time).
+    """
+    if not samples:
+        return 0
+
+    by_machine = {}
+    for machine_id, time, state, drilling, current in samples:
+        by_machine.setdefault(machine_id, []).append(
+            (time, state, primary_state(state, drilling, current))
+        )
+
+    with cur.connection.cursor() as plain:
+        # Sorted, so writers sharing machines take the locks in one order
+        plain.execute("""
+            SELECT pg_advisory_xact_lock(hashtext(%s), hashtext(machine_id))
+            FROM (SELECT machine_id FROM unnest(%s::text[]) AS m(machine_id) ORDER BY 1) AS sorted;
+        """, (INTERVALS_TABLE, sorted(by_machine)))
+        plain.execute(f"""
+            SELECT machine_id, start_time, last_time, state, primary_state, samples
+            FROM {INTERVALS_TABLE}
+            WHERE end_time IS NULL AND machine_id = ANY(%s)
+            ORDER BY machine_id
+            FOR UPDATE;
+        """, (list(by_machine),))
+        open_intervals = {row[0]: list(row[1:]) for row in plain.fetchall()}
+
+        updates = []
+        inserts = []
+        for machine_id, machine_samples in by_machine.items():
+            machine_samples.sort(key=lambda s: s[0])
+            existing = None
+            if machine_id in open_intervals:
+                start_time, last_time, state, primary, count = open_intervals[machine_id]
+                existing = {'start_time': start_time, 'end_time': None, 'last_time': last_time,
+                            'state': state, 'primary_state': primary, 'samples': count}
+            current = existing
+
+            for time, state, primary in machine_samples:
+                if current and time < current['last_time']:
+                    continue
+                if current and (state, primary) == (current['state'], current['primary_state']):
+                    current['last_time'] = time
+                    current['samples'] += 1
+                    continue
+                if current and time == current['start_time']:
+                    current['state'], current['primary_state'] = state, primary
+                    current['last_time'] = time
+                    current['samples'] += 1
+                    continue
+                if current:
+                    current['end_time'] = time
+                current = {'start_time': time, 'end_time': None, 'last_time': time,
+                           'state': state, 'primary_state': primary, 'samples': 1}
+                inserts.append((machine_id, current))
+
+            if existing:
+                updates.append((machine_id, existing['start_time'], existing['end_time'],
+                                existing['last_time'], existing['state'],
+                                existing['primary_state'], existing['samples']))
+
+        inserts = [
+            (machine_id, i['start_time'], i['end_time'], i['last_time'],
+             i['state'], i['primary_state'], i['samples'])
+            for machine_id, i in inserts
+        ]
+
+        if updates:
+            execute_values(plain, f"""
+                UPDATE {INTERVALS_TABLE} AS i
+                SET end_time = u.end_time, last_time = u.last_time, state = u.state,
+                    primary_state = u.primary_state, samples = u.samples
+                FROM (VALUES %s) AS u (machine_id, start_time, end_time, last_time, state, primary_state, samples)
+                WHERE i.machine_id = u.machine_id AND i.start_time = u.start_time;
+            """, updates, template="(%s, %s::timestamptz, %s::timestamptz, %s::timestamptz, %s, %s, %s::integer)",
+                page_size=1000)
+        if inserts:
+            execute_values(plain, f"""
+                INSERT INTO {INTERVALS_TABLE}
+                    (machine_id, start_time, end_time, last_time, state, primary_state, samples)
+                VALUES %s
+                ON CONFLICT (machine_id, start_time) DO NOTHING;
+            """, inserts, page_size=1000)
+    return len(inserts)
+
+# ============================================================
+#  REBUILD
+# ============================================================
+def rebuild_state_intervals(cur, machine_id=None):
+    """Recompute intervals from machine_data (all machines or one)"""
+    cur.execute(f"LOCK TABLE {INTERVALS_TABLE} IN EXCLUSIVE MODE;")
+    machine_filter = "WHERE machine_id = %(machine_id)s" if machine_id is not None else ""
+    cur.execute(f"DELETE FROM {INTERVALS_TABLE} {machine_filter};", {'machine_id': machine_id})
+    cur.execute(f"""
+        WITH samples AS (
+            SELECT machine_id, time, state, {PRIMARY_STATE_SQL} AS primary_state
+            FROM machine_data
+            {machine_filter}
+        ),
+        marked AS (
+            SELECT *,
+                CASE WHEN (state, primary_state) IS DISTINCT FROM
+                          (LAG(state) OVER w, LAG(primary_state) OVER w)
+                     THEN 1 ELSE 0 END AS is_start
+            FROM samples
+            WINDOW w AS (PARTITION BY machine_id ORDER BY time)
+        ),
+        islands AS (
+            SELECT *,
+                SUM(is_start) OVER (PARTITION BY machine_id ORDER BY time ROWS UNBOUNDED PRECEDING) AS island
+            FROM marked
+        ),
+        grouped AS (
+            SELECT machine_id, MIN(state) AS state, MIN(primary_state) AS primary_state,
+                   MIN(time) AS start_time, MAX(time) AS last_time, COUNT(*) AS samples
+            FROM islands
+            GROUP BY machine_id, island
+        )
+        INSERT INTO {INTERVALS_TABLE}
+            (machine_id, start_time, end_time, last_time, state, primary_state, samples)
+        SELECT machine_id, start_time,
+               LEAD(start_time) OVER (PARTITION BY machine_id ORDER BY start_time),
+               last_time, state, primary_state, samples
+        FROM grouped;
+    """, {'machine_id': machine_id})
+    return cur.rowcount
+
+def prune_state_intervals(cur, cutoff):
+    """Delete closed intervals ending before ``cutoff`` (see db.cleanup_old_data)"""
+    if not intervals_table_exists(cur):
+        return 0
+    with cur.connection.cursor() as plain:
+        plain.execute(f"DELETE FROM {INTERVALS_TABLE} WHERE end_time < %s;", (cutoff,))
+        return plain.rowcount
+
+# ============================================================
+#  QUERIES
+# ============================================================
+# Intervals overlapping [start, now), clipped at the window start. The open
+# interval lasts until its last sample (status summary) or 2s past it
+# (timeline), mirroring how the raw queries treat the final sample.
+STATUS_SUMMARY_SQL = f"""
+SELECT
+    state,
+    SUM(samples) AS count,
+    COALESCE(SUM(EXTRACT(EPOCH FROM (
+        COALESCE(end_time, last_time) - GREATEST(start_time, %(start)s)
+    ))), 0) AS total_duration
+FROM {INTERVALS_TABLE}
+WHERE machine_id = %(machine_id)s
+AND COALESCE(end_time, 'infinity'::timestamptz) > %(start)s
+AND state IS NOT NULL
+GROUP BY state;
+"""
+
+# Same for many machines at once; %(machine_ids)s NULL means every machine
+FLEET_STATUS_SUMMARY_SQL = f"""
+SELECT
+    machine_id,
+    state,
+    COALESCE(SUM(EXTRACT(EPOCH FROM (
+        COALESCE(end_time, last_time) - GREATEST(start_time, %(start)s)
+    ))), 0) AS total_duration
+FROM {INTERVALS_TABLE}
+WHERE (%(machine_ids)s::text[] IS NULL OR machine_id = ANY(%(machine_ids)s::text[]))
+AND COALESCE(end_time, 'infinity'::timestamptz) > %(start)s
+AND state IS NOT NULL
+GROUP BY machine_id, state;
+"""
+
+TIMELINE_SQL = f"""
+SELECT
+    primary_state AS status,
+    GREATEST(start_time, %(start)s::timestamptz) AS start_time,
+    EXTRACT(EPOCH FROM (
+        COALESCE(end_time, last_time + INTERVAL '2 seconds') - GREATEST(start_time, %(start)s::timestamptz)
+    )) AS duration_seconds,
+    samples
+FROM {INTERVALS_TABLE}
+WHERE machine_id = %(machine_id)s
+AND COALESCE(end_time, 'infinity'::timestamptz) > %(start)s
+ORDER BY start_time ASC;
+"""
+
+
+if __name__ == "__main__":
+    from db import get_connection, release_connection
+
+    parser = argparse.ArgumentParser(description="Maintain machine_state_intervals")
+    parser.add_argument("command", choices=["setup", "rebuild"])
+    parser.add_argument("--machine", help="rebuild a single machine")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        create_intervals_table(cur)
+        if args.command == "rebuild":
+            count = rebuild_state_intervals(cur, args.machine)
+            print(f"🔁 Rebuilt {count} state intervals")
+        conn.commit()
+        print("✅ machine_state_intervals ready")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Error maintaining state intervals: {e}")
+        raise
+    finally:
+        cur.close()
+        release_connection(conn)
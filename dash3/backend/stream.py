@@ -0,0 +1,167 @@
+import queue
+import threading
+
+# ============================================================
+#  LIVE EVENT FAN-OUT
+# ============================================================
+class Subscription:
+    """One client's bounded event queue.
+
+    ``machine_id`` None receives the whole fleet. When the queue is full the
+    subscription is dropped instead of buffering without limit; the client
+    sees a final ``dropped`` event and is expected to reconnect.
+    """
+
+    def __init__(self, machine_id=None, max_queue=256):
+        self.machine_id = machine_id
+        self.events = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def wants(self, machine_id):
+        return self.machine_id is None or self.machine_id == machine_id
+
+    def get(self, timeout):
+        """Next encoded event, or None after ``timeout`` seconds"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broadcaster:
+    """Fans events from one shared upstream out to many subscriptions.
+
+    Each event is encoded once by ``encode(event_type, payload)`` and the
+    resulting string is put on every matching subscription's queue, so the
+    cost per client is one queue put. ``publish`` never blocks: a client
+    whose queue is full is dropped and counted as a slow consumer.
+    """
+
+    def __init__(self, encode, max_queue=256):
+        self.encode = encode
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._counters = {'published': 0, 'delivered': 0, 'slow_consumers_dropped': 0,
+                          'subscribed': 0, 'unsubscribed': 0}
+
+    def subscribe(self, machine_id=None):
+        subscription = Subscription(machine_id, self.max_queue)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            self._counters['subscribed'] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.discard(subscription)
+                self._counters['unsubscribed'] += 1
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def publish(self, event_type, payload, machine_id=None):
+        """Send an event to subscribers of ``machine_id`` (and fleet subscribers)"""
+        with self._lock:
+            targets = [s for s in self._subscriptions if machine_id is None or s.wants(machine_id)]
+        if not targets:
+            return 0
+        message = self.encode(event_type, payload)
+        delivered = 0
+        for subscription in targets:
+            try:
+                subscription.events.put_nowait(message)
+                delivered += 1
+            except queue.Full:
+                self._drop(subscription)
+        self._counters['published'] += 1
+        self._counters['delivered'] += delivered
+        return delivered
+
+    def _drop(self, subscription):
+        subscription.dropped = True
+        self.unsubscribe(subscription)
+        self._counters['slow_consumers_dropped'] += 1
+        # Make room for the final notice so the client knows why it ends
+        try:
+            subscription.events.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscription.events.put_nowait(self.encode('dropped', {'reason': 'slow consumer'}))
+        except queue.Full:
+            pass
+
+    def stats(self):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        return {
+            **self._counters,
+            'subscribers': len(subscriptions),
+            'fleet_subscribers': sum(1 for s in subscriptions if s.machine_id is None),
+            'queued_events': sum(s.events.qsize() for s in subscriptions),
+            'max_queue': self.max_queue
+        }
+
+
+class LatestPoller:
+    """Shared upstream: turns changes in the latest-row snapshot into events.
+
+    A single background thread reads ``latest_cache`` every ``interval``
+    seconds, or as soon as wake() is called (on change notifications), while
+    anyone is subscribed. It publishes a ``sample`` event for every machine
+    whose latest time advanced, plus a ``state`` event when its state
+    changed. However many clients are connected, the database only sees
+    the cache's snapshot reloads.
+    """
+
+    def __init__(self, latest_cache, broadcaster, interval=1.0):
+        self.latest_cache = latest_cache
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self._seen = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.errors = 0
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="latest-poller", daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Poll now instead of waiting for the next interval"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            if self.broadcaster.has_subscribers():
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"⚠️ Live stream poll failed: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def poll(self):
+        rows = self.latest_cache.all() or []
+        for row in rows:
+            machine_id = row['machine_id']
+            previous = self._seen.get(machine_id)
+            if previous is not None and row['time'] <= previous['time']:
+                continue
+            self._seen[machine_id] = row
+            if previous is None:
+                continue
+            self.broadcaster.publish('sample', row, machine_id)
+            if row['state'] != previous['state']:
+                self.broadcaster.publish('state', {
+                    'machine_id': machine_id,
+                    'time': row['time'],
+                    'state': row['state'],
+                    'previous_state': previous['state']
+                }, machine_id)
@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+import psycopg2
+from db import bulk_insert_machine_data
+
+# ============================================================
+#  BUFFERED WRITE-BEHIND WRITER
+# ============================================================
+class BufferedWriter:
+    """Background writer that group-commits machine_data records.
+
+    Records are accumulated in a bounded queue and flushed through
+    bulk_insert_machine_data() whenever ``batch_size`` records are pending or
+    ``flush_interval`` seconds have passed since the batch was started. When
+    the database falls behind the queue fills up and write() blocks, which
+    pushes back on the producer instead of growing memory without bound.
+
+    Records without a ``time`` are stamped when queued, so a late flush does
+    not shift them. A flush failing on a connection error is retried up to
+    ``max_retries`` times with doubling delays; a batch that still fails (or
+    fails on bad data) is passed to ``on_drop(records, error)``, which by
+    default prints the machines and time range lost.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_queue=20000,
+                 method="copy", copy_format="text", max_retries=3, retry_delay=0.5,
+                 on_drop=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.copy_format = copy_format
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.on_drop = on_drop or _report_dropped
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="machine-data-writer", daemon=True
+        )
+        self._lock = threading.Lock()
+        self._stats = {
+            'queued': 0,
+            'written': 0,
+            'failed': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'retries': 0,
+            'last_flush_rows': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0,
+            'blocked_seconds': 0.0
+        }
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self, record, timeout=None):
+        """Queue one record, blocking while the queue is full (back-pressure)"""
+        if self._stop.is_set():
+            raise RuntimeError("BufferedWriter is closed")
+        if isinstance(record, dict) and 'time' not in record:
+            record['time'] = datetime.now(timezone.utc)
+        started = time.monotonic()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._queue.put(record, timeout=timeout)
+            with self._lock:
+                self._stats['blocked_seconds'] += time.monotonic() - started
+        with self._lock:
+            self._stats['queued'] += 1
+
+    def write_many(self, records, timeout=None):
+        for record in records:
+            self.write(record, timeout=timeout)
+
+    def close(self, timeout=None):
+        """Stop accepting records and flush everything still queued"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        flushes = snapshot['flushes']
+        snapshot['avg_flush_seconds'] = (
+            snapshot['total_flush_seconds'] / flushes if flushes else 0.0
+        )
+        snapshot['pending'] = self.pending()
+        return snapshot
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set() and self._queue.empty():
+                return
+
+    def _collect_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # Poll in short slices so close() is noticed promptly
+                batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+        return batch
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                bulk_insert_machine_data(
+                    batch, method=self.method, copy_format=self.copy_format,
+                    batch_size=len(batch)
+                )
+                break
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Connection trouble: the batch is one transaction, so retrying is safe
+                if attempt >= self.max_retries:
+                    self._drop(batch, e)
+                    return
+                delay = self.retry_delay * 2 ** attempt
+                attempt += 1
+                print(f"⚠️ Writer flush of {len(batch)} records failed ({e}); "
+                      f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(delay)
+            except Exception as e:
+                self._drop(batch, e)
+                return
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['written'] += len(batch)
+            stats['last_flush_rows'] = len(batch)
+            stats['last_flush_seconds'] = elapsed
+            stats['max_flush_seconds'] = max(stats['max_flush_seconds'], elapsed)
+            stats['total_flush_seconds'] += elapsed
+
+    def _drop(self, batch, error):
+        with self._lock:
+            self._stats['flush_errors'] += 1
+            self._stats['failed'] += len(batch)
+        try:
+            self.on_drop(batch, error)
+        except Exception as e:
+            print(f"❌ Writer on_drop callback failed: {e}")
+
+
+def _record_field(record, name, index):
+    return record.get(name) if isinstance(record, dict) else record[index]
+
+def _report_dropped(records, error):
+    """Default BufferedWriter.on_drop: one line naming what was lost"""
+    machines = sorted({str(_record_field(r, 'machine_id', 1)) for r in records})
+    times = [_record_field(r, 'time', 0) for r in records]
+    times = [t for t in times if t is not None]
+    span = f" from {min(times)} to {max(times)}" if times else ""
+    shown = ", ".join(machines[:10]) + (f" (+{len(machines) - 10} more)" if len(machines) > 10 else "")
+    print(f"❌ Writer dropped {len(records)} records{span} for {shown}: {error}")
@@ -259,6 +259,18 @@ if (historical.data && historical.data.length > 0) {
     return () => clearInterval(interval);
   }, [machineId]);
 
+  // Live machine card: pushed samples between the 10s refreshes
+  useEffect(() => {
+    if (!machineId || !window.EventSource) return;
+
+    const source = new EventSource(`${API_BASE}/machines/${machineId}/stream`);
+    source.addEventListener('sample', (event) => {
+      if (currentMachineRef.current !== machineId) return;
+      setRealtimeData(JSON.parse(event.data));
+    });
+    return () => source.close();
+  }, [machineId]);
+
   if (!realtimeData)
     return <div style={{ padding: "40px", textAlign: "center" }}>No data available</div>;
 